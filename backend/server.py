@@ -1,5 +1,6 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Query
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request
 from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
 from motor.motor_asyncio import AsyncIOMotorClient
@@ -7,7 +8,7 @@ import os
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field, ConfigDict
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Literal
 from datetime import datetime, timezone, timedelta
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 import httpx
@@ -15,6 +16,23 @@ import asyncio
 import re
 import random
 import io
+import bisect
+import codecs
+import gzip
+import json
+import functools
+import hashlib
+import struct
+import sys
+import mmap
+import uuid
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager, asynccontextmanager
+from collections import deque
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import OperationFailure
 
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
@@ -31,6 +49,41 @@ GITLAB_NAMESPACE = os.environ.get('GITLAB_NAMESPACE', 'ncryptify')
 DEFAULT_BRANCH = os.environ.get('DEFAULT_BRANCH', 'master')
 DAYS_TO_FETCH = int(os.environ.get('DAYS_TO_FETCH', '7'))
 FETCH_INTERVAL = int(os.environ.get('FETCH_INTERVAL_SECONDS', '30'))
+PIPELINE_FETCH_CONCURRENCY = int(os.environ.get('PIPELINE_FETCH_CONCURRENCY', '10'))
+FULL_SYNC_INTERVAL = int(os.environ.get('FULL_SYNC_INTERVAL_SECONDS', '3600'))
+NEGATIVE_CACHE_TTL = int(os.environ.get('NEGATIVE_CACHE_TTL_SECONDS', '21600'))
+JUNIT_REPORT_GLOBS = [
+    pattern.strip().lower()
+    for pattern in os.environ.get(
+        'JUNIT_REPORT_GLOBS',
+        '*junit*.xml,*test-result*.xml,*test_result*.xml,*TEST-*.xml,*report*.xml'
+    ).split(',')
+    if pattern.strip()
+]
+CPU_WORKERS = int(os.environ.get('CPU_WORKERS', str(min(4, os.cpu_count() or 1))))
+LIVE_TAIL_POLL_SECONDS = float(os.environ.get('LIVE_TAIL_POLL_SECONDS', '3'))
+LIVE_TAIL_MAX_POLL_SECONDS = float(os.environ.get('LIVE_TAIL_MAX_POLL_SECONDS', '60'))
+
+# Shared GitLab HTTP client pool
+HTTP2_ENABLED = os.environ.get('HTTP2_ENABLED', 'true').lower() == 'true'
+HTTP_MAX_CONNECTIONS = int(os.environ.get('HTTP_MAX_CONNECTIONS', '50'))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.environ.get('HTTP_MAX_KEEPALIVE_CONNECTIONS', '20'))
+HTTP_KEEPALIVE_EXPIRY = float(os.environ.get('HTTP_KEEPALIVE_EXPIRY_SECONDS', '60'))
+
+# Local disk cache for downloaded artifact archives
+ARTIFACT_CACHE_DIR = Path(os.environ.get('ARTIFACT_CACHE_DIR', str(ROOT_DIR / 'artifact_cache')))
+ARTIFACT_CACHE_MAX_BYTES = int(os.environ.get('ARTIFACT_CACHE_MAX_BYTES', str(5 * 1024 * 1024 * 1024)))
+MAX_CONCURRENT_DOWNLOADS = int(os.environ.get('MAX_CONCURRENT_DOWNLOADS', '4'))
+
+# Per-call timeout profiles for GitLab requests
+TIMEOUT_PROFILES = {
+    "api": httpx.Timeout(30.0),
+    "pipelines": httpx.Timeout(60.0),
+    "trace": httpx.Timeout(60.0, connect=10.0),
+    "artifact": httpx.Timeout(60.0),
+    "artifact_range": httpx.Timeout(30.0),
+    "artifact_download": httpx.Timeout(180.0, connect=60.0, read=180.0),
+}
 
 # Global flag to track if initial sync is complete
 initial_sync_complete = False
@@ -117,10 +170,22 @@ class ProcessedLog(BaseModel):
     model_config = ConfigDict(extra="ignore")
     job_id: int
     pipeline_id: int
-    raw_log: str
+    raw_log: Optional[str] = None  # only in single-job responses; the text lives in log_chunks
     error_lines: List[Dict[str, Any]] = []
+    error_count: int = 0
+    line_count: int = 0
+    size: int = 0
     processed_at: str
 
+class LogRule(BaseModel):
+    name: str
+    pattern: str  # Python regular expression, matched against single lines
+    severity: Literal["error", "warning", "info"] = "error"
+    category: str = "error"
+    ignore_case: bool = True
+    context_before: int = Field(0, ge=0, le=50)
+    context_after: int = Field(0, ge=0, le=50)
+
 class Artifact(BaseModel):
     model_config = ConfigDict(extra="ignore")
     job_id: int
@@ -136,6 +201,9 @@ class PipelineStats(BaseModel):
     running: int
     pending: int
     success_rate: float
+    statuses: Dict[str, int] = {}
+    window: Optional[str] = None
+    projects: Optional[List[Dict[str, Any]]] = None
 
 class PipelineAction(BaseModel):
     action: str  # 'retry' or 'cancel'
@@ -288,585 +356,2985 @@ class GitLabService:
         self.base_url = GITLAB_URL.rstrip('/')
         self.token = GITLAB_TOKEN
         self.headers = {"PRIVATE-TOKEN": self.token}
+        self._client: Optional[httpx.AsyncClient] = None
+        self.pool_stats = {
+            "requests": 0,
+            "connections_opened": 0,
+            "http2_responses": 0,
+            "http1_responses": 0
+        }
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Long-lived pooled client shared by every GitLab call (created lazily)"""
+        if self._client is None or self._client.is_closed:
+            self._client = self._create_client()
+        return self._client
+
+    def _create_client(self) -> httpx.AsyncClient:
+        http2 = HTTP2_ENABLED
+        if http2:
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                logger.warning("HTTP/2 requested but the 'h2' package is not installed, falling back to HTTP/1.1")
+                http2 = False
+        
+        limits = httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+        )
+        logger.info(f"Opening shared GitLab HTTP client (http2={http2}, max_connections={HTTP_MAX_CONNECTIONS}, keepalive={HTTP_MAX_KEEPALIVE_CONNECTIONS})")
+        return httpx.AsyncClient(
+            http2=http2,
+            limits=limits,
+            timeout=TIMEOUT_PROFILES["api"],
+            event_hooks={"request": [self._on_request], "response": [self._on_response]}
+        )
+
+    async def _on_request(self, request: httpx.Request):
+        self.pool_stats["requests"] += 1
+        request.extensions["trace"] = self._trace
+
+    async def _on_response(self, response: httpx.Response):
+        if response.http_version == "HTTP/2":
+            self.pool_stats["http2_responses"] += 1
+        else:
+            self.pool_stats["http1_responses"] += 1
+
+    async def _trace(self, event_name: str, info: dict):
+        # Only fires when the pool has to open a new TCP connection
+        if event_name == "connection.connect_tcp.complete":
+            self.pool_stats["connections_opened"] += 1
+
+    def get_pool_stats(self) -> dict:
+        """Connection reuse statistics for the shared client"""
+        requests_sent = self.pool_stats["requests"]
+        opened = self.pool_stats["connections_opened"]
+        stats = {
+            **self.pool_stats,
+            "reused_requests": max(requests_sent - opened, 0),
+            "reuse_rate": round((1 - opened / requests_sent) * 100, 2) if requests_sent > 0 else 0,
+            "http2_enabled": HTTP2_ENABLED,
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive_connections": HTTP_MAX_KEEPALIVE_CONNECTIONS,
+            "open_connections": 0,
+            "idle_connections": 0
+        }
+        
+        # httpcore does not expose pool state publicly, so read it defensively
+        pool = getattr(getattr(self._client, "_transport", None), "_pool", None)
+        connections = getattr(pool, "connections", None) or []
+        stats["open_connections"] = len(connections)
+        stats["idle_connections"] = sum(1 for c in connections if c.is_idle())
+        return stats
+
+    async def aclose(self):
+        if self._client is not None and not self._client.is_closed:
+            await self._client.aclose()
+            logger.info(f"Closed shared GitLab HTTP client ({self.get_pool_stats()['reuse_rate']}% connection reuse)")
+        self._client = None
+
+    async def _paginate(self, path: str, params: dict = None, timeout: httpx.Timeout = None):
+        """
+        Yield every page of a GitLab list endpoint.
+        Follows the Link header (keyset and offset pagination) and falls back to X-Next-Page.
+        """
+        url = f"{self.base_url}/api/v4{path}"
+        params = {"per_page": 100, **(params or {})}
+        per_page = params["per_page"]
+        
+        while url:
+            response = await self.client.get(
+                url,
+                headers=self.headers,
+                params=params,
+                timeout=timeout or TIMEOUT_PROFILES["api"]
+            )
+            response.raise_for_status()
+            page = response.json()
+            
+            if not page:
+                break
+            
+            yield page
+            
+            # Keyset pagination only advertises the next page through the Link header
+            next_url = response.links.get("next", {}).get("url")
+            next_page = response.headers.get("x-next-page")
+            if next_url:
+                url, params = next_url, None
+            elif next_page:
+                params = {**(params or {}), "page": next_page}
+            elif len(page) >= per_page and params is not None:
+                params = {**params, "page": int(params.get("page", 1)) + 1}
+            else:
+                break
 
     async def fetch_projects(self):
         all_projects = []
-        page = 1
-        per_page = 100
+        params = {
+            "membership": True,
+            "archived": False,
+            "pagination": "keyset",
+            "order_by": "id",
+            "sort": "asc"
+        }
         
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            while True:
-                response = await client.get(
-                    f"{self.base_url}/api/v4/projects",
-                    headers=self.headers,
-                    params={"membership": True, "per_page": per_page, "page": page, "archived": False}
-                )
-                response.raise_for_status()
-                projects = response.json()
-                
-                if not projects:
-                    break
-                
-                all_projects.extend(projects)
-                
-                # Check if there are more pages
-                if len(projects) < per_page:
-                    break
-                
-                page += 1
+        async for projects in self._paginate("/projects", params):
+            all_projects.extend(projects)
         
         # Filter projects by namespace
         filtered_projects = [
-            p for p in all_projects 
-            if p.get('namespace', {}).get('path') == GITLAB_NAMESPACE or 
+            p for p in all_projects
+            if p.get('namespace', {}).get('path') == GITLAB_NAMESPACE or
                p.get('namespace', {}).get('full_path', '').startswith(f"{GITLAB_NAMESPACE}/")
         ]
         
         logger.info(f"Fetched {len(all_projects)} projects from GitLab, {len(filtered_projects)} in '{GITLAB_NAMESPACE}' namespace")
         return filtered_projects
 
-    async def fetch_pipelines(self, project_id: int, ref: str = None, updated_after: str = None):
-        # Build query parameters
-        params = {"per_page": 100}
+    async def fetch_pipeline_jobs(self, project_id: int, pipeline_id: int):
+        """Fetch every job of a pipeline (GitLab returns 20 per page by default)"""
+        jobs = []
+        async for page in self._paginate(f"/projects/{project_id}/pipelines/{pipeline_id}/jobs", timeout=TIMEOUT_PROFILES["pipelines"]):
+            jobs.extend(page)
+        return jobs
+
+    async def _fetch_pipeline_detail(self, project_id: int, pipeline_id: int, budget: asyncio.Semaphore):
+        async with budget, API_SEMAPHORE:
+            # Detail and jobs are independent, so fetch them concurrently
+            detail_response, jobs = await asyncio.gather(
+                self.client.get(
+                    f"{self.base_url}/api/v4/projects/{project_id}/pipelines/{pipeline_id}",
+                    headers=self.headers,
+                    timeout=TIMEOUT_PROFILES["pipelines"]
+                ),
+                self.fetch_pipeline_jobs(project_id, pipeline_id)
+            )
+        detail_response.raise_for_status()
+        pipeline_detail = detail_response.json()
+        pipeline_detail['jobs'] = jobs
+        return pipeline_detail
+
+    async def iter_pipelines(self, project_id: int, ref: str = None, updated_after: str = None,
+                             concurrency: int = None, failed: Optional[list] = None):
+        """
+        Walk every page of a project's pipelines and yield each one (with details and jobs)
+        as soon as it has been fetched. Detail requests fan out under a per-project budget and
+        start as each page arrives, while the next page is being fetched.
+        Pipelines whose details can't be fetched are not yielded; pass a list as `failed` to
+        get their (updated_at, pipeline_id) appended.
+        """
+        params = {}
         if ref:
             params["ref"] = ref
         if updated_after:
             params["updated_after"] = updated_after
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.get(
-                f"{self.base_url}/api/v4/projects/{project_id}/pipelines",
-                headers=self.headers,
-                params=params
-            )
-            response.raise_for_status()
-            pipelines = response.json()
-            
-            # Fetch detailed info for each pipeline
-            detailed_pipelines = []
-            for pipeline in pipelines:
-                detail_response = await client.get(
-                    f"{self.base_url}/api/v4/projects/{project_id}/pipelines/{pipeline['id']}",
-                    headers=self.headers
+        budget = asyncio.Semaphore(concurrency or PIPELINE_FETCH_CONCURRENCY)
+        pages = self._paginate(f"/projects/{project_id}/pipelines", params, TIMEOUT_PROFILES["pipelines"])
+        next_page = asyncio.ensure_future(anext(pages))
+        details = {}  # detail task -> the pipeline's list entry
+        
+        try:
+            while next_page or details:
+                done, _ = await asyncio.wait(
+                    [*details, *([next_page] if next_page else [])],
+                    return_when=asyncio.FIRST_COMPLETED
                 )
-                detail_response.raise_for_status()
-                pipeline_detail = detail_response.json()
                 
-                # Fetch jobs
-                jobs_response = await client.get(
-                    f"{self.base_url}/api/v4/projects/{project_id}/pipelines/{pipeline['id']}/jobs",
-                    headers=self.headers
-                )
-                jobs_response.raise_for_status()
-                pipeline_detail['jobs'] = jobs_response.json()
+                if next_page in done:
+                    try:
+                        page = next_page.result()
+                    except StopAsyncIteration:
+                        next_page = None
+                    else:
+                        for pipeline in page:
+                            task = asyncio.create_task(self._fetch_pipeline_detail(project_id, pipeline['id'], budget))
+                            details[task] = pipeline
+                        next_page = asyncio.ensure_future(anext(pages))
                 
-                detailed_pipelines.append(pipeline_detail)
-            
-            return detailed_pipelines
+                for task in done:
+                    if task not in details:
+                        continue
+                    pipeline = details.pop(task)
+                    if task.exception() is not None:
+                        logger.error(f"Error fetching pipeline details for project {project_id}: {task.exception()}")
+                        if failed is not None:
+                            failed.append((pipeline.get('updated_at'), pipeline['id']))
+                        continue
+                    yield task.result()
+        finally:
+            # Don't leave requests running if the consumer stops early (or a page fails)
+            for task in details:
+                task.cancel()
+            if next_page and not next_page.done():
+                next_page.cancel()
+                await asyncio.gather(next_page, return_exceptions=True)
+            await pages.aclose()
 
-    async def fetch_job_logs(self, project_id: int, job_id: int):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/trace",
-                headers=self.headers
-            )
+    async def stream_job_log(self, project_id: int, job_id: int):
+        """Yield a job's trace as text blocks while it downloads (UTF-8, decoded incrementally)"""
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        async with self.client.stream(
+            "GET",
+            f"{self.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/trace",
+            headers=self.headers,
+            timeout=TIMEOUT_PROFILES["trace"]
+        ) as response:
             response.raise_for_status()
-            return response.text
-    
+            async for data in response.aiter_bytes(LOG_STREAM_READ_BYTES):
+                text = decoder.decode(data)
+                if text:
+                    yield text
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+    async def fetch_job_log_tail(self, project_id: int, job_id: int, offset: int) -> tuple:
+        """
+        Trace bytes from offset on, via a Range request. If GitLab ignores the Range the full
+        trace is sliced instead. Returns (start, data, full) - start < offset means the trace was
+        restarted (e.g. a retried job) and data is the whole new trace; full is True when the
+        whole trace was downloaded although only the bytes past offset were asked for.
+        """
+        headers = {**self.headers, "Range": f"bytes={offset}-"} if offset else self.headers
+        response = await self.client.get(
+            f"{self.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/trace",
+            headers=headers,
+            timeout=TIMEOUT_PROFILES["trace"]
+        )
+        if response.status_code == 416:
+            return offset, b"", False  # nothing past the offset yet
+        response.raise_for_status()
+        
+        data = response.content
+        if response.status_code == 206:
+            return offset, data, False
+        full = offset > 0
+        if len(data) < offset:
+            return 0, data, full
+        return offset, data[offset:], full
+
+    async def fetch_job(self, project_id: int, job_id: int) -> dict:
+        response = await self.client.get(
+            f"{self.base_url}/api/v4/projects/{project_id}/jobs/{job_id}",
+            headers=self.headers,
+            timeout=TIMEOUT_PROFILES["api"]
+        )
+        response.raise_for_status()
+        return response.json()
+
     async def fetch_job_artifacts(self, project_id: int, job_id: int):
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"{self.base_url}/api/v4/projects/{project_id}/jobs/{job_id}",
-                headers=self.headers
-            )
-            response.raise_for_status()
-            job_data = response.json()
-            
-            artifacts = []
-            if job_data.get('artifacts_file'):
-                art_file = job_data['artifacts_file']
-                artifacts.append({
-                    "filename": art_file.get('filename', 'artifacts.zip'),
-                    "size": art_file.get('size', 0),
-                    "download_url": f"{self.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts"
-                })
-            return artifacts
-    
-    async def fetch_job_junit_report(self, project_id: int, job_id: int):
-        """Fetch and parse JUnit test report from job artifacts - recursively searches for junit_report.xml in CI stage"""
-        try:
-            async with httpx.AsyncClient(timeout=60.0) as client:
-                # Download the artifacts archive
-                response = await client.get(
-                    f"{self.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts",
-                    headers=self.headers,
-                    follow_redirects=True
-                )
-                response.raise_for_status()
-                
-                logger.info(f"Downloaded artifacts for job {job_id}, size: {len(response.content)} bytes, content-type: {response.headers.get('content-type')}")
-                
-                # Parse the zip file to find JUnit XML files
-                import zipfile
-                import xml.etree.ElementTree as ET
-                from io import BytesIO
-                
-                test_results = {
-                    "total": 0,
-                    "passed": 0,
-                    "failed": 0,
-                    "skipped": 0,
-                    "tests": []
-                }
-                
-                try:
-                    zip_data = BytesIO(response.content)
-                    with zipfile.ZipFile(zip_data, 'r') as zip_file:
-                        file_list = zip_file.namelist()
-                        logger.info(f"Files in artifact archive: {file_list}")
-                        
-                        # First, try to find junit_report.xml specifically (recursively in any directory)
-                        junit_file = None
-                        for file_path in file_list:
-                            if file_path.endswith('junit_report.xml'):
-                                junit_file = file_path
-                                logger.info(f"Found junit_report.xml at: {file_path}")
-                                break
-                        
-                        # If junit_report.xml not found, look for other JUnit XML files
-                        if not junit_file:
-                            junit_patterns = ['junit', 'test-result', 'test_result', 'TEST-', 'report']
-                            for file_path in file_list:
-                                file_lower = file_path.lower()
-                                if file_path.endswith('.xml') and any(pattern in file_lower for pattern in junit_patterns):
-                                    junit_file = file_path
-                                    logger.info(f"Found alternative JUnit file: {file_path}")
-                                    break
-                        
-                        # Process the found JUnit file
-                        if junit_file:
-                            try:
-                                xml_content = zip_file.read(junit_file)
-                                root = ET.fromstring(xml_content)
-                                
-                                # Parse JUnit XML format - handle both testsuite and testsuites root
-                                testsuites = root.findall('.//testsuite') if root.tag != 'testsuite' else [root]
-                                
-                                for testsuite in testsuites:
-                                    for testcase in testsuite.findall('testcase'):
-                                        test_name = testcase.get('name', 'Unknown')
-                                        classname = testcase.get('classname', '')
-                                        duration = float(testcase.get('time', 0))
-                                        
-                                        # Determine test status
-                                        failure = testcase.find('failure')
-                                        error = testcase.find('error')
-                                        skipped = testcase.find('skipped')
-                                        
-                                        if failure is not None:
-                                            status = 'failed'
-                                            test_results['failed'] += 1
-                                            test_results['tests'].append({
-                                                "name": test_name,
-                                                "classname": classname,
-                                                "status": status,
-                                                "duration": duration,
-                                                "failure_message": failure.get('message', failure.text or 'No message')
-                                            })
-                                        elif error is not None:
-                                            status = 'failed'
-                                            test_results['failed'] += 1
-                                            test_results['tests'].append({
-                                                "name": test_name,
-                                                "classname": classname,
-                                                "status": status,
-                                                "duration": duration,
-                                                "failure_message": error.get('message', error.text or 'No message')
-                                            })
-                                        elif skipped is not None:
-                                            status = 'skipped'
-                                            test_results['skipped'] += 1
-                                            test_results['tests'].append({
-                                                "name": test_name,
-                                                "classname": classname,
-                                                "status": status,
-                                                "duration": duration,
-                                                "skip_message": skipped.get('message', skipped.text or 'No message')
-                                            })
-                                        else:
-                                            status = 'passed'
-                                            test_results['passed'] += 1
-                                            test_results['tests'].append({
-                                                "name": test_name,
-                                                "classname": classname,
-                                                "status": status,
-                                                "duration": duration
-                                            })
-                                        
-                                        test_results['total'] += 1
-                                
-                                logger.info(f"Parsed {test_results['total']} tests from {junit_file}")
-                            except ET.ParseError as e:
-                                logger.warning(f"XML parse error in {junit_file}: {e}")
-                            except Exception as e:
-                                logger.warning(f"Error parsing JUnit XML file {junit_file}: {e}")
-                        else:
-                            logger.warning(f"No JUnit test results found in artifacts for job {job_id}")
-                        
-                        if False:  # Dummy condition to skip old loop
-                            for file_info in file_list:
-                                file_lower = file_info.lower()
-                                if file_info.endswith('.xml') and False:
-                                    logger.info(f"Found potential JUnit file: {file_info}")
-                
-                except zipfile.BadZipFile:
-                    logger.error(f"Artifacts for job {job_id} is not a valid ZIP file")
-                    return None
-                
-                return test_results if test_results['total'] > 0 else None
-                
-        except httpx.HTTPStatusError as e:
-            logger.error(f"HTTP error fetching artifacts for job {job_id}: {e.response.status_code}")
-            return None
-        except Exception as e:
-            logger.error(f"Error fetching JUnit report for job {job_id}: {e}")
-            return None
+        response = await self.client.get(
+            f"{self.base_url}/api/v4/projects/{project_id}/jobs/{job_id}",
+            headers=self.headers,
+            timeout=TIMEOUT_PROFILES["api"]
+        )
+        response.raise_for_status()
+        job_data = response.json()
+        
+        artifacts = []
+        if job_data.get('artifacts_file'):
+            art_file = job_data['artifacts_file']
+            artifacts.append({
+                "filename": art_file.get('filename', 'artifacts.zip'),
+                "size": art_file.get('size', 0),
+                "download_url": f"{self.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts"
+            })
+        return artifacts
     
+    async def download_job_artifacts_to_file(self, project_id: int, job_id: int, dest: Path) -> int:
+        """Stream a job's complete artifacts archive to a local file, returns the number of bytes written"""
+        written = 0
+        async with self.client.stream(
+            "GET",
+            f"{self.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts",
+            headers=self.headers,
+            follow_redirects=True,
+            timeout=TIMEOUT_PROFILES["artifact_download"]
+        ) as response:
+            response.raise_for_status()
+            with open(dest, 'wb') as f:
+                async for chunk in response.aiter_bytes(1024 * 1024):
+                    f.write(chunk)
+                    written += len(chunk)
+            logger.info(f"Downloaded artifacts for job {job_id}, size: {written} bytes, content-type: {response.headers.get('content-type')}")
+        return written
+
     async def fetch_gitlab_ci_config(self, project_id: int, ref: str = None):
         """Fetch .gitlab-ci.yml file from a project to get stage order"""
         try:
             params = {"ref": ref or DEFAULT_BRANCH}
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.get(
-                    f"{self.base_url}/api/v4/projects/{project_id}/repository/files/.gitlab-ci.yml/raw",
-                    headers=self.headers,
-                    params=params
-                )
-                response.raise_for_status()
-                
-                # Parse YAML to extract stages
-                import yaml
-                config = yaml.safe_load(response.text)
-                
-                # Get stages from the config
-                if config and 'stages' in config:
-                    return config['stages']
-                
-                return None
+            response = await self.client.get(
+                f"{self.base_url}/api/v4/projects/{project_id}/repository/files/.gitlab-ci.yml/raw",
+                headers=self.headers,
+                params=params,
+                timeout=TIMEOUT_PROFILES["api"]
+            )
+            response.raise_for_status()
+            
+            # Parse YAML to extract stages
+            import yaml
+            config = yaml.safe_load(response.text)
+            
+            # Get stages from the config
+            if config and 'stages' in config:
+                return config['stages']
+            
+            return None
         except Exception as e:
             logger.warning(f"Could not fetch .gitlab-ci.yml for project {project_id}: {e}")
             return None
 
 gitlab_service = GitLabService()
 
-# ============ Artifact Utilities ============
+# ============ Keyed Locks ============
 
-async def parse_zip_central_directory(project_id: int, job_id: int, artifact_size: int):
+class KeyedLocks:
     """
-    Parse ZIP central directory without downloading entire file.
-    Downloads only the last portion of the file containing the central directory.
+    One asyncio.Lock per key, created on first use. An entry is dropped only when no coroutine
+    holds or waits for it, so a newcomer can never get a second lock for a key that is in use.
     """
-    try:
-        # ZIP central directory is at the end of the file
-        # We need to download the last portion to find it
-        # Typical central directory size is < 64KB, but we'll download more to be safe
-        chunk_size = min(256 * 1024, artifact_size)  # Download last 256KB or entire file if smaller
-        
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # Use HTTP Range header to download only the end of the file
-            headers = {
-                **gitlab_service.headers,
-                "Range": f"bytes={artifact_size - chunk_size}-{artifact_size - 1}"
-            }
-            
-            logger.info(f"Downloading last {chunk_size} bytes of artifact for job {job_id} (total size: {artifact_size})")
-            
-            response = await client.get(
-                f"{gitlab_service.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts",
-                headers=headers,
-                follow_redirects=True
-            )
-            
-            # Check if server supports range requests
-            if response.status_code == 206:  # Partial Content
-                logger.info(f"Successfully downloaded {len(response.content)} bytes using Range request")
-            elif response.status_code == 200:
-                # Server doesn't support range requests, but we got the full file
-                logger.warning(f"Server doesn't support Range requests, downloaded full file ({len(response.content)} bytes)")
-            else:
-                response.raise_for_status()
-            
-            # Parse the ZIP central directory
-            import zipfile
-            from io import BytesIO
-            import struct
-            
-            data = response.content
-            
-            # Find End of Central Directory Record (EOCD)
-            # EOCD signature is 0x06054b50
-            eocd_signature = b'\x50\x4b\x05\x06'
-            eocd_pos = data.rfind(eocd_signature)
-            
-            if eocd_pos == -1:
-                logger.error("Could not find ZIP End of Central Directory")
-                return None
-            
-            # Parse EOCD to get central directory info
-            eocd_data = data[eocd_pos:]
-            if len(eocd_data) < 22:
-                logger.error("EOCD record too short")
+
+    def __init__(self):
+        self._entries: Dict[Any, list] = {}  # key -> [lock, coroutines holding or waiting]
+
+    @asynccontextmanager
+    async def hold(self, key):
+        entry = self._entries.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._entries[key]
+
+    def __len__(self):
+        return len(self._entries)
+
+# ============ Artifact Blob Cache ============
+
+class ArtifactBlobCache:
+    """
+    On-disk LRU cache of artifact archives, keyed by job id and archive size.
+    Files are written to a .tmp name and renamed into place, so a crash never
+    leaves a truncated archive behind. Recency is tracked with the file mtime.
+    Archives in use (see lease) are pinned and never evicted.
+    """
+
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._locks = KeyedLocks()  # job_id -> download lock
+        self._pins: Dict[Path, int] = {}  # path -> number of leases holding it
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _archives(self) -> List[Path]:
+        return list(self.directory.glob("job-*.zip"))
+
+    def _lookup(self, job_id: int, artifact_size: Optional[int]) -> Optional[Path]:
+        if artifact_size:
+            path = self.directory / f"job-{job_id}-{artifact_size}.zip"
+            return path if path.exists() else None
+        # Size unknown - any cached archive of this job will do (job artifacts never change in place)
+        matches = list(self.directory.glob(f"job-{job_id}-*.zip"))
+        return matches[0] if matches else None
+
+    def contains(self, job_id: int, artifact_size: Optional[int] = None) -> bool:
+        return self._lookup(job_id, artifact_size) is not None
+
+    def get(self, job_id: int, artifact_size: Optional[int] = None) -> Optional[Path]:
+        """Cached archive path without downloading, marks it as recently used"""
+        path = self._lookup(job_id, artifact_size)
+        if path:
+            try:
+                os.utime(path)
+            except FileNotFoundError:
                 return None
+            self.hits += 1
+        return path
+
+    def cleanup(self):
+        """Remove partial downloads left by a crash and bring the cache back under budget"""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for tmp in self.directory.glob("*.tmp"):
+            tmp.unlink(missing_ok=True)
+        self._evict()
+
+    def _evict(self, keep: Optional[Path] = None):
+        """Delete least recently used archives until the cache fits in the byte budget"""
+        archives = []
+        for path in self._archives():
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            archives.append((stat.st_mtime, stat.st_size, path))
+        
+        total = sum(size for _, size, _ in archives)
+        for _, size, path in sorted(archives):
+            if total <= self.max_bytes:
+                break
+            if path == keep or path in self._pins:
+                continue
+            # Readers that already opened the file keep their handle after the unlink
+            path.unlink(missing_ok=True)
+            total -= size
+            self.evictions += 1
+            logger.info(f"Evicted cached artifact archive {path.name} ({size} bytes)")
+
+    async def fetch(self, project_id: int, job_id: int, artifact_size: Optional[int] = None) -> Path:
+        """Return the local path of a job's artifact archive, downloading it on a miss"""
+        # One download per job at a time - concurrent callers wait and then hit the cache
+        async with self._locks.hold(job_id):
+            path = self._lookup(job_id, artifact_size)
+            if path:
+                self.hits += 1
+                os.utime(path)
+                return path
             
-            # Extract central directory info from EOCD
-            # Format: signature(4) + disk_num(2) + cd_disk(2) + cd_entries_disk(2) + 
-            #         cd_entries_total(2) + cd_size(4) + cd_offset(4) + comment_len(2)
-            cd_entries = struct.unpack('<H', eocd_data[10:12])[0]
-            cd_size = struct.unpack('<I', eocd_data[12:16])[0]
-            cd_offset = struct.unpack('<I', eocd_data[16:20])[0]
-            
-            logger.info(f"Found central directory: {cd_entries} entries, size: {cd_size} bytes, offset: {cd_offset}")
-            
-            # Check if we have the full central directory in our downloaded chunk
-            cd_start_in_chunk = cd_offset - (artifact_size - chunk_size)
-            
-            if cd_start_in_chunk < 0:
-                # We need to download more data
-                logger.info(f"Central directory starts before our chunk, downloading more data")
-                # Download from central directory start to end of file
-                download_size = artifact_size - cd_offset
-                headers = {
-                    **gitlab_service.headers,
-                    "Range": f"bytes={cd_offset}-{artifact_size - 1}"
-                }
-                
-                response = await client.get(
-                    f"{gitlab_service.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts",
-                    headers=headers,
-                    follow_redirects=True
-                )
-                response.raise_for_status()
-                data = response.content
-                cd_start_in_chunk = 0
-            
-            # Parse central directory entries
-            files = []
-            pos = cd_start_in_chunk
-            
-            for i in range(cd_entries):
-                if pos + 46 > len(data):
-                    logger.warning(f"Incomplete central directory entry at position {pos}")
-                    break
-                
-                # Central directory file header signature
-                signature = data[pos:pos+4]
-                if signature != b'\x50\x4b\x01\x02':
-                    logger.warning(f"Invalid central directory signature at position {pos}")
-                    break
-                
-                # Parse central directory entry
-                filename_len = struct.unpack('<H', data[pos+28:pos+30])[0]
-                extra_len = struct.unpack('<H', data[pos+30:pos+32])[0]
-                comment_len = struct.unpack('<H', data[pos+32:pos+34])[0]
-                uncompressed_size = struct.unpack('<I', data[pos+24:pos+28])[0]
-                
-                # Extract filename
-                filename_start = pos + 46
-                filename_end = filename_start + filename_len
-                if filename_end > len(data):
-                    logger.warning(f"Filename extends beyond data at position {pos}")
-                    break
-                
-                filename = data[filename_start:filename_end].decode('utf-8', errors='ignore')
-                
-                # Determine if it's a directory
-                is_directory = filename.endswith('/')
-                
-                files.append({
-                    "name": filename,
-                    "size": uncompressed_size,
-                    "is_directory": is_directory
-                })
-                
-                # Move to next entry
-                pos += 46 + filename_len + extra_len + comment_len
-            
-            logger.info(f"Successfully parsed {len(files)} files from central directory")
-            return files
+            self.misses += 1
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp = self.directory / f"job-{job_id}.{uuid.uuid4().hex}.tmp"
+            try:
+                written = await gitlab_service.download_job_artifacts_to_file(project_id, job_id, tmp)
+                path = self.directory / f"job-{job_id}-{written}.zip"
+                os.replace(tmp, path)
+            finally:
+                tmp.unlink(missing_ok=True)
             
-    except Exception as e:
-        logger.error(f"Error parsing ZIP central directory for job {job_id}: {e}")
+            self._evict(keep=path)
+            return path
+
+    @contextmanager
+    def pin(self, path: Path):
+        """Keep an archive out of eviction while the block runs"""
+        self._pins[path] = self._pins.get(path, 0) + 1
+        try:
+            yield path
+        finally:
+            self._pins[path] -= 1
+            if not self._pins[path]:
+                del self._pins[path]
+
+    @asynccontextmanager
+    async def lease(self, project_id: int, job_id: int, artifact_size: Optional[int] = None):
+        """
+        fetch() a job's archive and pin it until the block exits - for users that open the
+        file later, e.g. from a worker process, after other downloads may have run evictions
+        """
+        path = await self.fetch(project_id, job_id, artifact_size)
+        # No await since fetch returned, so the archive can't have been evicted yet
+        with self.pin(path):
+            yield path
+
+    def remove(self, job_id: Optional[int] = None) -> int:
+        """Delete cached archives - for one job or all of them"""
+        pattern = f"job-{job_id}-*.zip" if job_id else "job-*.zip"
+        removed = 0
+        for path in self.directory.glob(pattern):
+            path.unlink(missing_ok=True)
+            removed += 1
+        return removed
+
+    def get_stats(self) -> dict:
+        sizes = []
+        for path in self._archives():
+            try:
+                sizes.append(path.stat().st_size)
+            except FileNotFoundError:
+                continue
+        return {
+            "directory": str(self.directory),
+            "archives": len(sizes),
+            "bytes": sum(sizes),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions
+        }
+
+artifact_blob_cache = ArtifactBlobCache(ARTIFACT_CACHE_DIR, ARTIFACT_CACHE_MAX_BYTES)
+
+class MappedArchive(mmap.mmap):
+    """Read-only memory map usable as the file object of a ZipFile"""
+
+    def seekable(self):
+        return True
+
+@contextmanager
+def open_cached_zip(path: Path):
+    """Open a cached archive as a ZipFile backed by a read-only memory map"""
+    import zipfile
+    
+    with open(path, 'rb') as f:
+        try:
+            mapped = MappedArchive(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty file can't be mapped
+            raise zipfile.BadZipFile("Archive is empty")
+        with mapped, zipfile.ZipFile(mapped, 'r') as zip_file:
+            yield zip_file
+
+def artifact_size_of(job: dict) -> Optional[int]:
+    """Archive size GitLab reports for a job, if any"""
+    return (job.get('artifacts_file') or {}).get('size')
+
+# ============ CPU Worker Pool ============
+
+cpu_pool: Optional[ProcessPoolExecutor] = None
+
+def get_cpu_pool() -> ProcessPoolExecutor:
+    """Shared process pool for CPU-bound work (archive decompression, XML parsing)"""
+    global cpu_pool
+    if cpu_pool is None:
+        # spawn rather than fork: the parent has an event loop and client threads running
+        cpu_pool = ProcessPoolExecutor(max_workers=CPU_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return cpu_pool
+
+async def run_cpu_bound(func, *args):
+    """Run a picklable function in the CPU pool without blocking the event loop"""
+    global cpu_pool
+    try:
+        return await asyncio.get_running_loop().run_in_executor(get_cpu_pool(), func, *args)
+    except BrokenProcessPool:
+        # A worker died (e.g. OOM killed) - start a fresh pool for the next caller
+        logger.error(f"CPU worker pool broke while running {func.__name__}, restarting it")
+        cpu_pool = None
+        raise
+
+def shutdown_cpu_pool():
+    global cpu_pool
+    if cpu_pool is not None:
+        cpu_pool.shutdown(wait=False, cancel_futures=True)
+        cpu_pool = None
+
+# ============ Artifact Utilities ============
+
+def dos_datetime_to_iso(dos_date: int, dos_time: int) -> Optional[str]:
+    """Convert a ZIP (MS-DOS) date/time pair to an ISO 8601 string"""
+    try:
+        return datetime(
+            (dos_date >> 9) + 1980, (dos_date >> 5) & 0x0F, dos_date & 0x1F,
+            dos_time >> 11, (dos_time >> 5) & 0x3F, (dos_time & 0x1F) * 2
+        ).isoformat()
+    except ValueError:
         return None
 
-async def build_directory_structure(files, path=""):
+def parse_zip_central_directory_entries(data: bytes, pos: int, cd_entries: int) -> List[dict]:
     """
-    Build a directory structure from flat file list.
-    Returns files/folders at the specified path level.
+    Parse central directory file headers starting at data[pos].
+    Sizes and offsets stored as 0xFFFFFFFF are read from the ZIP64 extended information extra field.
     """
-    if not files:
-        return []
-    
-    # Normalize path
-    if path:
-        path = path.rstrip('/') + '/'
-    
-    # Filter files that are in the current path
-    result = []
-    seen = set()
+    import struct
     
-    for file_info in files:
-        filename = file_info['name']
-        
-        # Skip if not in current path
-        if path and not filename.startswith(path):
-            continue
-        
-        # Get relative path from current directory
-        if path:
-            relative = filename[len(path):]
-        else:
-            relative = filename
+    files = []
+    for i in range(cd_entries):
+        if pos + 46 > len(data):
+            logger.warning(f"Incomplete central directory entry at position {pos}")
+            break
         
-        if not relative:
-            continue
+        # Central directory file header signature
+        signature = data[pos:pos+4]
+        if signature != b'\x50\x4b\x01\x02':
+            logger.warning(f"Invalid central directory signature at position {pos}")
+            break
         
-        # Get first component (file or directory name)
-        parts = relative.split('/')
-        first_component = parts[0]
+        # Format: signature(4) + version_made(2) + version_needed(2) + flags(2) + method(2) +
+        #         mtime(2) + mdate(2) + crc32(4) + compressed(4) + uncompressed(4) + filename_len(2) +
+        #         extra_len(2) + comment_len(2) + disk_start(2) + int_attr(2) + ext_attr(4) + local_offset(4)
+        (flags, compression_method, dos_time, dos_date, crc32, compressed_size, uncompressed_size,
+         filename_len, extra_len, comment_len) = struct.unpack('<HHHHIIIHHH', data[pos+8:pos+34])
+        local_header_offset = struct.unpack('<I', data[pos+42:pos+46])[0]
         
-        if first_component in seen or not first_component:
-            continue
-        seen.add(first_component)
+        # Extract filename
+        filename_start = pos + 46
+        filename_end = filename_start + filename_len
+        if filename_end + extra_len > len(data):
+            logger.warning(f"Filename extends beyond data at position {pos}")
+            break
         
-        # Determine if it's a directory
-        full_path = path + first_component
-        is_directory = len(parts) > 1 or filename.endswith('/')
+        # Bit 11 marks UTF-8 names, everything else is CP437 (same rule zipfile uses)
+        raw_name = data[filename_start:filename_end]
+        filename = raw_name.decode('utf-8', errors='replace') if flags & 0x800 else raw_name.decode('cp437')
         
-        item = {
-            "name": first_component,
-            "type": "directory" if is_directory else "file",
-            "path": full_path.rstrip('/')
-        }
+        # ZIP64 extended information: only the fields saturated in the header are present, in this order
+        extra = data[filename_end:filename_end + extra_len]
+        extra_pos = 0
+        while extra_pos + 4 <= len(extra):
+            header_id, field_len = struct.unpack('<HH', extra[extra_pos:extra_pos+4])
+            if header_id == 0x0001:
+                field = extra[extra_pos+4:extra_pos+4+field_len]
+                field_pos = 0
+                if uncompressed_size == 0xFFFFFFFF and field_pos + 8 <= len(field):
+                    uncompressed_size = struct.unpack('<Q', field[field_pos:field_pos+8])[0]
+                    field_pos += 8
+                if compressed_size == 0xFFFFFFFF and field_pos + 8 <= len(field):
+                    compressed_size = struct.unpack('<Q', field[field_pos:field_pos+8])[0]
+                    field_pos += 8
+                if local_header_offset == 0xFFFFFFFF and field_pos + 8 <= len(field):
+                    local_header_offset = struct.unpack('<Q', field[field_pos:field_pos+8])[0]
+                break
+            extra_pos += 4 + field_len
         
-        # Add size for files
-        if not is_directory:
-            item["size"] = file_info['size']
+        files.append({
+            "name": filename,
+            "size": uncompressed_size,
+            "is_directory": filename.endswith('/'),
+            "compressed_size": compressed_size,
+            "compression_method": compression_method,
+            "crc32": crc32,
+            "mtime": dos_datetime_to_iso(dos_date, dos_time),
+            "local_header_offset": local_header_offset
+        })
         
-        result.append(item)
-    
-    # Sort: directories first, then files, alphabetically
-    result.sort(key=lambda x: (x["type"] == "file", x["name"]))
+        # Move to next entry
+        pos += 46 + filename_len + extra_len + comment_len
     
-    return result
+    return files
 
-async def pre_cache_artifact_structure(project_id: int, job_id: int, artifact_size: int):
+async def parse_zip_central_directory(project_id: int, job_id: int, artifact_size: int):
     """
-    Pre-cache artifact structure during pipeline sync.
-    Uses streaming ZIP parser for instant browsing.
+    Parse ZIP central directory without downloading entire file.
+    Downloads only the last portion of the file containing the central directory.
+    Handles ZIP64 archives (over 4 GB or more than 65,535 entries).
     """
+    import struct
+    
+    url = f"{gitlab_service.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts"
+
+    async def fetch_range(first: int, last: int) -> bytes:
+        response = await gitlab_service.client.get(
+            url,
+            headers={**gitlab_service.headers, "Range": f"bytes={first}-{last}"},
+            follow_redirects=True,
+            timeout=TIMEOUT_PROFILES["artifact_range"]
+        )
+        response.raise_for_status()
+        return response.content
+    
     try:
-        # Check if already cached
-        cache_key = f"artifacts_browse_{job_id}_"
-        cached = await db.artifact_cache.find_one({"cache_key": cache_key})
+        # ZIP central directory is at the end of the file
+        # We need to download the last portion to find it
+        # Typical central directory size is < 64KB, but we'll download more to be safe
+        chunk_size = min(256 * 1024, artifact_size)  # Download last 256KB or entire file if smaller
         
-        if cached:
-            # Check if cache is still valid (24 hours)
-            cache_time = datetime.fromisoformat(cached['cached_at'])
-            if datetime.now(timezone.utc) - cache_time < timedelta(hours=24):
-                logger.info(f"Artifact structure already cached for job {job_id}")
-                return True
+        logger.info(f"Downloading last {chunk_size} bytes of artifact for job {job_id} (total size: {artifact_size})")
         
-        # Parse ZIP central directory
-        files = await parse_zip_central_directory(project_id, job_id, artifact_size)
+        # Use HTTP Range header to download only the end of the file
+        response = await gitlab_service.client.get(
+            url,
+            headers={**gitlab_service.headers, "Range": f"bytes={artifact_size - chunk_size}-{artifact_size - 1}"},
+            follow_redirects=True,
+            timeout=TIMEOUT_PROFILES["artifact_range"]
+        )
         
-        if not files:
-            logger.warning(f"Could not parse artifact structure for job {job_id}")
-            return False
+        # Check if server supports range requests
+        data_offset = artifact_size - chunk_size  # Archive offset of the first byte we hold
+        if response.status_code == 206:  # Partial Content
+            logger.info(f"Successfully downloaded {len(response.content)} bytes using Range request")
+        elif response.status_code == 200:
+            # Server doesn't support range requests, but we got the full file
+            logger.warning(f"Server doesn't support Range requests, downloaded full file ({len(response.content)} bytes)")
+            data_offset = 0
+        else:
+            response.raise_for_status()
         
-        # Build root directory structure
-        root_structure = await build_directory_structure(files, "")
+        data = response.content
         
-        # Cache the full file list and root structure
-        await db.artifact_cache.update_one(
-            {"cache_key": cache_key},
-            {"$set": {
-                "cache_key": cache_key,
-                "job_id": job_id,
-                "path": "",
-                "files": root_structure,
-                "full_file_list": files,  # Store complete file list for subdirectory queries
-                "cached_at": datetime.now(timezone.utc).isoformat()
-            }},
-            upsert=True
+        # Find End of Central Directory Record (EOCD)
+        # EOCD signature is 0x06054b50
+        eocd_signature = b'\x50\x4b\x05\x06'
+        eocd_pos = data.rfind(eocd_signature)
+        
+        if eocd_pos == -1:
+            logger.error("Could not find ZIP End of Central Directory")
+            return None
+        
+        # Parse EOCD to get central directory info
+        eocd_data = data[eocd_pos:]
+        if len(eocd_data) < 22:
+            logger.error("EOCD record too short")
+            return None
+        
+        # Extract central directory info from EOCD
+        # Format: signature(4) + disk_num(2) + cd_disk(2) + cd_entries_disk(2) + 
+        #         cd_entries_total(2) + cd_size(4) + cd_offset(4) + comment_len(2)
+        cd_entries, cd_size, cd_offset = struct.unpack('<HII', eocd_data[10:20])
+        
+        # ZIP64: saturated EOCD fields mean the real values live in the ZIP64 end record,
+        # which is found through the locator sitting right before the EOCD
+        if cd_entries == 0xFFFF or cd_size == 0xFFFFFFFF or cd_offset == 0xFFFFFFFF:
+            locator_pos = eocd_pos - 20
+            if locator_pos < 0 or data[locator_pos:locator_pos+4] != b'\x50\x4b\x06\x07':
+                logger.error("ZIP64 archive without an end of central directory locator")
+                return None
+            
+            zip64_eocd_offset = struct.unpack('<Q', data[locator_pos+8:locator_pos+16])[0]
+            record_pos = zip64_eocd_offset - data_offset
+            if record_pos >= 0:
+                record = data[record_pos:record_pos+56]
+            else:
+                record = await fetch_range(zip64_eocd_offset, zip64_eocd_offset + 55)
+            
+            if len(record) < 56 or record[:4] != b'\x50\x4b\x06\x06':
+                logger.error("Invalid ZIP64 end of central directory record")
+                return None
+            
+            # Format: signature(4) + record_size(8) + version_made(2) + version_needed(2) + disk_num(4) +
+            #         cd_disk(4) + cd_entries_disk(8) + cd_entries_total(8) + cd_size(8) + cd_offset(8)
+            cd_entries, cd_size, cd_offset = struct.unpack('<QQQ', record[32:56])
+            logger.info(f"ZIP64 archive detected for job {job_id}")
+        
+        logger.info(f"Found central directory: {cd_entries} entries, size: {cd_size} bytes, offset: {cd_offset}")
+        
+        # Check if we have the full central directory in our downloaded chunk
+        cd_start_in_chunk = cd_offset - data_offset
+        
+        if cd_start_in_chunk < 0:
+            # We need to download more data
+            logger.info(f"Central directory starts before our chunk, downloading more data")
+            # Download the central directory itself
+            data = await fetch_range(cd_offset, cd_offset + cd_size - 1)
+            cd_start_in_chunk = 0
+        
+        # Parse central directory entries
+        files = parse_zip_central_directory_entries(data, cd_start_in_chunk, cd_entries)
+        
+        logger.info(f"Successfully parsed {len(files)} files from central directory")
+        return files
+    
+    except Exception as e:
+        logger.error(f"Error parsing ZIP central directory for job {job_id}: {e}")
+        return None
+
+async def get_artifact_member(project_id: int, job_id: int, artifact_size: int, member_path: str) -> Optional[dict]:
+    """
+    Central directory metadata of one archive member, looked up in its directory's tree node.
+    An archive that isn't indexed yet is Range-parsed and indexed first.
+    Returns None if the archive can't be listed, raises FileNotFoundError if the member doesn't exist.
+    """
+    parent, _, name = member_path.strip('/').rpartition('/')
+    
+    head = await get_artifact_tree_head(job_id)
+    node = await get_artifact_tree_node(job_id, parent, head) if head else None
+    if head is None:
+        files= await parse_zip_central_directory(project_id, job_id, artifact_size)
+        if not files:
+            return None
+        node = (await index_artifact_tree(job_id, files)).get(parent)
+    
+    entry = next((e for e in (node or {}).get('entries', []) if e['name'] == name and e['type'] == 'file'), None)
+    if not entry:
+        raise FileNotFoundError(member_path)
+    return entry
+
+async def open_remote_zip_member(project_id: int, job_id: int, artifact_size: Optional[int], member_path: str):
+    """
+    Read a single member of a job's archive with HTTP Range requests instead of downloading it all.
+    Returns (entry, async iterator of the member's uncompressed bytes), or None if the member
+    can't be read remotely (unknown size, unsupported compression, no Range support on the server).
+    Raises FileNotFoundError if the archive has no such member.
+    """
+    import struct
+    import zlib
+    
+    if not artifact_size:
+        return None
+    
+    entry = await get_artifact_member(project_id, job_id, artifact_size, member_path)
+    if not entry:
+        return None
+    
+    # Only stored (0) and deflated (8) members can be streamed
+    if entry.get('compression_method') not in (0, 8):
+        return None
+    
+    url = f"{gitlab_service.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts"
+    offset = entry['local_header_offset']
+    
+    # The local header has its own name/extra lengths, so read its fixed part to find the data start
+    async with gitlab_service.client.stream(
+        "GET",
+        url,
+        headers={**gitlab_service.headers, "Range": f"bytes={offset}-{offset + 29}"},
+        follow_redirects=True,
+        timeout=TIMEOUT_PROFILES["artifact_range"]
+    ) as response:
+        if response.status_code == 200:
+            logger.warning(f"Server doesn't support Range requests for job {job_id} artifacts, falling back to full download")
+            return None
+        response.raise_for_status()
+        header = await response.aread()
+    
+    if len(header) < 30 or header[:4] != b'\x50\x4b\x03\x04':
+        logger.warning(f"Invalid local file header for {member_path} in job {job_id} artifacts")
+        return None
+    
+    filename_len, extra_len = struct.unpack('<HH', header[26:30])
+    data_start = offset + 30 + filename_len + extra_len
+    data_end = data_start + entry['compressed_size'] - 1
+    
+    logger.info(f"Streaming {member_path} from job {job_id} artifacts (bytes {data_start}-{data_end})")
+
+    async def iter_member():
+        if entry['compressed_size'] == 0:
+            return
+        
+        decompressor = zlib.decompressobj(-15) if entry['compression_method'] == 8 else None
+        async with gitlab_service.client.stream(
+            "GET",
+            url,
+            headers={**gitlab_service.headers, "Range": f"bytes={data_start}-{data_end}"},
+            follow_redirects=True,
+            timeout=TIMEOUT_PROFILES["artifact_download"]
+        ) as response:
+            if response.status_code != 206:
+                response.raise_for_status()
+                raise httpx.HTTPError(f"Expected partial content, got {response.status_code}")
+            
+            async for chunk in response.aiter_bytes(64 * 1024):
+                if not decompressor:
+                    yield chunk
+                    continue
+                # Cap each inflate step so a highly compressed chunk can't blow up memory
+                while chunk:
+                    data = decompressor.decompress(chunk, 1024 * 1024)
+                    if data:
+                        yield data
+                    chunk = decompressor.unconsumed_tail
+        
+        if decompressor:
+            tail = decompressor.flush()
+            if tail:
+                yield tail
+    
+    return entry, iter_member()
+
+ARTIFACT_TREE_PAGE_SIZE = 5000  # Entries per node document, keeps huge directories under the BSON limit
+ARTIFACT_MEMBER_FIELDS = ("compressed_size", "compression_method", "crc32", "mtime", "local_header_offset")
+
+def build_artifact_tree(files: List[dict]) -> Dict[str, dict]:
+    """
+    Index a flat archive listing by directory in a single pass.
+    Returns {directory path: {"entries": [...], "size": bytes below it, "file_count": files below it}}
+    with "" as the root. Entries are in browse order: directories first, then files, alphabetically.
+    """
+    nodes = {"": {"entries": {}, "size": 0, "file_count": 0}}
+    
+    for file_info in files:
+        name = file_info['name'].rstrip('/')
+        if not name:
+            continue
+        parts = name.split('/')
+        is_directory = file_info['is_directory'] or file_info['name'].endswith('/')
+        
+        # Make sure every ancestor directory (and the entry itself, for directory records) has a node
+        parent = ""
+        for part in (parts if is_directory else parts[:-1]):
+            child = f"{parent}/{part}" if parent else part
+            if child not in nodes:
+                nodes[child] = {"entries": {}, "size": 0, "file_count": 0}
+                nodes[parent]['entries'][part] = {"name": part, "type": "directory", "path": child}
+            parent = child
+        
+        if is_directory:
+            continue
+        
+        item = {"name": parts[-1], "type": "file", "path": name, "size": file_info['size']}
+        item.update({field: file_info[field] for field in ARTIFACT_MEMBER_FIELDS if field in file_info})
+        nodes[parent]['entries'][parts[-1]] = item
+        
+        # Roll the file up into every directory above it
+        ancestor = parent
+        while True:
+            nodes[ancestor]['size'] += file_info['size']
+            nodes[ancestor]['file_count'] += 1
+            if not ancestor:
+                break
+            ancestor = ancestor.rpartition('/')[0]
+    
+    for node in nodes.values():
+        entries = list(node['entries'].values())
+        for entry in entries:
+            if entry['type'] == 'directory':
+                entry['size'] = nodes[entry['path']]['size']
+                entry['file_count'] = nodes[entry['path']]['file_count']
+        entries.sort(key=lambda x: (x["type"] == "file", x["name"]))
+        node['entries'] = entries
+    
+    return nodes
+
+async def index_artifact_tree(job_id: int, files: List[dict]) -> Dict[str, dict]:
+    """
+    Store an archive listing as one small node document per directory in artifact_tree.
+    The root node also carries the archive's file size stats. Nodes are written under a new
+    generation; the job's artifact_trees head switches to it once all are stored, and only
+    then is the generation it replaced deleted - concurrent runs can't mix their nodes.
+    """
+    nodes = build_artifact_tree(files)
+    nodes[""]['stats'] = summarize_artifact_sizes(files)
+    cached_at = datetime.now(timezone.utc).isoformat()
+    generation = uuid.uuid4().hex
+    
+    docs = []
+    for path, node in nodes.items():
+        entries = node['entries']
+        for page, offset in enumerate(range(0, max(len(entries), 1), ARTIFACT_TREE_PAGE_SIZE)):
+            docs.append({
+                "job_id": job_id,
+                "generation": generation,
+                "path": path,
+                "page": page,
+                "entries": entries[offset:offset + ARTIFACT_TREE_PAGE_SIZE],
+                "size": node['size'],
+                "file_count": node['file_count'],
+                "cached_at": cached_at,
+                **({"stats": node['stats']} if 'stats' in node and page == 0 else {})
+            })
+    
+    try:
+        for offset in range(0, len(docs), 1000):
+            await db.artifact_tree.insert_many(docs[offset:offset + 1000], ordered=False)
+    except Exception:
+        await db.artifact_tree.delete_many({"job_id": job_id, "generation": generation})
+        raise
+    
+    previous = await db.artifact_trees.find_one_and_update(
+        {"job_id": job_id},
+        {"$set": {"generation": generation, "cached_at": cached_at}},
+        projection={"_id": 0, "generation": 1},
+        upsert=True,
+        return_document=ReturnDocument.BEFORE
+    )
+    # Trees indexed before generations were stored have none (matched by None)
+    await db.artifact_tree.delete_many({"job_id": job_id, "generation": (previous or {}).get('generation')})
+    
+    return nodes
+
+async def get_artifact_tree_head(job_id: int) -> Optional[dict]:
+    """The indexed listing of a job's archive - {"generation", "cached_at"} - None if there is none"""
+    head = await db.artifact_trees.find_one({"job_id": job_id}, {"_id": 0, "generation": 1, "cached_at": 1})
+    if head:
+        return head
+    root = await db.artifact_tree.find_one({"job_id": job_id, "generation": None, "path": ""}, {"_id": 0, "cached_at": 1})
+    return {"generation": None, "cached_at": root['cached_at']} if root else None
+
+async def get_artifact_tree_node(job_id: int, path: str = "", head: Optional[dict] = None) -> Optional[dict]:
+    """Directory node of an indexed archive (pages merged), None if the path isn't indexed"""
+    head = head or await get_artifact_tree_head(job_id)
+    if not head:
+        return None
+    pages = await db.artifact_tree.find(
+        {"job_id": job_id, "generation": head['generation'], "path": path.strip('/')},
+        {"_id": 0, "generation": 0}
+    ).sort("page", 1).to_list(None)
+    if not pages:
+        return None
+    
+    node = pages[0]
+    for page in pages[1:]:
+        node['entries'].extend(page['entries'])
+    node.pop('page', None)
+    return node
+
+async def pre_cache_artifact_structure(project_id: int, job_id: int, artifact_size: int):
+    """
+    Pre-cache artifact structure during pipeline sync.
+    Uses streaming ZIP parser for instant browsing.
+    """
+    try:
+        # Check if already cached
+        cached = await get_artifact_tree_head(job_id)
+        
+        if cached:
+            # Check if cache is still valid (24 hours)
+            cache_time = datetime.fromisoformat(cached['cached_at'])
+            if datetime.now(timezone.utc) - cache_time < timedelta(hours=24):
+                logger.info(f"Artifact structure already cached for job {job_id}")
+                return True
+        
+        # Parse ZIP central directory
+        files = await parse_zip_central_directory(project_id, job_id, artifact_size)
+        
+        if not files:
+            logger.warning(f"Could not parse artifact structure for job {job_id}")
+            return False
+        
+        nodes = await index_artifact_tree(job_id, files)
+        
+        logger.info(f"Successfully pre-cached artifact structure for job {job_id} ({len(files)} files, {len(nodes)} directories)")
+        return True
+    
+    except Exception as e:
+        logger.error(f"Error pre-caching artifact structure for job {job_id}: {e}")
+        return False
+
+# ============ Artifact Ingestion ============
+
+def zip_info_mtime(info) -> Optional[str]:
+    try:
+        return datetime(*info.date_time).isoformat()
+    except ValueError:
+        return None
+
+def list_zip_entries(zip_file) -> List[dict]:
+    """Flat file list in the same shape parse_zip_central_directory returns"""
+    return [
+        {
+            "name": info.filename,
+            "size": info.file_size,
+            "is_directory": info.is_dir(),
+            "compressed_size": info.compress_size,
+            "compression_method": info.compress_type,
+            "crc32": info.CRC,
+            "mtime": zip_info_mtime(info),
+            "local_header_offset": info.header_offset
+        }
+        for info in zip_file.infolist()
+    ]
+
+def find_junit_files(file_list: List[str]) -> List[str]:
+    """All JUnit reports in an archive - paths matching any JUNIT_REPORT_GLOBS pattern (case-insensitive)"""
+    import fnmatch
+    
+    return [
+        file_path for file_path in file_list
+        if not file_path.endswith('/')
+        and any(fnmatch.fnmatchcase(file_path.lower(), pattern) for pattern in JUNIT_REPORT_GLOBS)
+    ]
+
+def iter_junit_testcases(source):
+    """
+    Stream test records out of a JUnit XML report (path or binary file object).
+    Uses iterparse and drops every element once it is closed, so memory stays flat
+    however large the report is. Testcases are picked up at any depth, which covers
+    nested <testsuites>/<testsuite> layouts.
+    """
+    import xml.etree.ElementTree as ET
+    
+    open_elements = []
+    for event, elem in ET.iterparse(source, events=("start", "end")):
+        if event == "start":
+            open_elements.append(elem)
+            continue
+        
+        open_elements.pop()
+        
+        if elem.tag == 'testcase':
+            try:
+                duration = float(elem.get('time', 0))
+            except ValueError:
+                duration = 0.0
+            record = {
+                "name": elem.get('name', 'Unknown'),
+                "classname": elem.get('classname', ''),
+                "status": 'passed',
+                "duration": duration
+            }
+            
+            # Single pass over the children - failure wins over error, error over skipped
+            outcome = None
+            for child in elem:
+                if child.tag == 'failure':
+                    outcome = child
+                    break
+                if child.tag == 'error' and (outcome is None or outcome.tag == 'skipped'):
+                    outcome = child
+                elif child.tag == 'skipped' and outcome is None:
+                    outcome = child
+            
+            if outcome is not None:
+                message = outcome.get('message', outcome.text or 'No message')
+                if outcome.tag == 'skipped':
+                    record["status"] = 'skipped'
+                    record["skip_message"] = message
+                else:
+                    record["status"] = 'failed'
+                    record["failure_message"] = message
+            
+            yield record
+        
+        # The element is finished - free it and detach it from its parent
+        if elem.tag in ('testcase', 'testsuite', 'testsuites'):
+            elem.clear()
+            if open_elements:
+                open_elements[-1].remove(elem)
+
+def parse_junit_stream(source) -> dict:
+    """Parse a JUnit XML report into counts and per-test records"""
+    test_results = {
+        "total": 0,
+        "passed": 0,
+        "failed": 0,
+        "skipped": 0,
+        "tests": []
+    }
+    
+    for record in iter_junit_testcases(source):
+        test_results[record['status']] += 1
+        test_results['total'] += 1
+        test_results['tests'].append(record)
+    
+    return test_results
+
+def extract_junit_results(zip_file, file_list: List[str], job_id: int) -> dict:
+    """JUnit extractor - parses and merges every report found in an opened archive"""
+    import xml.etree.ElementTree as ET
+    
+    test_results = {"total": 0, "passed": 0, "failed": 0, "skipped": 0, "tests": [], "report_files": []}
+    
+    junit_files = find_junit_files(file_list)
+    if not junit_files:
+        logger.warning(f"No JUnit test results found in artifacts for job {job_id}")
+        return test_results
+    
+    for junit_file in junit_files:
+        try:
+            # Parse straight from the (decompressing) member stream instead of reading it into memory
+            with zip_file.open(junit_file) as member:
+                report = parse_junit_stream(member)
+        except ET.ParseError as e:
+            logger.warning(f"XML parse error in {junit_file}: {e}")
+            continue
+        except Exception as e:
+            logger.warning(f"Error parsing JUnit XML file {junit_file}: {e}")
+            continue
+        
+        if report['total'] == 0:
+            continue
+        for key in ("total", "passed", "failed", "skipped"):
+            test_results[key] += report[key]
+        test_results['tests'].extend(report['tests'])
+        test_results['report_files'].append(junit_file)
+    
+    logger.info(f"Parsed {test_results['total']} tests from {len(test_results['report_files'])} JUnit file(s) for job {job_id}")
+    return test_results
+
+def detect_team_from_file_list(file_list: List[str], project_name: str) -> str:
+    """Team detection extractor - infers the owning team from where JUnit files live"""
+    # Look for junit files
+    junit_files = [f for f in file_list if f.endswith('.xml') and
+                  any(pattern in f.lower() for pattern in ['junit', 'test', 'report'])]
+    
+    if not junit_files:
+        return 'default'
+    
+    # Check for team indicators
+    for junit_file in junit_files:
+        parts = junit_file.split('/')
+        
+        # For zork: check if there's a team folder between build and junit
+        # Pattern: build/<team_name>/junit_report.xml
+        if 'zork' in project_name.lower():
+            if 'build' in parts:
+                build_idx = parts.index('build')
+                # Check if there's a folder after build that's not 'junit'
+                if build_idx + 1 < len(parts) and parts[build_idx + 1] not in ['junit', 'junit_report.xml']:
+                    potential_team = parts[build_idx + 1]
+                    # Single word team names
+                    if potential_team and not potential_team.endswith('.xml'):
+                        return potential_team
+        
+        # For kylo-systests: check gotests/build structure
+        # Pattern: gotests/build/<team_name>/junit_report.xml
+        if 'kylo-systests' in project_name.lower():
+            if 'gotests' in parts and 'build' in parts:
+                build_idx = parts.index('build')
+                if build_idx + 1 < len(parts) and parts[build_idx + 1] not in ['junit', 'junit_report.xml']:
+                    potential_team = parts[build_idx + 1]
+                    if potential_team and not potential_team.endswith('.xml'):
+                        return potential_team
+        
+        # Check filename for team indicator
+        filename = parts[-1]
+        if '_' in filename:
+            # Pattern: team_name_junit.xml
+            name_parts = filename.replace('.xml', '').split('_')
+            if len(name_parts) > 1 and name_parts[0] not in ['junit', 'test', 'report']:
+                return name_parts[0]
+    
+    # Default team if no specific team detected
+    return 'default'
+
+def summarize_artifact_sizes(entries: List[dict], top: int = 10) -> dict:
+    """File size stats extractor"""
+    files = [e for e in entries if not e['is_directory']]
+    largest = sorted(files, key=lambda e: e['size'], reverse=True)[:top]
+    return {
+        "file_count": len(files),
+        "directory_count": len(entries) - len(files),
+        "total_size": sum(e['size'] for e in files),
+        "largest_files": [{"name": e['name'], "size": e['size']} for e in largest]
+    }
+
+async def ingest_job_artifacts(project_id: int, job_id: int, project_name: str = "", artifact_size: Optional[int] = None):
+    """
+    Fetch a job's artifact archive once (through the disk cache) and run every extractor against it:
+    JUnit parsing, team detection and the browsable file list (its size stats are added when indexed).
+    Returns None only if the job has no artifact archive (404). Any other failure - HTTP or
+    network errors, an unreadable archive, a crashed worker - is raised, so callers don't
+    mistake it for a job without tests and can try again later.
+    """
+    import zipfile
+    
+    try:
+        # The archive stays pinned in the cache until the worker is done with it
+        async with artifact_blob_cache.lease(project_id, job_id, artifact_size) as archive_path:
+            # Decompression and XML parsing are CPU bound - keep them off the event loop
+            return await run_cpu_bound(analyze_artifact_archive, str(archive_path), job_id, project_name)
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 404:
+            return None
+        logger.error(f"HTTP error fetching artifacts for job {job_id}: {e.response.status_code}")
+        raise
+    except zipfile.BadZipFile:
+        # Drop the cached copy so the next attempt downloads the archive again
+        logger.error(f"Artifacts for job {job_id} is not a valid ZIP file")
+        artifact_blob_cache.remove(job_id)
+        raise
+    except Exception as e:
+        logger.error(f"Error reading artifacts for job {job_id}: {e}")
+        raise
+
+def analyze_artifact_archive(archive_path: str, job_id: int, project_name: str = "") -> dict:
+    """Run every extractor over a cached archive. Runs in the CPU worker pool."""
+    with open_cached_zip(Path(archive_path)) as zip_file:
+        file_list = zip_file.namelist()
+        entries = list_zip_entries(zip_file)
+        return {
+            "test_results": extract_junit_results(zip_file, file_list, job_id),
+            "team": detect_team_from_file_list(file_list, project_name),
+            "files": entries,
+            "archive_size": os.path.getsize(archive_path)
+        }
+
+# ============ Sync State ============
+
+def parse_gitlab_time(value: str) -> datetime:
+    """Parse a GitLab ISO 8601 timestamp (e.g. 2024-05-01T10:00:00.123Z)"""
+    return datetime.fromisoformat(value.replace('Z', '+00:00'))
+
+def watermark_key(updated_at: str, pipeline_id: int) -> tuple:
+    return (parse_gitlab_time(updated_at), pipeline_id)
+
+async def get_sync_window(project_id: int, date_threshold: str, now: datetime):
+    """
+    Decide how much of a project's pipeline history to request this cycle.
+    Returns (updated_after, sync_state, is_full_reconcile).
+    """
+    state = await db.sync_state.find_one({"project_id": project_id}, {"_id": 0})
+    
+    if not state or not state.get("last_updated_at") or not state.get("last_full_sync_at"):
+        return date_threshold, state, True
+    
+    # Periodically re-read the whole window to pick up anything the watermark missed
+    last_full_sync = datetime.fromisoformat(state["last_full_sync_at"])
+    if now - last_full_sync >= timedelta(seconds=FULL_SYNC_INTERVAL):
+        return date_threshold, state, True
+    
+    # Never ask for more than the configured window, even if the watermark is stale
+    if parse_gitlab_time(state["last_updated_at"]) < datetime.fromisoformat(date_threshold):
+        return date_threshold, state, False
+    
+    return state["last_updated_at"], state, False
+
+def is_behind_watermark(pipeline: dict, state: Optional[dict]) -> bool:
+    """True if the pipeline was already synced at (or before) the stored watermark"""
+    if not state or not state.get("last_updated_at") or not pipeline.get("updated_at"):
+        return False
+    return watermark_key(pipeline["updated_at"], pipeline["id"]) <= watermark_key(
+        state["last_updated_at"], state.get("last_pipeline_id", 0)
+    )
+
+async def advance_sync_watermark(project_id: int, state: Optional[dict], outcomes: List[tuple],
+                                 full_reconcile: bool, synced_at: datetime):
+    """
+    Move a project's watermark past every pipeline that was stored successfully.
+    A failed pipeline caps the watermark so the next cycle requests it again.
+    outcomes: list of (updated_at, pipeline_id, success)
+    """
+    current = None
+    if state and state.get("last_updated_at"):
+        current = watermark_key(state["last_updated_at"], state.get("last_pipeline_id", 0))
+    
+    stored = [watermark_key(u, i) for u, i, ok in outcomes if ok and u]
+    failed = [watermark_key(u, i) for u, i, ok in outcomes if not ok and u]
+    
+    candidates = [k for k in [current, max(stored) if stored else None] if k is not None]
+    watermark = max(candidates) if candidates else None
+    
+    if failed and watermark is not None:
+        earliest_failed_at, earliest_failed_id = min(failed)
+        watermark = min(watermark, (earliest_failed_at, earliest_failed_id - 1))
+    
+    update = {
+        "project_id": project_id,
+        "last_sync_at": synced_at.isoformat(),
+        "last_sync_mode": "full" if full_reconcile else "incremental",
+        "last_sync_pipelines": len(outcomes),
+        "last_sync_failures": len(failed)
+    }
+    if watermark is not None:
+        update["last_updated_at"] = watermark[0].isoformat()
+        update["last_pipeline_id"] = watermark[1]
+    if full_reconcile:
+        update["last_full_sync_at"] = synced_at.isoformat()
+    
+    await db.sync_state.update_one({"project_id": project_id}, {"$set": update}, upsert=True)
+
+# ============ Compact Test Reports ============
+
+TEST_STATUSES = ("passed", "failed", "skipped")
+TEST_STATUS_CODES = {status: code for code, status in enumerate(TEST_STATUSES)}
+TEST_MESSAGE_FIELDS = {"failed": "failure_message", "skipped": "skip_message"}
+TEST_STRING_COLUMNS = ("classname", "job_name", "team")  # repeated strings, stored as string table indexes
+
+def test_message_hash(message: str) -> str:
+    return hashlib.sha1(message.encode('utf-8', 'surrogatepass')).hexdigest()
+
+def pack_tests(tests: List[dict]) -> tuple:
+    """
+    Columnar, dictionary-encoded form of a list of test records: repeated strings become
+    indexes into one string table, names one NUL-separated blob, statuses one-byte codes,
+    durations a packed float64 array and messages references to test_messages by hash.
+    Returns (packed, {hash: message}).
+    """
+    strings, string_ids = [], {}
+    message_hashes, message_ids, messages = [], {}, {}
+
+    def string_id(value: str) -> int:
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+    
+    columns = [column for column in TEST_STRING_COLUMNS if tests and column in tests[0]]
+    tagged = bool(tests) and 'job_id' in tests[0]  # pipeline summaries carry the job of each test
+    
+    names, statuses, durations, message_refs, job_ids = [], [], [], [], []
+    string_refs = {column: [] for column in columns}
+    for test in tests:
+        status = test['status']
+        names.append(test['name'])
+        statuses.append(TEST_STATUS_CODES[status])
+        durations.append(float(test.get('duration') or 0))
+        for column in columns:
+            string_refs[column].append(string_id(test.get(column) or ''))
+        if tagged:
+            job_ids.append(test['job_id'])
+        
+        message = test.get(TEST_MESSAGE_FIELDS.get(status, ''))
+        if message is None:
+            message_refs.append(-1)
+            continue
+        digest = test_message_hash(message)
+        if digest not in message_ids:
+            message_ids[digest] = len(message_hashes)
+            message_hashes.append(digest)
+            messages[digest] = message
+        message_refs.append(message_ids[digest])
+    
+    count = len(tests)
+    packed = {
+        "count": count,
+        "strings": strings,
+        "messages": message_hashes,
+        # XML can't contain NUL, so it safely separates the names in one blob
+        "name": "\x00".join(names).encode('utf-8', 'surrogatepass'),
+        "status": bytes(statuses),
+        "duration": struct.pack(f"<{count}d", *durations),
+        "message": struct.pack(f"<{count}i", *message_refs),
+        "columns": {column: struct.pack(f"<{count}I", *refs) for column, refs in string_refs.items()}
+    }
+    if tagged:
+        packed["job_id"] = struct.pack(f"<{count}q", *job_ids)
+    return packed, messages
+
+def unpack_tests(packed: dict, messages: Dict[str, str]) -> List[dict]:
+    """Test records back from pack_tests() output; messages maps hash -> text"""
+    count = packed['count']
+    strings = packed['strings']
+    message_hashes = packed['messages']
+    durations = struct.unpack(f"<{count}d", packed['duration'])
+    message_refs = struct.unpack(f"<{count}i", packed['message'])
+    columns = {column: struct.unpack(f"<{count}I", data) for column, data in packed['columns'].items()}
+    classnames = columns.pop('classname', None)
+    job_ids = struct.unpack(f"<{count}q", packed['job_id']) if 'job_id' in packed else None
+    names = packed['name'].decode('utf-8', 'surrogatepass').split("\x00") if count else []
+    
+    tests = []
+    for i, (name, code) in enumerate(zip(names, packed['status'])):
+        status = TEST_STATUSES[code]
+        test = {"name": name}
+        if classnames is not None:
+            test["classname"] = strings[classnames[i]]
+        test["status"] = status
+        test["duration"] = durations[i]
+        if message_refs[i] >= 0:
+            test[TEST_MESSAGE_FIELDS[status]] = messages.get(message_hashes[message_refs[i]], '')
+        if job_ids is not None:
+            test["job_id"] = job_ids[i]
+        for column, refs in columns.items():
+            test[column] = strings[refs[i]]
+        tests.append(test)
+    return tests
+
+async def compact_test_report(report: dict) -> dict:
+    """
+    Stored form of a test report (a job's test_results or a pipeline summary): everything
+    but the tests is kept as-is, the tests are packed and their messages saved once by hash.
+    """
+    packed, messages = pack_tests(report.get('tests', []))
+    if messages:
+        async with DB_SEMAPHORE:
+            await db.test_messages.bulk_write([
+                UpdateOne({"hash": digest}, {"$setOnInsert": {"hash": digest, "message": message}}, upsert=True)
+                for digest, message in messages.items()
+            ], ordered=False)
+    
+    compact = {key: value for key, value in report.items() if key != 'tests'}
+    compact["packed_tests"] = packed
+    return compact
+
+async def expand_test_report(report: dict) -> dict:
+    """API form of a stored test report; reports cached before the compact format pass through"""
+    packed = report.get('packed_tests')
+    if packed is None:
+        return report
+    
+    messages = {}
+    if packed['messages']:
+        async with DB_SEMAPHORE:
+            docs = await db.test_messages.find({"hash": {"$in": packed['messages']}}, {"_id": 0}).to_list(None)
+        messages = {doc['hash']: doc['message'] for doc in docs}
+    
+    expanded = {key: value for key, value in report.items() if key != 'packed_tests'}
+    expanded["tests"] = unpack_tests(packed, messages)
+    return expanded
+
+# ============ Test Summaries ============
+
+TERMINAL_PIPELINE_STATUSES = ['success', 'failed', 'canceled', 'skipped']
+
+def pipeline_test_jobs(pipeline: dict) -> List[dict]:
+    """Jobs whose JUnit reports make up a pipeline's test results"""
+    project_name = pipeline.get('project_name', '').lower()
+    
+    # Determine which stages to look for tests based on project
+    test_stages = ['ci']
+    if 'kylo-systests' in project_name:
+        test_stages.extend(['system_tests', 'static_analysis'])
+    
+    return [job for job in pipeline.get('jobs', []) if job.get('stage') in test_stages]
+
+async def save_job_test_results(pipeline: dict, job: dict, test_results: dict, team: str):
+    """
+    Cache a job's parsed test report together with its detected team, and add it to the test history.
+    A stored pipeline summary that includes the job is dropped, so it is rebuilt with these results.
+    """
+    compact = await compact_test_report(test_results)
+    async with DB_SEMAPHORE:
+        await db.test_results.update_one(
+            {"job_id": job['id']},
+            {"$set": {
+                "job_id": job['id'],
+                "pipeline_id": pipeline['id'],
+                "team": team,
+                "test_results": compact,
+                "cached_at": datetime.now(timezone.utc).isoformat()
+            }},
+            upsert=True
+        )
+        await db.pipeline_test_summaries.delete_many({"job_ids": job['id']})
+    
+    try:
+        await record_test_history(pipeline, job, test_results, team)
+    except Exception as e:
+        logger.error(f"Error recording test history for job {job['id']}: {e}")
+
+def build_pipeline_test_summary(pipeline: dict, test_jobs: List[dict], results_by_job: Dict[int, dict]) -> dict:
+    """
+    Team-grouped aggregate of a pipeline's test results.
+    Tests are stored once, tagged with job and team; per-team lists are rebuilt on read.
+    """
+    summary = {
+        "pipeline_id": pipeline['id'],
+        "project_id": pipeline.get('project_id'),
+        "total": 0,
+        "passed": 0,
+        "failed": 0,
+        "skipped": 0,
+        "teams": {},  # team_name -> counts
+        "tests": []
+    }
+    
+    for job in test_jobs:
+        cached = results_by_job.get(job['id'])
+        if not cached or cached['test_results']['total'] == 0:
+            continue
+        
+        test_results = cached['test_results']
+        team_name = cached.get('team') or 'default'
+        
+        team = summary['teams'].setdefault(team_name, {"total": 0, "passed": 0, "failed": 0, "skipped": 0})
+        for key in ("total", "passed", "failed", "skipped"):
+            team[key] += test_results[key]
+            summary[key] += test_results[key]
+        
+        # Add job info to each test
+        for test in test_results.get('tests', []):
+            summary['tests'].append({**test, "job_id": job['id'], "job_name": job['name'], "team": team_name})
+    
+    return summary
+
+def expand_pipeline_test_summary(summary: dict) -> dict:
+    """Response shape of /pipelines/{id}/tests - per-team test lists included"""
+    teams = {name: {**counts, "tests": []} for name, counts in summary['teams'].items()}
+    for test in summary['tests']:
+        teams[test['team']]['tests'].append(test)
+    
+    return {
+        "total": summary['total'],
+        "passed": summary['passed'],
+        "failed": summary['failed'],
+        "skipped": summary['skipped'],
+        "teams": teams,
+        "tests": summary['tests']
+    }
+
+async def compute_pipeline_test_summary(pipeline: dict, fetch_missing: bool = False) -> dict:
+    """
+    Aggregate a pipeline's tests from the test_results cache (one query for all jobs).
+    Jobs without cached results are fetched concurrently if fetch_missing is set; otherwise
+    they are listed in missing_job_ids. Summaries of finished pipelines are stored.
+    """
+    project_id = pipeline.get('project_id')
+    pipeline_id = pipeline['id']
+    test_jobs = pipeline_test_jobs(pipeline)
+    job_ids = [job['id'] for job in test_jobs]
+    
+    async with DB_SEMAPHORE:
+        cached = await db.test_results.find({"job_id": {"$in": job_ids}}, {"_id": 0}).to_list(None)
+        manifests = await db.job_manifests.find(
+            {"job_id": {"$in": job_ids}, "products.tests.state": "absent"},
+            {"_id": 0, "job_id": 1}
+        ).to_list(None)
+    results_by_job = {}
+    for doc in cached:
+        if 'team' in doc:
+            doc['test_results'] = await expand_test_report(doc['test_results'])
+            results_by_job[doc['job_id']] = doc
+    no_report = {m['job_id'] for m in manifests}
+    
+    # Finished jobs that may have a report but haven't been cached (yet)
+    missing = [
+        job for job in test_jobs
+        if job['id'] not in results_by_job and job['id'] not in no_report
+        and job.get('status') in ['success', 'failed']
+    ]
+    
+    if fetch_missing and missing:
+        logger.info(f"Fetching test results for {len(missing)} uncached job(s) of pipeline {pipeline_id}")
+
+        async def fetch_job(job):
+            try:
+                async with API_SEMAPHORE:
+                    ingestion = await ingest_job_artifacts(project_id, job['id'], pipeline.get('project_name', ''), artifact_size_of(job))
+                test_results = ingestion['test_results'] if ingestion else None
+                if test_results and test_results['total'] > 0:
+                    await save_job_test_results(pipeline, job, test_results, ingestion['team'])
+                    results_by_job[job['id']] = {"test_results": test_results, "team": ingestion['team']}
+                    await record_job_product(job, project_id, pipeline_id, 'tests', 'present', total=test_results['total'])
+                else:
+                    # Same as the background sync: no report (or no archive) is remembered as absent,
+                    # a failed download or parse raises and leaves the job missing for a retry
+                    await record_job_product(job, project_id, pipeline_id, 'tests', 'absent')
+                return True
+            except Exception as e:
+                logger.error(f"Error fetching tests for job {job['id']}: {e}")
+                return False
+        
+        fetched = await asyncio.gather(*[fetch_job(job) for job in missing])
+        missing = [job for job, ok in zip(missing, fetched) if not ok]
+    
+    summary = build_pipeline_test_summary(pipeline, test_jobs, results_by_job)
+    summary["job_ids"] = job_ids
+    summary["missing_job_ids"] = [job['id'] for job in missing]
+    summary["pipeline_status"] = pipeline.get('status')
+    summary["pipeline_updated_at"] = pipeline.get('updated_at')
+    summary["computed_at"] = datetime.now(timezone.utc).isoformat()
+    
+    if pipeline.get('status') in TERMINAL_PIPELINE_STATUSES:
+        compact = await compact_test_report(summary)
+        async with DB_SEMAPHORE:
+            await db.pipeline_test_summaries.replace_one({"pipeline_id": pipeline_id}, compact, upsert=True)
+    
+    return summary
+
+async def refresh_pipeline_test_summary(pipeline: dict):
+    """Store the test aggregate of a pipeline that reached a terminal state (once per pipeline update)"""
+    if pipeline.get('status') not in TERMINAL_PIPELINE_STATUSES:
+        return
+    
+    async with DB_SEMAPHORE:
+        existing = await db.pipeline_test_summaries.find_one(
+            {"pipeline_id": pipeline['id']},
+            {"_id": 0, "pipeline_updated_at": 1, "missing_job_ids": 1}
+        )
+    if existing and existing.get('pipeline_updated_at') == pipeline.get('updated_at') and not existing.get('missing_job_ids'):
+        return
+    
+    summary = await compute_pipeline_test_summary(pipeline)
+    logger.info(f"✓ Stored test summary for pipeline {pipeline['id']} ({summary['total']} tests, {len(summary['teams'])} teams)")
+
+# ============ Test History ============
+
+test_rollup_locks = KeyedLocks()  # (project_id, sha) -> lock
+
+def test_key(test: dict) -> tuple:
+    return (test.get('classname', ''), test['name'])
+
+async def record_test_history(pipeline: dict, job: dict, test_results: dict, team: str):
+    """
+    Append a job's test outcomes to the per-test-case history (test_cases) and fold them
+    into the precomputed rollups. Each job is recorded once - claimed atomically through a
+    unique test_history_jobs marker, so concurrent calls for one job can't both record it.
+      test_sha_outcomes: outcome counts per (project, test, sha) - a test that both passed
+                         and failed on one sha is flaky there
+      test_flakiness:    per (project, test) run counts, number of shas seen / flaky shas
+    """
+    project_id = pipeline.get('project_id')
+    sha = pipeline.get('sha')
+    created_at = pipeline.get('created_at') or datetime.now(timezone.utc).isoformat()
+    tests = test_results.get('tests', [])
+    if not tests:
+        return
+    
+    async with DB_SEMAPHORE:
+        claim = await db.test_history_jobs.update_one(
+            {"job_id": job['id']},
+            {"$setOnInsert": {"pipeline_id": pipeline['id'], "recorded_at": datetime.now(timezone.utc).isoformat()}},
+            upsert=True
+        )
+        if claim.upserted_id is None:
+            return
+        # Jobs recorded before the markers existed only have their test_cases
+        if await db.test_cases.find_one({"job_id": job['id']}, {"_id": 1}):
+            return
+    
+    docs = []
+    for test in tests:
+        doc = {
+            "project_id": project_id,
+            "classname": test.get('classname', ''),
+            "name": test['name'],
+            "status": test['status'],
+            "duration": test.get('duration', 0),
+            "created_at": created_at,
+            "sha": sha,
+            "ref": pipeline.get('ref'),
+            "pipeline_id": pipeline['id'],
+            "job_id": job['id'],
+            "job_name": job.get('name'),
+            "team": team
+        }
+        if test.get('failure_message'):
+            doc["failure_message"] = test['failure_message'][:2000]
+        if test.get('skip_message'):
+            doc["skip_message"] = test['skip_message'][:2000]
+        docs.append(doc)
+    
+    try:
+        for offset in range(0, len(docs), 1000):
+            async with DB_SEMAPHORE:
+                await db.test_cases.insert_many(docs[offset:offset + 1000], ordered=False)
+    except Exception:
+        # Release the claim so the job can be recorded again from scratch
+        async with DB_SEMAPHORE:
+            await db.test_cases.delete_many({"job_id": job['id']})
+            await db.test_history_jobs.delete_many({"job_id": job['id']})
+        raise
+    
+    # Outcome counts per test for this job
+    outcomes: Dict[tuple, Dict[str, int]] = {}
+    last_failed: Dict[tuple, str] = {}
+    for test in tests:
+        counts = outcomes.setdefault(test_key(test), {"passed": 0, "failed": 0, "skipped": 0})
+        counts[test['status']] += 1
+        if test['status'] == 'failed':
+            last_failed[test_key(test)] = created_at
+    
+    if not sha:
+        sha = f"pipeline-{pipeline['id']}"
+    
+    # Jobs of the same sha update the same rollup rows - serialize them so flaky transitions are counted once
+    async with test_rollup_locks.hold((project_id, sha)):
+        async with DB_SEMAPHORE:
+            before = await db.test_sha_outcomes.find(
+                {"project_id": project_id, "sha": sha},
+                {"_id": 0, "classname": 1, "name": 1, "passed": 1, "failed": 1}
+            ).to_list(None)
+        before_by_test = {(doc['classname'], doc['name']): doc for doc in before}
+        
+        sha_updates = []
+        flakiness_updates = []
+        for key, counts in outcomes.items():
+            classname, name = key
+            previous = before_by_test.get(key)
+            was_flaky = bool(previous and previous.get('passed') and previous.get('failed'))
+            passed = (previous or {}).get('passed', 0) + counts['passed']
+            failed = (previous or {}).get('failed', 0) + counts['failed']
+            is_flaky = passed > 0 and failed > 0
+            
+            sha_updates.append(UpdateOne(
+                {"project_id": project_id, "classname": classname, "name": name, "sha": sha},
+                {
+                    "$inc": counts,
+                    "$min": {"first_seen": created_at},
+                    "$max": {"last_seen": created_at}
+                },
+                upsert=True
+            ))
+            
+            inc = {
+                "runs": counts['passed'] + counts['failed'] + counts['skipped'],
+                "passed": counts['passed'],
+                "failed": counts['failed'],
+                "skipped": counts['skipped'],
+                "shas_seen": 0 if previous else 1,
+                "shas_flaky": 1 if is_flaky and not was_flaky else 0
+            }
+            update = {"$inc": inc, "$max": {"last_run_at": created_at}, "$set": {"team": team}}
+            if key in last_failed:
+                update["$max"]["last_failed_at"] = last_failed[key]
+            if is_flaky:
+                update["$max"]["last_flaky_at"] = created_at
+            flakiness_updates.append(UpdateOne(
+                {"project_id": project_id, "classname": classname, "name": name},
+                update,
+                upsert=True
+            ))
+        
+        for offset in range(0, len(sha_updates), 1000):
+            async with DB_SEMAPHORE:
+                await db.test_sha_outcomes.bulk_write(sha_updates[offset:offset + 1000], ordered=False)
+                await db.test_flakiness.bulk_write(flakiness_updates[offset:offset + 1000], ordered=False)
+    
+    logger.info(f"✓ Recorded history for {len(docs)} test cases of job {job['id']}")
+
+TEST_CASE_SORTS = {
+    "status": [("status", 1), ("classname", 1), ("name", 1)],  # failures first
+    "name": [("classname", 1), ("name", 1)],
+    "-name": [("classname", -1), ("name", -1)],
+    "duration": [("duration", 1)],
+    "-duration": [("duration", -1)],
+}
+TEST_CASE_PROJECTION = {"_id": 0, "project_id": 0, "sha": 0, "ref": 0, "created_at": 0}
+
+async def backfill_test_cases(pipeline: dict, job_ids: List[int]):
+    """Add cached reports that predate the test history to test_cases"""
+    recorded = set(await db.test_cases.distinct("job_id", {"job_id": {"$in": job_ids}}))
+    missing = [job_id for job_id in job_ids if job_id not in recorded]
+    if not missing:
+        return
+    
+    jobs_by_id = {job['id']: job for job in pipeline.get('jobs', [])}
+    async for doc in db.test_results.find({"job_id": {"$in": missing}}, {"_id": 0}):
+        job = jobs_by_id.get(doc['job_id'], {"id": doc['job_id']})
+        test_results = await expand_test_report(doc['test_results'])
+        await record_test_history(pipeline, job, test_results, doc.get('team') or 'default')
+
+async def page_test_cases(job_ids: List[int], counts: dict, page: int, page_size: int, status: Optional[str],
+                          classname: Optional[str], team: Optional[str], name: Optional[str], sort: str) -> dict:
+    """One page of test cases from test_cases, filtered and sorted in the database"""
+    if sort not in TEST_CASE_SORTS:
+        raise HTTPException(status_code=400, detail=f"Invalid sort '{sort}', expected one of: {', '.join(TEST_CASE_SORTS)}")
+    
+    query = {"job_id": {"$in": job_ids}}
+    if status:
+        query["status"] = status
+    if classname:
+        # Anchored prefix match can use the (job_id, status, classname, name) index
+        query["classname"] = {"$regex": f"^{re.escape(classname)}"}
+    if team:
+        query["team"] = team
+    if name:
+        query["name"] = {"$regex": re.escape(name), "$options": "i"}
+    
+    filtered_total = await db.test_cases.count_documents(query)
+    tests = await db.test_cases.find(query, TEST_CASE_PROJECTION).sort(
+        TEST_CASE_SORTS[sort]
+    ).skip((page - 1) * page_size).limit(page_size).to_list(page_size)
+    
+    return {
+        **counts,
+        "filtered_total": filtered_total,
+        "page": page,
+        "page_size": page_size,
+        "pages": (filtered_total + page_size - 1) // page_size,
+        "tests": tests
+    }
+
+def flakiness_score(rollup: dict) -> float:
+    """Share of the shas a test ran on where it both passed and failed"""
+    return round(rollup.get('shas_flaky', 0) / rollup['shas_seen'], 4) if rollup.get('shas_seen') else 0.0
+
+# ============ Log Analysis ============
+
+# Rules are tried in order - the first rule matching a line classifies it.
+# The defaults reproduce the previous hard-coded patterns (error:/failed are covered
+# by the case-insensitive ERROR/FAILED rules).
+DEFAULT_LOG_RULES = [
+    {"name": "error", "pattern": r"ERROR", "severity": "error", "category": "error"},
+    {"name": "failed", "pattern": r"FAILED", "severity": "error", "category": "failure"},
+    {"name": "exception", "pattern": r"Exception", "severity": "warning", "category": "exception"},
+    {"name": "traceback", "pattern": r"Traceback", "severity": "warning", "category": "exception"},
+    {"name": "fatal", "pattern": r"FATAL", "severity": "warning", "category": "fatal"},
+    {"name": "err_tag", "pattern": r"\[ERR\]", "severity": "warning", "category": "error"},
+]
+LOG_INLINE_BYTES = 256 * 1024  # smaller log pieces aren't worth the trip to the worker pool
+LOG_CHUNK_SIZE = 1024 * 1024  # characters of log text per log_chunks document (before compression)
+LOG_STREAM_READ_BYTES = 256 * 1024  # trace bytes read from GitLab at a time
+LOG_ERROR_LINES_LIMIT = 2000  # error lines kept in processed_logs; error_count has the full number
+LOG_INDEX_FIELDS = ("chunk_lines", "error_line_numbers")  # lookup structures, not part of API responses
+LOG_WORD_RE = re.compile(r"[a-z0-9_]+")  # word boundaries for search; trigrams are taken from these
+LOG_TOKEN_RE = re.compile(r"[a-z][a-z_]{2,23}")  # whole words indexed for search - no digits, at most 24 chars
+LOG_HEX_RE = re.compile(r"[a-f]{8,}")  # hex ids without digits aren't indexed as words either
+LOG_TOKENS_PER_CHUNK = 8000  # a chunk with more index tokens is stored with LOG_UNINDEXED_TOKEN instead
+LOG_UNINDEXED_TOKEN = "*"  # matches every search - the phrase scan decides
+LOG_SEARCH_MAX_CHUNKS = 200  # chunks examined per search page
+LOG_SEARCH_HITS_PER_JOB = 20
+LOG_SNIPPET_CHARS = 120
+LOG_ERROR_CLUSTERS_LIMIT = 500  # distinct fingerprints kept per processed log (counters see all of them)
+LOG_SECTIONS_LIMIT = 1000  # sections kept in a log's outline
+
+# GitLab collapsible sections: "section_start:<unix time>:<name>[options]\r\e[0K<header>"
+LOG_SECTION_RE = re.compile(r"section_(start|end):(\d+):([A-Za-z0-9_.-]+)(?:\[([^\]\r\n]*)\])?\r?")
+LOG_ANSI_RE = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+
+# Variable parts of error lines, replaced in order before fingerprinting
+ERROR_NORMALIZERS = [
+    (re.compile(r"\x1b\[[0-9;?]*[A-Za-z]"), ""),  # ANSI escapes
+    (re.compile(r"\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}(?:[.,]\d+)?(?:Z|[+-]\d{2}:?\d{2})?"), "<ts>"),
+    (re.compile(r"\b\d{1,2}:\d{2}:\d{2}(?:[.,]\d+)?\b"), "<ts>"),
+    (re.compile(r"\b[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}\b", re.IGNORECASE), "<uuid>"),
+    (re.compile(r"\b0x[0-9a-f]+\b", re.IGNORECASE), "<hex>"),
+    (re.compile(r"\b(?=[0-9a-f]*\d)[0-9a-f]{7,}\b", re.IGNORECASE), "<hex>"),
+    (re.compile(r"\b\d{1,3}(?:\.\d{1,3}){3}(?::\d+)?\b"), "<ip>"),
+    (re.compile(r"(?:[A-Za-z]:)?(?:[\\/][\w.@+-]+){2,}[\\/]?"), "<path>"),
+    (re.compile(r"\d+(?:\.\d+)?"), "<n>"),
+    (re.compile(r"\s+"), " "),
+]
+
+LOG_RULE_ESCAPE = re.compile(r"\\([^A-Za-z0-9])")
+LOG_RULE_METACHARACTERS = set(".^$*+?{}[]|()\\")
+
+def log_rule_literal(pattern: str) -> Optional[str]:
+    """The plain text a pattern matches if it has no regex syntax (escaped punctuation allowed)"""
+    text = LOG_RULE_ESCAPE.sub(lambda m: m.group(1), pattern)
+    if LOG_RULE_METACHARACTERS.intersection(LOG_RULE_ESCAPE.sub("", pattern)):
+        return None
+    return text
+
+@functools.lru_cache(maxsize=64)
+def _compile_log_rules(rules_key: str) -> tuple:
+    rules = json.loads(rules_key)
+
+    def rule_regex(rule):
+        return f"(?i:{rule['pattern']})" if rule.get('ignore_case', True) else f"(?:{rule['pattern']})"
+    
+    # Case-insensitive literals are matched against the lowercased text without IGNORECASE,
+    # which lets the regex engine skip ahead on the first character - several times faster
+    literals, regexes = [], []
+    for rule in rules:
+        literal = log_rule_literal(rule['pattern']) if rule.get('ignore_case', True) else None
+        if literal:
+            literals.append(re.escape(literal.lower()))
+        else:
+            regexes.append(rule_regex(rule))
+    
+    scanners = []
+    if literals:
+        scanners.append((re.compile("|".join(literals)), True))
+    if regexes:
+        scanners.append((re.compile("|".join(regexes), re.MULTILINE), False))
+    singles = [re.compile(rule_regex(rule), re.MULTILINE) for rule in rules]
+    return scanners, singles
+
+def compile_log_rules(rules: List[dict]) -> tuple:
+    """
+    (scanners, per_rule) matchers for a rule list. All rules are joined into (at most two)
+    alternations so a block of log text is scanned in one pass each; the per-rule matchers
+    only run on the few lines that matched, to find the rule that classifies them.
+    Compiled once per process. Raises re.error for invalid patterns.
+    """
+    return _compile_log_rules(json.dumps(rules, sort_keys=True))
+
+def matching_line_indexes(text: str, regex) -> List[int]:
+    """0-based indexes of the lines of text that regex matches"""
+    indexes = []
+    pos = index = line_start = 0
+    while True:
+        match = regex.search(text, pos)
+        if not match:
+            return indexes
+        index += text.count('\n', line_start, match.start())
+        indexes.append(index)
+        line_end = text.find('\n', match.start())
+        if line_end < 0:
+            return indexes
+        pos = line_start = line_end + 1
+        index += 1
+
+def new_log_scan_state() -> dict:
+    """State carried between scan_log_block() calls on consecutive blocks of one log"""
+    return {
+        "line_count": 0,  # lines completed in earlier blocks
+        "partial": "",    # unterminated last line of the previous block
+        "recent": [],     # trailing lines kept for before-context
+        "pending": []     # [entry, after-context lines still owed], in log order
+    }
+
+def scan_log_block(block: str, state: dict, rules: List[dict], final: bool = False) -> tuple:
+    """
+    Find the lines of a log block that match the rules. Logs can be fed block by block
+    (the state carries partial lines and context across blocks); pass final=True with the
+    last block. Returns (entries, state) - entries are emitted in log order once their
+    after-context is complete. Pure and picklable, so it can run in the CPU worker pool.
+    """
+    scanners, singles = compile_log_rules(rules)
+    
+    text = state['partial'] + block
+    if final:
+        segment, partial = text, ""
+        lines = segment.split('\n')
+    else:
+        cut = text.rfind('\n') + 1
+        segment, partial = text[:cut], text[cut:]
+        lines = segment.split('\n')[:-1] if segment else []
+    
+    base = state['line_count']
+    pending = state['pending']
+    
+    # After-context owed to matches near the end of earlier blocks
+    for item in pending:
+        if item[1]:
+            taken = lines[:item[1]]
+            item[0]['context_after'].extend(taken)
+            item[1] -= len(taken)
+    
+    candidates = set()
+    for regex, lowered in scanners:
+        candidates.update(matching_line_indexes(segment.lower() if lowered else segment, regex))
+    
+    for line_index in sorted(candidates):
+        line = lines[line_index]
+        
+        # A pattern spanning a line break matches the block but no single line
+        rule = next((rules[i] for i, regex in enumerate(singles) if regex.search(line)), None)
+        if rule:
+            entry = {
+                "line_number": base + line_index + 1,
+                "content": line,
+                "type": rule.get('severity', 'error'),
+                "severity": rule.get('severity', 'error'),
+                "category": rule.get('category', 'error'),
+                "rule": rule['name']
+            }
+            before = rule.get('context_before', 0)
+            if before:
+                first = line_index - before
+                context = lines[max(first, 0):line_index]
+                if first < 0 and state['recent']:
+                    context = state['recent'][first:] + context
+                entry["context_before"] = context
+            after = rule.get('context_after', 0)
+            owed = 0
+            if after:
+                entry["context_after"] = lines[line_index + 1:line_index + 1 + after]
+                owed = after - len(entry["context_after"])
+            pending.append([entry, owed])
+
+    entries = []
+    while pending and (final or pending[0][1] == 0):
+        entries.append(pending.pop(0)[0])
+    
+    keep = max((rule.get('context_before', 0) for rule in rules), default=0)
+    if keep:
+        state['recent'] = lines[-keep:] if len(lines) >= keep else (state['recent'] + lines)[-keep:]
+    state['line_count'] = base + len(lines)
+    state['partial'] = partial[-LOG_CHUNK_SIZE:]  # a line without end (progress output) is matched on its tail
+    state['pending'] = pending
+    return entries, state
+
+def plain_log_text(text: str) -> str:
+    """
+    Log text as a terminal shows it: ANSI escapes and section markers removed, carriage-return
+    overwrites applied. Works line by line, so line numbers are unchanged.
+    """
+    if '\x1b' in text:
+        text = LOG_ANSI_RE.sub("", text)
+    if 'section_' in text:
+        text = LOG_SECTION_RE.sub("", text)
+    if '\r' in text:
+        text = text.replace('\r\n', '\n')
+    if '\r' not in text:
+        return text
+    
+    # Progress output: only what follows the last carriage return of a line stays visible
+    pieces, pos = [], 0
+    while True:
+        cr = text.find('\r', pos)
+        if cr < 0:
+            break
+        line_start = text.rfind('\n', 0, cr) + 1
+        line_end = text.find('\n', cr)
+        if line_end < 0:
+            line_end = len(text)
+        pieces.append(text[pos:line_start])
+        pieces.append(text[line_start:line_end].rstrip('\r').rsplit('\r', 1)[-1])
+        pos = line_end
+    pieces.append(text[pos:])
+    return "".join(pieces)
+
+def new_log_section_state() -> dict:
+    """State carried between scan_log_sections() calls on consecutive pieces of one log"""
+    return {"open": [], "sections": []}
+
+def scan_log_sections(text: str, first_line: int, state: dict) -> dict:
+    """Collect the GitLab section markers of complete log lines (raw text), numbered from first_line"""
+    if 'section_' not in text:
+        return state
+    
+    open_sections = state['open']
+    line_number, pos = first_line, 0
+    for match in LOG_SECTION_RE.finditer(text):
+        line_number += text.count('\n', pos, match.start())
+        pos = match.start()
+        kind, timestamp, name, options = match.groups()
+        
+        if kind == 'start':
+            line_start = text.rfind('\n', 0, match.start()) + 1
+            line_end = text.find('\n', match.end())
+            open_sections.append({
+                "name": name,
+                "header": plain_log_text(text[line_start:line_end if line_end >= 0 else len(text)]).strip()[:200],
+                "depth": len(open_sections),
+                "collapsed": 'collapsed=true' in (options or ''),
+                "start_line": line_number,
+                "started_at": int(timestamp)
+            })
+            continue
+        
+        # Close the innermost open section of that name, and whatever is still open inside it
+        for i in range(len(open_sections) - 1, -1, -1):
+            if open_sections[i]['name'] == name:
+                while len(open_sections) > i:
+                    section = open_sections.pop()
+                    ended_at = int(timestamp) if len(open_sections) == i else None
+                    section.update(
+                        end_line=line_number,
+                        ended_at=ended_at,
+                        duration=ended_at - section['started_at'] if ended_at is not None else None
+                    )
+                    state['sections'].append(section)
+                break
+    return state
+
+def finish_log_sections(state: dict, line_count: int, error_numbers: List[int]) -> List[dict]:
+    """Section outline of a log in order of appearance, with each section's error count"""
+    for section in state['open']:
+        # Never closed (job cancelled or timed out)
+        section.update(end_line=line_count, ended_at=None, duration=None)
+    sections = sorted(state['sections'] + state['open'], key=lambda section: (section['start_line'], section['depth']))
+    
+    for index, section in enumerate(sections):
+        section["index"] = index
+        section["line_count"] = section['end_line'] - section['start_line'] + 1
+        section["error_count"] = (bisect.bisect_right(error_numbers, section['end_line'])
+                                  - bisect.bisect_left(error_numbers, section['start_line']))
+    return sections
+
+def normalize_error_line(line: str) -> str:
+    """Error line with timestamps, ids, hex, addresses, paths and numbers replaced by placeholders"""
+    for pattern, replacement in ERROR_NORMALIZERS:
+        line = pattern.sub(replacement, line)
+    return line.strip()[:500]
+
+def process_log_piece(piece: str, start_line: int, seq: int, final: bool, rules: List[dict],
+                      scan_state: dict, section_state: dict) -> tuple:
+    """
+    The CPU side of log ingestion for one piece of a log (see iter_log_pieces - it may end mid-line):
+    match the rules on the plain text, read the section markers, fingerprint the errors
+    and compress the piece into a log_chunks document. Pure and picklable, so it can run in the
+    worker pool. Returns (chunk, entries, clusters, scan_state, section_state).
+    """
+    continued = not final and not piece.endswith('\n')
+    # Rules see the plain text; section markers are read from the raw text. A piece cut after a
+    # carriage return shows nothing of its last line - the next piece overwrites it.
+    plain = plain_log_text(piece + ' ')[:-1] if continued and piece.endswith('\r') else plain_log_text(piece)
+    entries, scan_state = scan_log_block(plain, scan_state, rules, final)
+    section_state = scan_log_sections(piece, start_line, section_state)
+    
+    clusters = {}
+    for entry in entries:
+        # Same root cause in different jobs -> same fingerprint
+        normalized = normalize_error_line(entry['content'])
+        fingerprint = hashlib.sha1(normalized.encode('utf-8', 'surrogatepass')).hexdigest()
+        entry["fingerprint"] = fingerprint
+        cluster = clusters.get(fingerprint)
+        if cluster is None:
+            cluster = clusters[fingerprint] = {
+                "fingerprint": fingerprint,
+                "normalized": normalized,
+                "sample": entry['content'][:500],
+                "severity": entry['severity'],
+                "category": entry['category'],
+                "count": 0
+            }
+        cluster["count"] += 1
+    
+    if final and seq == 0 and not piece:
+        return None, entries, clusters, scan_state, section_state  # empty log
+    
+    # Lines are numbered like str.split('\\n'), so the last piece also owns the (possibly empty)
+    # text after the final newline. A piece cut mid-line counts that line, and so does the next.
+    chunk = {
+        "seq": seq,
+        "start_line": start_line,
+        "line_count": piece.count('\n') + (1 if final or continued else 0),
+        "size": len(piece),
+        "data": gzip.compress(piece.encode('utf-8', 'surrogatepass'), compresslevel=6),
+        "tokens": log_text_tokens(plain.lower())  # inverted index entries, from the plain form
+    }
+    if plain != piece:
+        chunk["plain"] = gzip.compress(plain.encode('utf-8', 'surrogatepass'), compresslevel=6)
+    if continued:
+        chunk["continued"] = True  # the last line goes on in the next chunk
+    return chunk, entries, clusters, scan_state, section_state
+
+async def iter_log_pieces(blocks):
+    """
+    Regroup text blocks of any size into pieces of at most LOG_CHUNK_SIZE characters, cut after a
+    line break. Yields (piece, final). A line longer than a chunk (e.g. a progress bar redrawn
+    with carriage returns) is cut as well - after its last carriage return in reach, else at the
+    size limit - so memory stays bounded by the chunk size whatever the log looks like.
+    """
+    buffer, pos = "", 0
+    async for block in blocks:
+        buffer = buffer[pos:] + block
+        pos = 0
+        while len(buffer) - pos > LOG_CHUNK_SIZE:
+            limit = pos + LOG_CHUNK_SIZE
+            cut = buffer.rfind('\n', pos, limit) + 1
+            if not cut:
+                # Never between the two characters of a CRLF
+                cut = buffer.rfind('\r', pos, limit - 1) + 1 or (limit - 1 if buffer[limit - 1] == '\r' else limit)
+            yield buffer[pos:cut], False
+            pos = cut
+    yield buffer[pos:], True
+
+def decompress_log_chunk(chunk: dict, plain: bool = False) -> str:
+    data = chunk['plain'] if plain and 'plain' in chunk else chunk['data']
+    return gzip.decompress(data).decode('utf-8', 'surrogatepass')
+
+async def get_log_rules(project_id: Optional[int]) -> tuple:
+    """Log rules for a project: its own, else the global ones, else the defaults. Returns (rules, source)."""
+    if project_id is not None:
+        doc = await db.settings.find_one({"key": "log_rules", "project_id": project_id})
+        if doc:
+            return doc['value'], "project"
+    doc = await db.settings.find_one({"key": "log_rules", "project_id": None})
+    if doc:
+        return doc['value'], "global"
+    return DEFAULT_LOG_RULES, "default"
+
+async def ingest_job_log(pipeline: dict, job: dict, blocks) -> dict:
+    """
+    Analyze a job log (an async iterator of text blocks) with the project's rules and store it as
+    it is read: every piece of about LOG_CHUNK_SIZE characters is scanned and compressed (in the
+    CPU worker pool unless small) and written to log_chunks before the next one is taken, so memory
+    use depends on the chunk size, not the log size. The summary and error lines go to processed_logs.
+    Chunks are written under a new generation; the log switches to it when processed_logs is
+    updated, and only then are the chunks it replaced deleted. A failed ingest removes just its own
+    chunks, so the log stored before stays readable. Returns the processed_logs document.
+    """
+    from array import array
+    from contextlib import aclosing
+    
+    job_id = job['id']
+    pipeline_id = pipeline['id']
+    project_id = pipeline.get('project_id')
+    generation = uuid.uuid4().hex
+    rules, _ = await get_log_rules(project_id)
+    
+    # Search filters are denormalized onto every chunk
+    chunk_context = {
+        "job_id": job_id,
+        "generation": generation,
+        "pipeline_id": pipeline_id,
+        "project_id": project_id,
+        "ref": pipeline.get('ref'),
+        "stage": job.get('stage'),
+        "job_name": job.get('name'),
+        "created_at": job.get('created_at') or pipeline.get('created_at')
+    }
+    
+    scan_state, section_state = new_log_scan_state(), new_log_section_state()
+    error_lines, error_numbers = [], array('I')
+    severity_counts, clusters, sections = {}, {}, []
+    chunk_lines, start_line, size, compressed_size = [], 1, 0, 0
+    
+    try:
+        async with aclosing(blocks), aclosing(iter_log_pieces(blocks)) as pieces:
+            async for piece, final in pieces:
+                args = (piece, start_line, len(chunk_lines), final, rules, scan_state, section_state)
+                if len(piece) < LOG_INLINE_BYTES:
+                    chunk, entries, piece_clusters, scan_state, section_state = process_log_piece(*args)
+                else:
+                    chunk, entries, piece_clusters, scan_state, section_state = await run_cpu_bound(process_log_piece, *args)
+                
+                sections.extend(section_state['sections'])
+                section_state['sections'] = []
+                for entry in entries:
+                    severity_counts[entry['severity']] = severity_counts.get(entry['severity'], 0) + 1
+                    error_numbers.append(entry['line_number'])
+                    if len(error_lines) < LOG_ERROR_LINES_LIMIT:
+                        error_lines.append(entry)
+                for fingerprint, cluster in piece_clusters.items():
+                    if fingerprint in clusters:
+                        clusters[fingerprint]['count'] += cluster['count']
+                    else:
+                        clusters[fingerprint] = cluster
+                
+                if chunk:
+                    async with DB_SEMAPHORE:
+                        await db.log_chunks.insert_one({**chunk_context, **chunk})
+                    chunk_lines.append(start_line)
+                    start_line += chunk['line_count'] - (1 if chunk.get('continued') else 0)
+                    size += chunk['size']
+                    compressed_size += len(chunk['data']) + len(chunk.get('plain', b''))
+    except Exception:
+        # Don't leave a partly written log behind - the previous one is still in use
+        async with DB_SEMAPHORE:
+            await db.log_chunks.delete_many({"job_id": job_id, "generation": generation})
+        raise
+    
+    line_count = start_line - 1
+    sections = finish_log_sections({"open": section_state['open'], "sections": sections}, line_count, error_numbers)
+    if sys.byteorder != 'little':
+        error_numbers.byteswap()
+    clusters = sorted(clusters.values(), key=lambda cluster: cluster['count'], reverse=True)
+    
+    try:
+        await record_error_fingerprints(pipeline, job, clusters)
+    except Exception as e:
+        logger.error(f"Error recording error fingerprints for job {job_id}: {e}")
+    
+    processed = {
+        "job_id": job_id,
+        "pipeline_id": pipeline_id,
+        "error_lines": error_lines,
+        "error_count": len(error_numbers),
+        "error_lines_truncated": len(error_numbers) > LOG_ERROR_LINES_LIMIT,
+        # Every error's line number (uint32 little-endian) so any error can be jumped to
+        "error_line_numbers": error_numbers.tobytes(),
+        "severity_counts": severity_counts,
+        "error_clusters": clusters[:LOG_ERROR_CLUSTERS_LIMIT],
+        "sections": sections[:LOG_SECTIONS_LIMIT],
+        "section_count": len(sections),
+        "line_count": line_count,
+        "size": size,
+        "processed_at": datetime.now(timezone.utc).isoformat(),
+        "encoding": "gzip",
+        "chunk_count": len(chunk_lines),
+        "chunk_lines": chunk_lines,  # line index: first line of each chunk
+        "compressed_size": compressed_size,
+        "generation": generation  # the log_chunks this summary describes
+    }
+    async with DB_SEMAPHORE:
+        previous = await db.processed_logs.find_one_and_update(
+            {"job_id": job_id},
+            {"$set": processed, "$unset": {"raw_log": ""}},  # drop the text of logs cached in the old layout
+            projection={"_id": 0, "generation": 1},
+            upsert=True,
+            return_document=ReturnDocument.BEFORE
         )
+        if previous is not None:
+            # Chunks of logs cached before generations were stored have none (matched by None)
+            await db.log_chunks.delete_many({"job_id": job_id, "generation": previous.get('generation')})
+    
+    try:
+        await record_section_timings(pipeline, job, processed['sections'])
+    except Exception as e:
+        logger.error(f"Error recording section timings for job {job_id}: {e}")
+    return processed
+
+async def cache_job_log(log_text: str, pipeline: dict, job: dict) -> dict:
+    """Analyze and store a log that is already in memory (see ingest_job_log)"""
+    async def blocks():
+        yield log_text
+    return await ingest_job_log(pipeline, job, blocks())
+
+async def fetch_and_cache_job_log(pipeline: dict, job: dict) -> dict:
+    """Stream a job's trace from GitLab straight into ingest_job_log - the whole text is never held in memory"""
+    return await ingest_job_log(pipeline, job, gitlab_service.stream_job_log(pipeline['project_id'], job['id']))
+
+async def record_section_timings(pipeline: dict, job: dict, sections: List[dict]):
+    """One log_section_timings document per finished section of a job, for timing analytics across jobs"""
+    timings = [
+        {
+            "job_id": job['id'],
+            "job_name": job.get('name'),
+            "stage": job.get('stage'),
+            "pipeline_id": pipeline['id'],
+            "project_id": pipeline.get('project_id'),
+            "ref": pipeline.get('ref'),
+            "created_at": job.get('created_at') or pipeline.get('created_at'),
+            "name": section['name'],
+            "depth": section['depth'],
+            "duration": section['duration'],
+            "error_count": section['error_count']
+        }
+        for section in sections if section['duration'] is not None
+    ]
+    async with DB_SEMAPHORE:
+        await db.log_section_timings.delete_many({"job_id": job['id']})
+        if timings:
+            await db.log_section_timings.insert_many(timings)
+
+def log_error_line_numbers(log: dict) -> List[int]:
+    """Line numbers of all errors of a processed log, in order"""
+    packed = log.get('error_line_numbers')
+    if packed is None:
+        return [entry['line_number'] for entry in log.get('error_lines', [])]
+    return list(struct.unpack(f"<{len(packed) // 4}I", packed))
+
+async def read_log_lines(log: dict, from_line: int, count: int, plain: bool = False) -> List[str]:
+    """
+    Lines from_line..from_line+count-1 (1-based) of a processed log, raw or in plain form.
+    Only the chunks covering the window are fetched and decompressed, found through the
+    chunk_lines index.
+    """
+    if 'raw_log' in log:
+        text = plain_log_text(log['raw_log']) if plain else log['raw_log']
+        return text.split('\n')[from_line - 1:from_line - 1 + count]
+    
+    starts = log.get('chunk_lines')
+    if starts is None:
+        # Logs cached before the index was stored - read it from the chunk metadata
+        async with DB_SEMAPHORE:
+            meta = await db.log_chunks.find(
+                {"job_id": log['job_id'], "generation": log.get('generation')}, {"_id": 0, "start_line": 1}
+            ).sort("seq", 1).to_list(None)
+        starts = [chunk['start_line'] for chunk in meta]
+    if not starts:
+        return []
+    
+    # A chunk can end mid-line (its successor starts on the same line), so the window starts
+    # in the last chunk that begins before from_line
+    first_seq = max(bisect.bisect_left(starts, from_line) - 1, 0)
+    last_seq = bisect.bisect_right(starts, from_line + count - 1) - 1
+    async with DB_SEMAPHORE:
+        chunks = await db.log_chunks.find(
+            {"job_id": log['job_id'], "generation": log.get('generation'), "seq": {"$gte": first_seq, "$lte": last_seq}},
+            {"_id": 0}
+        ).sort("seq", 1).to_list(None)
+    if not chunks:
+        return []
+    
+    # Joined, the chunks are lines start_line..end_line of the log (the first may be a tail)
+    first, last = chunks[0], chunks[-1]
+    end_line = last['start_line'] + last['line_count'] - 1
+    lines = "".join(decompress_log_chunk(chunk, plain) for chunk in chunks).split('\n')[:end_line - first['start_line'] + 1]
+    offset = from_line - first['start_line']
+    return lines[offset:offset + count]
+
+def is_log_token(word: str) -> bool:
+    """Whether a whole word is indexed as a search token (ids, hashes and numbers aren't)"""
+    return bool(LOG_TOKEN_RE.fullmatch(word)) and not LOG_HEX_RE.fullmatch(word)
+
+def log_word_trigrams(word: str):
+    """
+    Three character pieces of a word made of letters and '_' (letter first), as '~abc' index tokens.
+    Pieces with digits are left out - hashes and timestamps would add thousands of them.
+    """
+    return (
+        '~' + word[i:i + 3] for i in range(len(word) - 2)
+        if word[i] >= 'a' and word[i + 1] >= '_' and word[i + 2] >= '_'  # '_' sorts after the digits
+    )
+
+def log_text_tokens(text: str) -> List[str]:
+    """
+    Search index entries of lowercased log text: its words (is_log_token) plus the trigrams
+    of every word, so words cut off at the edges of a search phrase can be looked up too.
+    A chunk with more than LOG_TOKENS_PER_CHUNK entries gets [LOG_UNINDEXED_TOKEN] instead,
+    which every search scans.
+    """
+    tokens = set()
+    for word in set(LOG_WORD_RE.findall(text)):
+        if is_log_token(word):
+            tokens.add(word)
+        tokens.update(log_word_trigrams(word))
+        if len(tokens) > LOG_TOKENS_PER_CHUNK:
+            return [LOG_UNINDEXED_TOKEN]
+    return sorted(tokens)
+
+def log_query_tokens(phrase: str) -> List[str]:
+    """
+    Index tokens a phrase match must contain. Words inside the phrase must be whole log words;
+    the first and last word may be cut off in the log line (e.g. "vau" of "vault"), so only
+    their trigrams are required. Whole words come first - they narrow the index scan most.
+    """
+    words, trigrams = [], []
+    for match in LOG_WORD_RE.finditer(phrase):
+        start, end = match.span()
+        if start > 0 and end < len(phrase) and is_log_token(match.group()):
+            words.append(match.group())
+        else:
+            trigrams.extend(log_word_trigrams(match.group()))
+    return list(dict.fromkeys(words + trigrams))
+
+def find_phrase_in_chunk(chunk: dict, phrase: str, limit: int) -> List[dict]:
+    """Lines of a log chunk containing phrase (case-insensitive), with a snippet around the match"""
+    text = decompress_log_chunk(chunk, plain=True)
+    lowered = text.lower()
+    hits = []
+    pos, line_number, line_pos = 0, chunk['start_line'], 0
+    while len(hits) < limit:
+        found = lowered.find(phrase, pos)
+        if found < 0:
+            break
+        line_number += lowered.count('\n', line_pos, found)
+        line_start = lowered.rfind('\n', 0, found) + 1
+        line_end = lowered.find('\n', found)
+        if line_end < 0:
+            line_end = len(text)
         
-        logger.info(f"Successfully pre-cached artifact structure for job {job_id} ({len(files)} files)")
-        return True
+        snippet_start = max(found - LOG_SNIPPET_CHARS // 2, line_start)
+        snippet_end = min(found + len(phrase) + LOG_SNIPPET_CHARS // 2, line_end)
+        hits.append({
+            "line_number": line_number,
+            "snippet": text[snippet_start:snippet_end],
+            "match_start": found - snippet_start,
+            "match_length": len(phrase)
+        })
+        pos = line_pos = line_end + 1
+        line_number += 1
+    return hits
+
+async def load_job_log_text(log: dict) -> str:
+    """Full text of a processed log - reassembled from log_chunks (or the legacy raw_log field)"""
+    if 'raw_log' in log:
+        return log['raw_log']
+    
+    async with DB_SEMAPHORE:
+        chunks = await db.log_chunks.find(
+            {"job_id": log['job_id'], "generation": log.get('generation')}, {"_id": 0, "data": 1}
+        ).sort("seq", 1).to_list(None)
+    return "".join(decompress_log_chunk(chunk) for chunk in chunks)
+
+async def load_processed_log(job_id: int) -> dict:
+    """
+    A job's processed_logs document for the line and section endpoints. Logs not cached yet are
+    fetched from GitLab; logs cached before sections were indexed are processed again from their text.
+    """
+    log = await db.processed_logs.find_one({"job_id": job_id}, {"_id": 0, "raw_log": 0})
+    if log and 'sections' in log:
+        return log
+    
+    pipeline = await db.pipelines.find_one({"jobs.id": job_id}, {"_id": 0})
+    job = next((j for j in pipeline.get('jobs', []) if j['id'] == job_id), None) if pipeline else None
+    if not job:
+        if not log:
+            raise HTTPException(status_code=404, detail="Job not found")
+        # Pipeline no longer synced - serve the log as it is
+        if 'chunk_count' not in log:
+            log = await db.processed_logs.find_one({"job_id": job_id}, {"_id": 0})  # text still inline
+        return log
+    
+    if not log:
+        return await fetch_and_cache_job_log(pipeline, job)
+    text = await load_job_log_text(await db.processed_logs.find_one({"job_id": job_id}, {"_id": 0}))
+    return await cache_job_log(text, pipeline, job)
+
+async def read_log_window(log: dict, from_line: int, count: int, plain: bool) -> dict:
+    """Lines of a log window and the error lines inside it"""
+    lines = await read_log_lines(log, from_line, count, plain)
+    to_line = from_line + len(lines) - 1
+    
+    # Error line numbers are sorted - slice out the window's errors
+    error_numbers = log_error_line_numbers(log)
+    first = bisect.bisect_left(error_numbers, from_line)
+    last = bisect.bisect_right(error_numbers, to_line)
+    details = {entry['line_number']: entry for entry in log.get('error_lines', [])}
+    return {
+        "from_line": from_line,
+        "to_line": to_line,
+        "lines": lines,
+        "errors": [details.get(number, {"line_number": number}) for number in error_numbers[first:last]]
+    }
+
+# ============ Error Fingerprints ============
+
+async def record_error_fingerprints(pipeline: dict, job: dict, clusters: List[dict]):
+    """
+    Maintain per-project fingerprint counters (error_fingerprints) and per-day counters
+    (error_fingerprint_days) from one job's error clusters. A job whose log is processed again
+    only applies the difference to what it contributed before (kept in job_error_fingerprints).
+    """
+    project_id = pipeline.get('project_id')
+    seen_at = job.get('created_at') or pipeline.get('created_at') or datetime.now(timezone.utc).isoformat()
+    day = seen_at[:10]
+    
+    counts = {cluster['fingerprint']: cluster['count'] for cluster in clusters}
+    by_fingerprint = {cluster['fingerprint']: cluster for cluster in clusters}
+    async with DB_SEMAPHORE:
+        previous = await db.job_error_fingerprints.find_one({"job_id": job['id']}, {"_id": 0})
+    old_counts = {f['fingerprint']: f['count'] for f in previous['fingerprints']} if previous else {}
+    old_day = previous['day'] if previous else day
+    
+    totals_ops = []
+    day_ops = []
+    for fingerprint in set(counts) | set(old_counts):
+        occurrences = counts.get(fingerprint, 0) - old_counts.get(fingerprint, 0)
+        jobs = int(fingerprint in counts) - int(fingerprint in old_counts)
+        if not occurrences and not jobs:
+            continue
         
-    except Exception as e:
-        logger.error(f"Error pre-caching artifact structure for job {job_id}: {e}")
-        return False
+        key = {"project_id": project_id, "fingerprint": fingerprint}
+        if fingerprint in counts:
+            cluster = by_fingerprint[fingerprint]
+            totals_ops.append(UpdateOne(key, {
+                "$inc": {"occurrences": occurrences, "jobs": jobs},
+                "$min": {"first_seen": seen_at},
+                "$max": {"last_seen": seen_at},
+                "$setOnInsert": {
+                    "normalized": cluster['normalized'],
+                    "sample": cluster['sample'],
+                    "severity": cluster['severity'],
+                    "category": cluster['category']
+                }
+            }, upsert=True))
+            day_ops.append(UpdateOne({**key, "day": day}, {"$inc": {"occurrences": occurrences, "jobs": jobs}}, upsert=True))
+        else:
+            # The fingerprint no longer appears in this job's log
+            totals_ops.append(UpdateOne(key, {"$inc": {"occurrences": occurrences, "jobs": jobs}}))
+            day_ops.append(UpdateOne({**key, "day": old_day}, {"$inc": {"occurrences": occurrences, "jobs": jobs}}))
+    
+    async with DB_SEMAPHORE:
+        if totals_ops:
+            await db.error_fingerprints.bulk_write(totals_ops, ordered=False)
+            await db.error_fingerprint_days.bulk_write(day_ops, ordered=False)
+        await db.job_error_fingerprints.replace_one({"job_id": job['id']}, {
+            "job_id": job['id'],
+            "job_name": job.get('name'),
+            "pipeline_id": pipeline['id'],
+            "project_id": project_id,
+            "created_at": seen_at,
+            "day": day,
+            "fingerprints": [{"fingerprint": fingerprint, "count": count} for fingerprint, count in counts.items()]
+        }, upsert=True)
+
+# ============ Live Log Tail ============
+
+LIVE_JOB_STATUSES = ('created', 'waiting_for_resource', 'preparing', 'pending', 'running')
+LIVE_TAIL_BACKLOG_LINES = 1000  # recent lines sent to a viewer that joins a running tail
+LIVE_TAIL_EVENT_LINES = 1000    # lines per "lines" event
+LIVE_TAIL_QUEUE_SIZE = 256      # events buffered per viewer before it is dropped
+LIVE_TAIL_KEEPALIVE_SECONDS = 15
+
+class LiveTail:
+    """
+    Follows the trace of one running job: polls GitLab for the bytes past the current offset,
+    decodes them incrementally, runs the log rules on the new lines and fans the results out
+    to every subscribed viewer. One poller per job, however many viewers there are.
+    """
+
+    def __init__(self, project_id: int, job_id: int):
+        self.project_id = project_id
+        self.job_id = job_id
+        self.subscribers = set()
+        self.task = None
+        self.status = None
+        self.poll_seconds = LIVE_TAIL_POLL_SECONDS
+        self.range_ignored = False
+        self._reset()
+
+    def _reset(self):
+        self.offset = 0
+        self.decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        self.scan_state = new_log_scan_state()
+        self.backlog = deque(maxlen=LIVE_TAIL_BACKLOG_LINES)
+        self.recent_errors = deque(maxlen=LIVE_TAIL_BACKLOG_LINES)
+
+    def subscribe(self) -> tuple:
+        """Register a viewer - returns (queue, snapshot of what was already seen)"""
+        queue = asyncio.Queue(maxsize=LIVE_TAIL_QUEUE_SIZE)
+        self.subscribers.add(queue)
+        if self.task is None:
+            self.task = asyncio.create_task(self._run())
+        
+        snapshot = {
+            "job_id": self.job_id,
+            "status": self.status,
+            "from_line": self.scan_state['line_count'] - len(self.backlog) + 1,
+            "lines": list(self.backlog),
+            "errors": list(self.recent_errors)
+        }
+        return queue, snapshot
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self.subscribers.discard(queue)
+        if not self.subscribers:
+            # Last viewer left - stop polling GitLab
+            if self.task:
+                self.task.cancel()
+            if live_tails.get(self.job_id) is self:
+                del live_tails[self.job_id]
+
+    def _publish(self, event: str, data: Optional[dict]):
+        for queue in list(self.subscribers):
+            try:
+                queue.put_nowait((event, data))
+            except asyncio.QueueFull:
+                # A viewer that can't keep up is dropped rather than slowing the others down
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(("overflow", {"detail": "Viewer fell behind, reconnect to resume"}))
+                self.subscribers.discard(queue)
+
+    def _publish_lines(self, lines: List[str], from_line: int):
+        self.backlog.extend(lines)
+        for i in range(0, len(lines), LIVE_TAIL_EVENT_LINES):
+            self._publish("lines", {"from_line": from_line + i, "lines": lines[i:i + LIVE_TAIL_EVENT_LINES]})
+
+    def _consume(self, text: str, final: bool = False):
+        """Publish the lines completed by text and the errors found in them"""
+        pending = self.scan_state['partial'] + text
+        from_line = self.scan_state['line_count'] + 1
+        if final:
+            lines = pending.split('\n')
+        else:
+            lines = pending[:pending.rfind('\n') + 1].split('\n')[:-1]
+        
+        errors, self.scan_state = scan_log_block(text, self.scan_state, self.rules, final=final)
+        if lines:
+            self._publish_lines(lines, from_line)
+        if errors:
+            self.recent_errors.extend(errors)
+            self._publish("errors", {"errors": errors})
+
+    async def _poll(self) -> bool:
+        """Fetch and publish new trace bytes - True if there were any"""
+        async with API_SEMAPHORE:
+            start, data, full = await gitlab_service.fetch_job_log_tail(self.project_id, self.job_id, self.offset)
+        if full:
+            # Every poll downloads the whole trace again - poll less often the longer it runs
+            if not self.range_ignored:
+                self.range_ignored = True
+                logger.warning(f"GitLab ignored the Range request for the trace of job {self.job_id}, backing off live tail polling")
+            self.poll_seconds = min(self.poll_seconds * 2, LIVE_TAIL_MAX_POLL_SECONDS)
+        if start < self.offset:
+            self._reset()
+            self._publish("reset", {"detail": "Trace restarted"})
+        if not data:
+            return False
+        self.offset = start + len(data)
+        self._consume(self.decoder.decode(data))
+        return True
+
+    async def _run(self):
+        try:
+            self.rules, _ = await get_log_rules(self.project_id)
+            while True:
+                if not await self._poll():
+                    async with API_SEMAPHORE:
+                        job = await gitlab_service.fetch_job(self.project_id, self.job_id)
+                    if job.get('status') != self.status:
+                        self.status = job.get('status')
+                        self._publish("status", {"status": self.status})
+                    if self.status not in LIVE_JOB_STATUSES:
+                        # Finished - pick up the last bytes and flush the unterminated last line
+                        await self._poll()
+                        self._consume(self.decoder.decode(b"", final=True), final=True)
+                        self._publish("end", {"status": self.status, "line_count": self.scan_state['line_count']})
+                        break
+                await asyncio.sleep(self.poll_seconds)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"✗ Error tailing log of job {self.job_id}: {e}")
+            self._publish("error", {"detail": str(e)})
+        finally:
+            self._publish("close", None)
+            if live_tails.get(self.job_id) is self:
+                del live_tails[self.job_id]
+
+live_tails: Dict[int, LiveTail] = {}
+
+def get_live_tail(project_id: int, job_id: int) -> LiveTail:
+    tail = live_tails.get(job_id)
+    if tail is None:
+        tail = live_tails[job_id] = LiveTail(project_id, job_id)
+    return tail
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def stop_live_tails():
+    for tail in list(live_tails.values()):
+        if tail.task:
+            tail.task.cancel()
+    live_tails.clear()
+
+# ============ Pipeline Stats ============
+
+# Counters kept per project (pipeline_stats) and per project and creation hour
+# (pipeline_stats_hourly), updated as the sync stores pipelines
+PIPELINE_STATUSES = ["created", "waiting_for_resource", "preparing", "pending", "running",
+                     "success", "failed", "canceled", "skipped", "manual", "scheduled"]
+STATS_WINDOWS = {"24h": timedelta(hours=24), "7d": timedelta(days=7), "30d": timedelta(days=30)}
+STATS_REBUILD_BATCH_SIZE = 5000  # pipelines per cursor batch while recounting
+enabled_projects_cache = None
+
+def stats_hour(created_at: Optional[str]) -> str:
+    """UTC hour bucket of a pipeline's creation time, e.g. 2024-05-01T13"""
+    try:
+        created = datetime.fromisoformat(created_at.replace('Z', '+00:00'))
+        if created.tzinfo is None:
+            created = created.replace(tzinfo=timezone.utc)
+    except (AttributeError, ValueError):
+        created = datetime.now(timezone.utc)
+    return created.astimezone(timezone.utc).strftime("%Y-%m-%dT%H")
+
+async def get_enabled_project_ids() -> List[int]:
+    """Enabled projects setting, read once per process and refreshed when it is updated"""
+    global enabled_projects_cache
+    if enabled_projects_cache is None:
+        doc = await db.settings.find_one({"key": "enabled_projects"})
+        enabled_projects_cache = doc.get("value", []) if doc else []
+    return enabled_projects_cache
+
+async def record_pipeline_status(pipeline: dict, previous: Optional[dict]):
+    """
+    Apply one stored pipeline to the counters. previous is the pipeline document as it was
+    before the write (None for a new pipeline) - only a new pipeline or a status change counts.
+    """
+    status = pipeline.get('status') or 'unknown'
+    if previous is not None and previous.get('status') == status:
+        return
+    
+    inc = {f"statuses.{status}": 1}
+    if previous is None:
+        inc["total"] = 1
+    else:
+        inc[f"statuses.{previous.get('status') or 'unknown'}"] = -1
+    
+    # A pipeline stays in the bucket of its creation hour through all its status changes
+    created_at = (previous or {}).get('created_at') or pipeline.get('created_at')
+    update = {"$inc": inc, "$set": {"project_name": pipeline.get('project_name')}}
+    async with DB_SEMAPHORE:
+        await db.pipeline_stats.update_one({"project_id": pipeline['project_id']}, update, upsert=True)
+        await db.pipeline_stats_hourly.update_one(
+            {"project_id": pipeline['project_id'], "hour": stats_hour(created_at)},
+            update,
+            upsert=True
+        )
+
+async def rebuild_pipeline_stats() -> int:
+    """
+    Recount all counters from the pipelines collection in one batched scan - only the counters
+    are held in memory, never the pipelines. Returns the pipelines counted.
+    """
+    totals, hourly, counted = {}, {}, 0
+    async for pipeline in db.pipelines.find(
+        {}, {"_id": 0, "project_id": 1, "project_name": 1, "status": 1, "created_at": 1},
+        batch_size=STATS_REBUILD_BATCH_SIZE
+    ):
+        counted += 1
+        project_id= pipeline.get('project_id')
+        status = pipeline.get('status') or 'unknown'
+        for key, counters in (((project_id,), totals), ((project_id, stats_hour(pipeline.get('created_at'))), hourly)):
+            counter = counters.setdefault(key, {"total": 0, "statuses": {}, "project_name": pipeline.get('project_name')})
+            counter["total"] += 1
+            counter["statuses"][status] = counter["statuses"].get(status, 0) + 1
+    
+    async with DB_SEMAPHORE:
+        await db.pipeline_stats.delete_many({})
+        await db.pipeline_stats_hourly.delete_many({})
+        if totals:
+            await db.pipeline_stats.insert_many([{"project_id": key[0], **counter} for key, counter in totals.items()])
+            await db.pipeline_stats_hourly.insert_many([{"project_id": key[0], "hour": key[1], **counter} for key, counter in hourly.items()])
+        await db.settings.update_one(
+            {"key": "pipeline_stats"},
+            {"$set": {"value": {"rebuilt_at": datetime.now(timezone.utc).isoformat(), "pipelines": counted}}},
+            upsert=True
+        )
+    logger.info(f"✓ Rebuilt pipeline stats from {counted} pipelines")
+    return counted
+
+def summarize_pipeline_counts(total: int, statuses: dict, status: Optional[str] = None) -> dict:
+    """The /stats counts for one set of counters, optionally narrowed to one status"""
+    if status:
+        statuses = {status: statuses.get(status, 0)}
+        total = statuses[status]
+    success = statuses.get('success', 0)
+    return {
+        "total": total,
+        "success": success,
+        "failed": statuses.get('failed', 0),
+        "running": statuses.get('running', 0),
+        "pending": statuses.get('pending', 0),
+        "success_rate": round(success / total * 100, 2) if total > 0 else 0,
+        "statuses": {key: value for key, value in statuses.items() if value}
+    }
 
 # ============ Background Scheduler ============
 
 # Rate limiting semaphores for parallel processing
 API_SEMAPHORE = asyncio.Semaphore(20)  # Max 20 concurrent API calls to GitLab
 DB_SEMAPHORE = asyncio.Semaphore(50)   # Max 50 concurrent DB operations
+DOWNLOAD_SEMAPHORE = asyncio.Semaphore(MAX_CONCURRENT_DOWNLOADS)  # Full archive downloads in flight
+
+# Job statuses that will never change again (retries create a new job)
+TERMINAL_JOB_STATUSES = ['success', 'failed', 'canceled', 'skipped']
+TEST_STAGES = ['test', 'ci', 'system_tests', 'static_analysis']
+
+def required_job_products(job: dict) -> List[str]:
+    """Derived products pre_cache_job_data builds for a job in its current status"""
+    job_status = job['status']
+    products = []
+    if job_status in ['success', 'failed', 'canceled']:
+        products.append('logs')
+    if job_status in ['success', 'failed'] and job.get('stage', '') in TEST_STAGES:
+        products.append('tests')
+    if job_status in ['success', 'failed']:
+        products.append('artifacts')
+    return products
+
+def is_product_cached(manifest: Optional[dict], product: str, now: datetime) -> bool:
+    """True if the manifest says the product exists, or was confirmed absent within the negative TTL"""
+    entry = (manifest or {}).get('products', {}).get(product)
+    if not entry:
+        return False
+    if entry['state'] == 'present':
+        return True
+    return entry['state'] == 'absent' and entry.get('expires_at', '') > now.isoformat()
+
+async def record_job_product(job: dict, project_id: int, pipeline_id: int, product: str, state: str, **extra):
+    """Record in the job manifest whether a derived product exists ('present') or not ('absent')"""
+    now = datetime.now(timezone.utc)
+    entry = {"state": state, "checked_at": now.isoformat(), **extra}
+    if state == 'absent':
+        # Negative results expire so that late or transient misses get retried
+        entry["expires_at"] = (now + timedelta(seconds=NEGATIVE_CACHE_TTL)).isoformat()
+    
+    async with DB_SEMAPHORE:
+        await db.job_manifests.update_one(
+            {"job_id": job['id']},
+            {"$set": {
+                "job_id": job['id'],
+                "project_id": project_id,
+                "pipeline_id": pipeline_id,
+                "status": job['status'],
+                "terminal": job['status'] in TERMINAL_JOB_STATUSES,
+                f"products.{product}": entry,
+                "updated_at": now.isoformat()
+            }},
+            upsert=True
+        )
 
-async def pre_cache_job_data(project_id: int, job: dict, pipeline_id: int):
+async def pre_cache_job_data(pipeline: dict, job: dict, manifest: Optional[dict] = None):
     """Pre-cache all data for a single job (logs, tests, artifacts) in parallel"""
+    project_id = pipeline['project_id']
+    project_name = pipeline.get('project_name', '')
+    pipeline_id = pipeline['id']
     job_id = job['id']
     job_status = job['status']
     job_name = job['name']
-    job_stage = job.get('stage', '')
+    
+    # A manifest written for an earlier status says nothing about the current one
+    if manifest and manifest.get('status') != job_status:
+        async with DB_SEMAPHORE:
+            await db.job_manifests.update_one(
+                {"job_id": job_id},
+                {"$unset": {"products": ""}, "$set": {"status": job_status}}
+            )
+        manifest = None
+    
+    now = datetime.now(timezone.utc)
+    pending = [p for p in required_job_products(job) if not is_product_cached(manifest, p, now)]
+    
+    # Keep the artifact list on the job even when nothing has to be fetched again
+    artifacts_entry = (manifest or {}).get('products', {}).get('artifacts')
+    if artifacts_entry and 'artifacts' not in pending:
+        job['artifacts'] = artifacts_entry.get('artifacts', [])
+    
+    if not pending:
+        return
     
     tasks = []
     
     # Task 1: Pre-cache logs for completed jobs
-    if job_status in ['success', 'failed', 'canceled']:
+    if 'logs' in pending:
         async def cache_logs():
             try:
                 async with API_SEMAPHORE:
-                    logs = await gitlab_service.fetch_job_logs(project_id, job_id)
-                processed_log = process_logs(logs, job_id, pipeline_id)
-                async with DB_SEMAPHORE:
-                    await db.processed_logs.update_one(
-                        {"job_id": job_id},
-                        {"$set": processed_log},
-                        upsert=True
-                    )
+                    await fetch_and_cache_job_log(pipeline, job)
+                await record_job_product(job, project_id, pipeline_id, 'logs', 'present')
                 logger.info(f"✓ Cached logs for job {job_id} ({job_name})")
             except Exception as e:
                 logger.error(f"✗ Error caching logs for job {job_id}: {e}")
         
         tasks.append(cache_logs())
     
-    # Task 2: Pre-cache test results for test/CI stages
-    if job_status in ['success', 'failed'] and job_stage in ['test', 'ci', 'system_tests', 'static_analysis']:
+    # Task 2: Pre-cache test results for test/CI stages. The artifact tree of a test job
+    # is built from the same archive download instead of a separate Range parse.
+    if 'tests' in pending:
         async def cache_tests():
             try:
+                artifacts = None
+                if 'artifacts' in pending:
+                    async with API_SEMAPHORE:
+                        artifacts = await gitlab_service.fetch_job_artifacts(project_id, job_id)
+                    job['artifacts'] = artifacts  # Store in job data
+                    if not artifacts:
+                        await record_job_product(job, project_id, pipeline_id, 'artifacts', 'absent', artifacts=artifacts)
+                        await record_job_product(job, project_id, pipeline_id, 'tests', 'absent')
+                        return
+                
                 async with API_SEMAPHORE:
-                    test_results = await gitlab_service.fetch_job_junit_report(project_id, job_id)
+                    ingestion = await ingest_job_artifacts(project_id, job_id, project_name, artifact_size_of(job))
+                
+                test_results = ingestion['test_results'] if ingestion else None
                 if test_results and test_results.get('total', 0) > 0:
-                    async with DB_SEMAPHORE:
-                        await db.test_results.update_one(
-                            {"job_id": job_id},
-                            {"$set": {
-                                "job_id": job_id,
-                                "pipeline_id": pipeline_id,
-                                "test_results": test_results,
-                                "cached_at": datetime.now(timezone.utc).isoformat()
-                            }},
-                            upsert=True
-                        )
+                    await save_job_test_results(pipeline, job, test_results, ingestion['team'])
+                    await record_job_product(job, project_id, pipeline_id, 'tests', 'present', total=test_results['total'])
                     logger.info(f"✓ Cached tests for job {job_id} ({test_results['total']} tests)")
+                else:
+                    # Remember that there is no report so the archive isn't downloaded again every cycle
+                    await record_job_product(job, project_id, pipeline_id, 'tests', 'absent')
+                
+                if ingestion and 'artifacts' in pending:
+                    await index_artifact_tree(job_id, ingestion['files'])
+                    await record_job_product(job, project_id, pipeline_id, 'artifacts', 'present', artifacts=artifacts)
+                    logger.info(f"✓ Cached artifacts for job {job_id} ({ingestion['archive_size']} bytes)")
             except Exception as e:
                 logger.error(f"✗ Error caching tests for job {job_id}: {e}")
         
         tasks.append(cache_tests())
     
-    # Task 3: Fetch artifacts and pre-cache structure
-    if job_status in ['success', 'failed']:
+    # Task 3: Fetch artifacts and pre-cache structure (test jobs are handled by Task 2)
+    if 'artifacts' in pending and 'tests' not in pending:
         async def cache_artifacts():
             try:
                 async with API_SEMAPHORE:
@@ -874,11 +3342,13 @@ async def pre_cache_job_data(project_id: int, job: dict, pipeline_id: int):
                 job['artifacts'] = artifacts  # Store in job data
                 
                 # Pre-cache artifact structure for instant browsing
-                if artifacts and len(artifacts) > 0:
-                    artifact_size = artifacts[0].get('size', 0)
-                    if artifact_size > 0:
-                        await pre_cache_artifact_structure(project_id, job_id, artifact_size)
+                artifact_size = artifacts[0].get('size', 0) if artifacts else 0
+                if artifact_size > 0:
+                    if await pre_cache_artifact_structure(project_id, job_id, artifact_size):
+                        await record_job_product(job, project_id, pipeline_id, 'artifacts', 'present', artifacts=artifacts)
                         logger.info(f"✓ Cached artifacts for job {job_id} ({artifact_size} bytes)")
+                else:
+                    await record_job_product(job, project_id, pipeline_id, 'artifacts', 'absent', artifacts=artifacts)
             except Exception as e:
                 logger.error(f"✗ Error caching artifacts for job {job_id}: {e}")
         
@@ -899,20 +3369,43 @@ async def process_pipeline(pipeline: dict, project_id: int, project_name: str):
         # Pre-cache data for all jobs in parallel (with concurrency limit)
         jobs = pipeline.get('jobs', [])
         if jobs:
+            # Load every job's manifest in one query so finished jobs can be skipped
+            async with DB_SEMAPHORE:
+                manifests = await db.job_manifests.find(
+                    {"job_id": {"$in": [job['id'] for job in jobs]}},
+                    {"_id": 0}
+                ).to_list(None)
+            manifests_by_job = {m['job_id']: m for m in manifests}
+            
             # Process jobs in batches to avoid overwhelming the system
             batch_size = 20
             for i in range(0, len(jobs), batch_size):
                 batch = jobs[i:i+batch_size]
-                job_tasks = [pre_cache_job_data(project_id, job, pipeline_id) for job in batch]
+                job_tasks = [
+                    pre_cache_job_data(pipeline, job, manifests_by_job.get(job['id']))
+                    for job in batch
+                ]
                 await asyncio.gather(*job_tasks, return_exceptions=True)
         
-        # Store pipeline in DB
+        # Store pipeline in DB - the previous status comes back with the same round trip
         async with DB_SEMAPHORE:
-            await db.pipelines.update_one(
+            previous = await db.pipelines.find_one_and_update(
                 {"id": pipeline_id},
                 {"$set": pipeline},
-                upsert=True
+                projection={"_id": 0, "status": 1, "created_at": 1},
+                upsert=True,
+                return_document=ReturnDocument.BEFORE
             )
+        try:
+            await record_pipeline_status(pipeline, previous)
+        except Exception as e:
+            logger.error(f"Error updating pipeline stats for pipeline {pipeline_id}: {e}")
+        
+        # Finished pipelines get their test aggregate precomputed from the job results cached above
+        try:
+            await refresh_pipeline_test_summary(pipeline)
+        except Exception as e:
+            logger.error(f"Error storing test summary for pipeline {pipeline_id}: {e}")
         
         return True
     except Exception as e:
@@ -927,32 +3420,32 @@ async def process_project(project: dict, date_threshold: str):
         
         logger.info(f"📦 Fetching pipelines for: {project_name} (ID: {project_id})")
         
-        # Fetch pipelines for the default branch
-        async with API_SEMAPHORE:
-            pipelines = await gitlab_service.fetch_pipelines(
-                project_id, 
-                ref=DEFAULT_BRANCH,
-                updated_after=date_threshold
-            )
-        
-        logger.info(f"Found {len(pipelines)} pipelines for {project_name}")
-        
-        if not pipelines:
-            return 0
-        
         # Process all pipelines in parallel (with concurrency limit)
         pipeline_semaphore = asyncio.Semaphore(10)  # Max 10 pipelines per project concurrently
-        
+
         async def process_with_limit(pipeline):
             async with pipeline_semaphore:
                 return await process_pipeline(pipeline, project_id, project_name)
         
-        pipeline_tasks = [process_with_limit(pipeline) for pipeline in pipelines]
+        # Start processing each pipeline of the default branch as soon as its details arrive
+        pipeline_tasks = []
+        async for pipeline in gitlab_service.iter_pipelines(
+            project_id,
+            ref=DEFAULT_BRANCH,
+            updated_after=date_threshold
+        ):
+            pipeline_tasks.append(asyncio.create_task(process_with_limit(pipeline)))
+        
+        logger.info(f"Found {len(pipeline_tasks)} pipelines for {project_name}")
+        
+        if not pipeline_tasks:
+            return 0
+        
         results = await asyncio.gather(*pipeline_tasks, return_exceptions=True)
         
         # Count successful pipelines
         success_count = sum(1 for r in results if r is True)
-        logger.info(f"✓ Processed {success_count}/{len(pipelines)} pipelines for {project_name}")
+        logger.info(f"✓ Processed {success_count}/{len(pipeline_tasks)} pipelines for {project_name}")
         
         return success_count
         
@@ -1010,27 +3503,43 @@ async def sync_gitlab_data():
         
         # Collect all pipelines from all projects first
         all_pipelines = []
+        project_windows = {}  # project_id -> (sync_state, is_full_reconcile)
+        outcomes = {}  # project_id -> [(updated_at, pipeline_id, success)]
         for project in projects_to_fetch:
             project_id = project["id"]
             project_name = project.get('name', project.get('path', 'Unknown'))
             sync_progress["current_project"] = project_name
             
             try:
-                logger.info(f"📦 Fetching pipelines for: {project_name} (ID: {project_id})")
-                async with API_SEMAPHORE:
-                    pipelines = await gitlab_service.fetch_pipelines(
-                        project_id, 
-                        ref=DEFAULT_BRANCH,
-                        updated_after=date_threshold
-                    )
-                
-                logger.info(f"Found {len(pipelines)} pipelines for {project_name}")
-                
-                # Add project info to each pipeline
-                for pipeline in pipelines:
+                # Only ask for pipelines updated since the project's watermark, except on full reconciles
+                updated_after, state, full_reconcile = await get_sync_window(project_id, date_threshold, start_time)
+                mode = "full reconcile" if full_reconcile else f"incremental since {updated_after}"
+                logger.info(f"📦 Fetching pipelines for: {project_name} (ID: {project_id}, {mode})")
+                found = 0
+                skipped = 0
+                failed_details = []
+                async for pipeline in gitlab_service.iter_pipelines(
+                    project_id,
+                    ref=DEFAULT_BRANCH,
+                    updated_after=updated_after,
+                    failed=failed_details
+                ):
+                    if not full_reconcile and is_behind_watermark(pipeline, state):
+                        skipped += 1
+                        continue
+                    
+                    # Add project info to each pipeline
                     pipeline['project_id'] = project_id
                     pipeline['project_name'] = project_name
                     all_pipelines.append(pipeline)
+                    found += 1
+                    sync_progress["total_pipelines"] = len(all_pipelines)
+                
+                project_windows[project_id] = (state, full_reconcile)
+                # A pipeline whose details couldn't be fetched caps the watermark like one that failed to store
+                outcomes[project_id] = [(updated_at, pipeline_id, False) for updated_at, pipeline_id in failed_details]
+                logger.info(f"Found {found} pipelines for {project_name}" + (f" ({skipped} already synced)" if skipped else "")
+                            + (f", {len(failed_details)} failed" if failed_details else ""))
             except Exception as e:
                 logger.error(f"Error fetching pipelines for project {project_id}: {e}")
                 continue
@@ -1047,12 +3556,13 @@ async def sync_gitlab_data():
         
         # Process initial pipelines in parallel
         pipeline_semaphore = asyncio.Semaphore(10)
-        
+
         async def process_with_limit(pipeline):
             async with pipeline_semaphore:
                 result = await process_pipeline(pipeline, pipeline['project_id'], pipeline['project_name'])
                 if result:
                     sync_progress["cached_pipelines"] += 1
+                outcomes.setdefault(pipeline['project_id'], []).append((pipeline.get('updated_at'), pipeline['id'], result is True))
                 return result
         
         initial_tasks = [process_with_limit(pipeline) for pipeline in initial_pipelines]
@@ -1071,6 +3581,13 @@ async def sync_gitlab_data():
             remaining_tasks = [process_with_limit(pipeline) for pipeline in remaining_pipelines]
             await asyncio.gather(*remaining_tasks, return_exceptions=True)
         
+        # Persist each project's watermark so the next cycle only fetches what changed
+        for project_id, (state, full_reconcile) in project_windows.items():
+            try:
+                await advance_sync_watermark(project_id, state, outcomes.get(project_id, []), full_reconcile, start_time)
+            except Exception as e:
+                logger.error(f"Error saving sync watermark for project {project_id}: {e}")
+
         elapsed_time = (datetime.now(timezone.utc) - start_time).total_seconds()
         logger.info(f"✅ Full sync complete! Processed {sync_progress['cached_pipelines']} pipelines in {elapsed_time:.1f}s")
         logger.info(f"⚡ Average: {sync_progress['cached_pipelines']/elapsed_time:.1f} pipelines/sec")
@@ -1096,47 +3613,79 @@ async def continuous_sync():
             logger.error(f"Error in continuous sync: {e}")
             await asyncio.sleep(FETCH_INTERVAL)
 
-def process_logs(log_text: str, job_id: int, pipeline_id: int) -> dict:
-    """Process logs to highlight errors"""
-    lines = log_text.split('\n')
-    error_lines = []
-    
-    error_patterns = [
-        r'ERROR',
-        r'FAILED',
-        r'Exception',
-        r'Traceback',
-        r'FATAL',
-        r'\[ERR\]',
-        r'error:',
-        r'failed'
-    ]
-    
-    for idx, line in enumerate(lines):
-        for pattern in error_patterns:
-            if re.search(pattern, line, re.IGNORECASE):
-                error_lines.append({
-                    "line_number": idx + 1,
-                    "content": line,
-                    "type": "error" if "ERROR" in line.upper() or "FAILED" in line.upper() else "warning"
-                })
-                break
-    
-    return {
-        "job_id": job_id,
-        "pipeline_id": pipeline_id,
-        "raw_log": log_text,
-        "error_lines": error_lines,
-        "processed_at": datetime.now(timezone.utc).isoformat()
-    }
-
 scheduler = AsyncIOScheduler()
 
+async def ensure_indexes():
+    """Create the indexes the sync and API lookups rely on (no-op if they already exist)"""
+    await db.sync_state.create_index("project_id", unique=True)
+    await db.job_manifests.create_index("job_id", unique=True)
+    # Nodes of an archive indexed again are written as a new generation next to the current one
+    try:
+        await db.artifact_tree.drop_index("job_id_1_path_1_page_1")  # unique index from before generations
+    except OperationFailure:
+        pass
+    await db.artifact_tree.create_index([("job_id", 1), ("generation", 1), ("path", 1), ("page", 1)], unique=True)
+    await db.artifact_trees.create_index("job_id", unique=True)
+    await db.pipeline_test_summaries.create_index("pipeline_id", unique=True)
+    await db.pipeline_test_summaries.create_index("job_ids")
+    await db.test_cases.create_index([("project_id", 1), ("classname", 1), ("name", 1), ("created_at", -1)])
+    await db.test_cases.create_index([("job_id", 1), ("status", 1), ("classname", 1), ("name", 1)])
+    await db.test_cases.create_index([("job_id", 1), ("duration", -1)])
+    await db.test_history_jobs.create_index("job_id", unique=True)
+    await db.test_sha_outcomes.create_index([("project_id", 1), ("sha", 1), ("classname", 1), ("name", 1)], unique=True)
+    await db.test_sha_outcomes.create_index([("project_id", 1), ("classname", 1), ("name", 1), ("last_seen", -1)])
+    await db.test_flakiness.create_index([("project_id", 1), ("classname", 1), ("name", 1)], unique=True)
+    await db.test_flakiness.create_index([("project_id", 1), ("shas_flaky", -1), ("last_flaky_at", -1)])
+    await db.test_messages.create_index("hash", unique=True)
+    await db.processed_logs.create_index("job_id")
+    await db.processed_logs.create_index("pipeline_id")
+    # A log stored again writes a new generation of chunks next to the current one
+    try:
+        await db.log_chunks.drop_index("job_id_1_seq_1")  # unique index from before generations
+    except OperationFailure:
+        pass
+    await db.log_chunks.create_index([("job_id", 1), ("generation", 1), ("seq", 1)], unique=True)
+    # Search: project + one token, then the result order (searches across projects ask for each
+    # project id). Phrases without tokens use the plain order index.
+    try:
+        await db.log_chunks.drop_index("tokens_1_created_at_-1_job_id_-1_seq_1")
+    except OperationFailure:
+        pass
+    await db.log_chunks.create_index([("project_id", 1), ("tokens", 1), ("created_at", -1), ("job_id", -1), ("seq", 1)])
+    await db.log_chunks.create_index([("created_at", -1), ("job_id", -1), ("seq", 1)])
+    await db.pipeline_stats.create_index("project_id", unique=True)
+    await db.pipeline_stats_hourly.create_index([("project_id", 1), ("hour", 1)], unique=True)
+    await db.pipeline_stats_hourly.create_index("hour")
+    await db.log_section_timings.create_index("job_id")
+    await db.log_section_timings.create_index([("project_id", 1), ("created_at", -1)])
+    await db.error_fingerprints.create_index([("project_id", 1), ("fingerprint", 1)], unique=True)
+    await db.error_fingerprint_days.create_index([("project_id", 1), ("day", 1), ("fingerprint", 1)], unique=True)
+    await db.error_fingerprint_days.create_index([("project_id", 1), ("fingerprint", 1), ("day", 1)])
+    await db.job_error_fingerprints.create_index("job_id", unique=True)
+    await db.job_error_fingerprints.create_index([("project_id", 1), ("fingerprints.fingerprint", 1), ("created_at", -1)])
+
 @app.on_event("startup")
 async def startup_event():
     logger.info("Backend startup initiated")
     logger.info(f"Configuration: Namespace='{GITLAB_NAMESPACE}', Branch='{DEFAULT_BRANCH}', Fetch Interval={FETCH_INTERVAL}s")
     
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        logger.error(f"Error creating database indexes: {e}")
+    
+    try:
+        artifact_blob_cache.cleanup()
+    except Exception as e:
+        logger.error(f"Error cleaning up artifact blob cache: {e}")
+    
+    # Counters are maintained by the sync from here on; count existing pipelines once, before it starts
+    try:
+        if not await db.settings.find_one({"key": "pipeline_stats"}):
+            await rebuild_pipeline_stats()
+    except Exception as e:
+        logger.error(f"Error building pipeline stats: {e}")
+    
     # Trigger initial sync on startup
     import asyncio
     asyncio.create_task(sync_gitlab_data())
@@ -1150,6 +3699,9 @@ async def startup_event():
 async def shutdown_event():
     global background_sync_running
     background_sync_running = False
+    stop_live_tails()
+    await gitlab_service.aclose()
+    shutdown_cpu_pool()
     scheduler.shutdown()
     client.close()
 
@@ -1239,54 +3791,329 @@ async def get_pipeline(pipeline_id: int):
     return pipeline
 
 @api_router.get("/pipelines/{pipeline_id}/logs")
-async def get_pipeline_logs(pipeline_id: int, job_id: Optional[int] = Query(None)):
+async def get_pipeline_logs(
+    pipeline_id: int,
+    job_id: Optional[int] = Query(None),
+    include_text: bool = Query(True, description="With job_id: false leaves out raw_log (the section outline is always included)")
+):
+    """
+    With job_id: one job's processed log including its full text (raw_log).
+    Without: summaries of the pipeline's processed logs (no text, no error lines).
+    """
     if job_id:
-        log = await db.processed_logs.find_one({"job_id": job_id}, {"_id": 0})
+        log = await db.processed_logs.find_one({"job_id": job_id}, {"_id": 0, **{field: 0 for field in LOG_INDEX_FIELDS}})
         if not log:
             # Fetch fresh logs
             pipeline = await db.pipelines.find_one({"id": pipeline_id}, {"_id": 0})
             if pipeline:
                 for job in pipeline.get('jobs', []):
                     if job['id'] == job_id:
-                        logs = await gitlab_service.fetch_job_logs(pipeline['project_id'], job_id)
-                        log = process_logs(logs, job_id, pipeline_id)
-                        await db.processed_logs.insert_one(log)
-                        log.pop('_id', None)
+                        log = await fetch_and_cache_job_log(pipeline, job)
+                        log = {key: value for key, value in log.items() if key not in LOG_INDEX_FIELDS}
+                        if include_text:
+                            log["raw_log"] = await load_job_log_text(log)
                         return log
             raise HTTPException(status_code=404, detail="Logs not found")
+        if include_text:
+            log["raw_log"] = await load_job_log_text(log)
+        else:
+            log.pop("raw_log", None)
         return log
     
-    # Return all logs for pipeline
-    logs = await db.processed_logs.find({"pipeline_id": pipeline_id}, {"_id": 0}).to_list(100)
-    return logs
+    # Summaries of all logs for pipeline
+    logs = await db.processed_logs.find(
+        {"pipeline_id": pipeline_id},
+        {"_id": 0, "raw_log": 0, "error_lines": 0, **{field: 0 for field in LOG_INDEX_FIELDS}}
+    ).to_list(100)
+    return logs
+
+@api_router.get("/logs/search")
+async def search_logs(
+    q: str = Query(..., min_length=3, description="Phrase to find (case-insensitive)"),
+    project_id: Optional[int] = Query(None),
+    ref: Optional[str] = Query(None, description="Branch"),
+    stage: Optional[str] = Query(None),
+    since: Optional[str] = Query(None, description="ISO date, default: `days` ago"),
+    until: Optional[str] = Query(None, description="ISO date"),
+    days: int = Query(7, ge=1, le=90),
+    cursor: Optional[str] = Query(None, description="next_cursor of the previous page"),
+    page_size: int = Query(50, ge=1, le=200)
+):
+    """
+    Find job log lines containing a phrase. Chunks are selected through their token index
+    (the words and edge-word trigrams of the phrase, plus chunks too varied to index) and the
+    filters, newest first; the text of
+    a chunk is only loaded and decompressed to confirm the phrase and cut snippets. Pages are
+    keyset-paginated, each examines at most LOG_SEARCH_MAX_CHUNKS chunks. At most
+    LOG_SEARCH_HITS_PER_JOB hits per job.
+    """
+    phrase = q.lower()
+    query = {"created_at": {"$gte": since or (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()}}
+    if until:
+        query["created_at"]["$lte"] = until
+    conditions = []
+    tokens = log_query_tokens(phrase)
+    if tokens:
+        conditions.append({"$or": [{"tokens": {"$all": tokens}}, {"tokens": LOG_UNINDEXED_TOKEN}]})
+    if project_id is not None:
+        query["project_id"] = project_id
+    elif tokens:
+        # The token index is project-prefixed - a point per project keeps it usable (and sorted)
+        query["project_id"] = {"$in": await db.log_chunks.distinct("project_id")}
+    if ref:
+        query["ref"] = ref
+    if stage:
+        query["stage"] = stage
+    
+    # Cursor: where the previous page stopped - chunk key, hits of that chunk already returned,
+    # hits of its job already returned
+    resume = None
+    if cursor:
+        try:
+            created_at, job_id, seq, skip, job_hits = cursor.rsplit('|', 4)
+            resume = (created_at, int(job_id), int(seq), int(skip), int(job_hits))
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        created_at, job_id, seq = resume[:3]
+        conditions.append({"$or": [
+            {"created_at": {"$lt": created_at}},
+            {"created_at": created_at, "job_id": {"$lt": job_id}},
+            {"created_at": created_at, "job_id": job_id, "seq": {"$gte": seq}}
+        ]})
+    if conditions:
+        query["$and"] = conditions
+    
+    hits = []
+    next_cursor = None
+    examined = 0
+    live_generations = {}  # job_id -> generation its processed log reads
+    current_job, job_hits = (resume[1], resume[4]) if resume else (None, 0)
+    # The text stays out of the scan - most candidates of a job past its hit limit are never read
+    candidates = db.log_chunks.find(query, {"_id": 0, "tokens": 0, "data": 0, "plain": 0}).sort(
+        [("created_at", -1), ("job_id", -1), ("seq", 1)]
+    )
+    async for chunk in candidates:
+        if chunk['job_id'] != current_job:
+            current_job, job_hits = chunk['job_id'], 0
+        if len(hits) >= page_size or examined >= LOG_SEARCH_MAX_CHUNKS:
+            next_cursor = f"{chunk['created_at']}|{chunk['job_id']}|{chunk['seq']}|0|{job_hits}"
+            break
+        examined += 1
+        
+        skip = 0
+        if resume and (chunk['created_at'], chunk['job_id'], chunk['seq']) == resume[:3]:
+            skip = resume[3]
+        room = LOG_SEARCH_HITS_PER_JOB - job_hits
+        if room <= 0:
+            continue
+        if chunk['job_id'] not in live_generations:
+            log = await db.processed_logs.find_one({"job_id": chunk['job_id']}, {"_id": 0, "generation": 1})
+            live_generations[chunk['job_id']] = log.get('generation', '') if log else None
+        if chunk.get('generation', '') != live_generations[chunk['job_id']]:
+            continue  # written by an ingest that is still running, failed or was replaced
+        text = await db.log_chunks.find_one(
+            {"job_id": chunk['job_id'], "generation": chunk.get('generation'), "seq": chunk['seq']},
+            {"_id": 0, "data": 1, "plain": 1}
+        )
+        if not text:
+            continue  # the log was stored again meanwhile
+        found = find_phrase_in_chunk({**chunk, **text}, phrase, room + skip)[skip:]
+        taken = found[:page_size - len(hits)]
+        job_hits += len(taken)
+        
+        for hit in taken:
+            hits.append({
+                "job_id": chunk['job_id'],
+                "job_name": chunk.get('job_name'),
+                "stage": chunk.get('stage'),
+                "pipeline_id": chunk['pipeline_id'],
+                "project_id": chunk.get('project_id'),
+                "ref": chunk.get('ref'),
+                "created_at": chunk.get('created_at'),
+                **hit
+            })
+        if len(taken) < len(found):
+            # The page filled up inside this chunk - the next one starts at its first hit not returned
+            next_cursor = f"{chunk['created_at']}|{chunk['job_id']}|{chunk['seq']}|{skip + len(taken)}|{job_hits}"
+            break
+    
+    return {
+        "query": q,
+        "indexed_tokens": tokens,
+        "page_size": page_size,
+        "has_more": next_cursor is not None,
+        "next_cursor": next_cursor,
+        "truncated": next_cursor is not None and len(hits) < page_size,  # page stopped after LOG_SEARCH_MAX_CHUNKS chunks
+        "examined_chunks": examined,
+        "hits": hits
+    }
+
+@api_router.get("/jobs/{job_id}/logs/live")
+async def stream_job_log_live(job_id: int):
+    """
+    Live tail of a running job's log as Server-Sent Events. The first event ("snapshot")
+    carries the most recent lines already seen; then "lines", "errors", "status", "reset"
+    and finally "end" (job finished) or "overflow" (viewer too slow) events follow.
+    All viewers of a job share one GitLab poller.
+    """
+    pipeline = await db.pipelines.find_one({"jobs.id": job_id}, {"_id": 0, "project_id": 1, "jobs": 1})
+    if not pipeline:
+        raise HTTPException(status_code=404, detail="Job not found")
+    job = next((j for j in pipeline.get('jobs', []) if j['id'] == job_id), {})
+    if job.get('status') not in LIVE_JOB_STATUSES and job_id not in live_tails:
+        raise HTTPException(status_code=409, detail=f"Job is {job.get('status')} - use /jobs/{job_id}/logs/lines")
+    
+    tail = get_live_tail(pipeline['project_id'], job_id)
+    queue, snapshot = tail.subscribe()
 
-@api_router.get("/stats", response_model=PipelineStats)
-async def get_stats(status: Optional[str] = Query(None)):
-    # Get enabled projects filter
-    enabled_projects_doc = await db.settings.find_one({"key": "enabled_projects"})
-    enabled_projects = enabled_projects_doc.get("value", []) if enabled_projects_doc else []
+    async def events():
+        try:
+            yield format_sse("snapshot", snapshot)
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(queue.get(), timeout=LIVE_TAIL_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if event == "close":
+                    break
+                yield format_sse(event, data)
+                if event in ("end", "overflow"):
+                    break
+        finally:
+            tail.unsubscribe(queue)
     
-    # Build base query
-    base_query = {}
-    if enabled_projects:
-        base_query["project_id"] = {"$in": enabled_projects}
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        background=BackgroundTask(tail.unsubscribe, queue)  # also runs if the stream never started
+    )
+
+@api_router.get("/jobs/{job_id}/logs/lines")
+async def get_job_log_lines(
+    job_id: int,
+    from_line: int = Query(1, ge=1),
+    count: int = Query(200, ge=1, le=5000),
+    error: Optional[int] = Query(None, ge=1, description="Center the window on the N-th error line (1-based)"),
+    plain: bool = Query(False, description="Lines without ANSI escapes and section markers")
+):
+    """
+    A window of a job's log, for viewers that page through huge traces instead of
+    loading them whole. Error lines inside the window are returned alongside.
+    """
+    log = await load_processed_log(job_id)
     
-    total = await db.pipelines.count_documents(base_query)
-    success = await db.pipelines.count_documents({**base_query, "status": "success"})
-    failed = await db.pipelines.count_documents({**base_query, "status": "failed"})
-    running = await db.pipelines.count_documents({**base_query, "status": "running"})
-    pending = await db.pipelines.count_documents({**base_query, "status": "pending"})
+    error_numbers = log_error_line_numbers(log)
+    response = {"job_id": job_id, "line_count": log.get('line_count'), "error_count": len(error_numbers)}
     
-    success_rate = (success / total * 100) if total > 0 else 0
+    if error is not None:
+        if error > len(error_numbers):
+            raise HTTPException(status_code=404, detail=f"Log has {len(error_numbers)} error line(s)")
+        error_line = error_numbers[error - 1]
+        from_line = max(error_line - count // 2, 1)
+        response["error"] = {"index": error, "line_number": error_line}
     
+    response.update(await read_log_window(log, from_line, count, plain))
+    return response
+
+@api_router.get("/jobs/{job_id}/logs/sections")
+async def get_job_log_sections(job_id: int):
+    """Outline of a job's log - its GitLab sections, without any log text"""
+    log = await load_processed_log(job_id)
     return {
-        "total": total,
-        "success": success,
-        "failed": failed,
-        "running": running,
-        "pending": pending,
-        "success_rate": round(success_rate, 2)
+        "job_id": job_id,
+        "line_count": log.get('line_count'),
+        "error_count": log.get('error_count'),
+        "section_count": log.get('section_count', 0),
+        "sections": log.get('sections', [])
+    }
+
+@api_router.get("/jobs/{job_id}/logs/sections/{index}")
+async def get_job_log_section(
+    job_id: int,
+    index: int,
+    offset: int = Query(0, ge=0, description="Lines of the section to skip"),
+    count: int = Query(1000, ge=1, le=5000),
+    plain: bool = Query(True, description="False returns the lines with ANSI escapes")
+):
+    """The lines of one section of a job's log (index from the outline), loaded when it is expanded"""
+    log = await load_processed_log(job_id)
+    sections = log.get('sections', [])
+    if not 0 <= index < len(sections):
+        raise HTTPException(status_code=404, detail=f"Log has {len(sections)} section(s)")
+    
+    section = sections[index]
+    from_line = section['start_line'] + offset
+    count = max(min(count, section['end_line'] - from_line + 1), 0)
+    window = await read_log_window(log, from_line, count, plain) if count else {
+        "from_line": from_line, "to_line": from_line - 1, "lines": [], "errors": []
     }
+    return {"job_id": job_id, "section": section, **window}
+
+@api_router.get("/stats", response_model=PipelineStats)
+async def get_stats(
+    status: Optional[str] = Query(None, description="Count only pipelines with this status"),
+    project_id: Optional[int] = Query(None),
+    window: Optional[Literal["24h", "7d", "30d"]] = Query(None, description="Only pipelines created in this window (hour granularity)"),
+    by_project: bool = Query(False, description="Add per-project counts")
+):
+    """
+    Pipeline counts from the materialized counters: a direct read of the per-project totals,
+    or one $group over the hourly buckets for a time window. The pipelines collection isn't touched.
+    status narrows every count (and the per-project breakdown) to that status - it used to be
+    accepted and ignored, so callers passing it now get filtered numbers.
+    """
+    project_ids = [project_id] if project_id is not None else await get_enabled_project_ids()
+    query = {"project_id": {"$in": project_ids}} if project_ids else {}
+    
+    if window:
+        query["hour"] = {"$gte": stats_hour((datetime.now(timezone.utc) - STATS_WINDOWS[window]).isoformat())}
+        rows = await db.pipeline_stats_hourly.aggregate([
+            {"$match": query},
+            {"$group": {
+                "_id": "$project_id",
+                "project_name": {"$last": "$project_name"},
+                "total": {"$sum": "$total"},
+                **{status_name: {"$sum": f"$statuses.{status_name}"} for status_name in PIPELINE_STATUSES}
+            }}
+        ]).to_list(None)
+        rows = [
+            {
+                "project_id": row['_id'],
+                "project_name": row.get('project_name'),
+                "total": row['total'],
+                "statuses": {status_name: row[status_name] for status_name in PIPELINE_STATUSES}
+            }
+            for row in rows
+        ]
+    else:
+        rows = await db.pipeline_stats.find(query, {"_id": 0}).to_list(None)
+    
+    statuses = {}
+    for row in rows:
+        for status_name, count in row.get('statuses', {}).items():
+            statuses[status_name] = statuses.get(status_name, 0) + count
+    response = summarize_pipeline_counts(sum(row.get('total', 0) for row in rows), statuses, status)
+    response["window"] = window
+    
+    if by_project:
+        response["projects"] = sorted(
+            (
+                {"project_id": row['project_id'], "project_name": row.get('project_name'),
+                 **summarize_pipeline_counts(row.get('total', 0), row.get('statuses', {}), status)}
+                for row in rows
+            ),
+            key=lambda project: project['total'],
+            reverse=True
+        )
+    return response
+
+@api_router.post("/stats/rebuild")
+async def rebuild_stats():
+    """Recount the pipeline counters from the pipelines collection (e.g. after editing pipelines by hand)"""
+    counted = await rebuild_pipeline_stats()
+    return {"message": "Pipeline stats rebuilt", "pipelines": counted}
 
 @api_router.get("/branches")
 async def get_branches():
@@ -1360,85 +4187,76 @@ async def browse_job_artifacts(job_id: int, path: Optional[str] = Query("")):
     
     project_id = pipeline.get('project_id')
     
-    # Check cache first - try to use pre-cached full file list
-    if not path:
-        # Root directory - check for pre-cached structure
-        cache_key = f"artifacts_browse_{job_id}_"
-        cached_result = await db.artifact_cache.find_one({"cache_key": cache_key})
-        
-        if cached_result:
-            # Check if cache is still valid (24 hours)
-            cache_time = datetime.fromisoformat(cached_result['cached_at'])
-            if datetime.now(timezone.utc) - cache_time < timedelta(hours=24):
-                logger.info(f"Returning pre-cached artifact structure for job {job_id}")
-                return {"files": cached_result['files'], "cached": True}
-    else:
-        # Subdirectory - try to build from full file list cache
-        root_cache_key = f"artifacts_browse_{job_id}_"
-        cached_result = await db.artifact_cache.find_one({"cache_key": root_cache_key})
-        
-        if cached_result and 'full_file_list' in cached_result:
-            # Check if cache is still valid (24 hours)
-            cache_time = datetime.fromisoformat(cached_result['cached_at'])
-            if datetime.now(timezone.utc) - cache_time < timedelta(hours=24):
-                logger.info(f"Building subdirectory structure from cached file list for job {job_id}, path: {path}")
-                # Build directory structure for this path from cached full file list
-                files = await build_directory_structure(cached_result['full_file_list'], path)
-                return {"files": files, "cached": True}
+    cache_key = f"artifacts_browse_{job_id}_{path}"
+    
+    # Check cache first - every directory of a pre-cached archive is its own tree node
+    head = await get_artifact_tree_head(job_id)
+    node = await get_artifact_tree_node(job_id, path, head) if head else None
+    if node is None and head and path:
+        # Unknown path in an indexed archive lists as empty
+        node = {"cached_at": head['cached_at'], "entries": [], "size": 0, "file_count": 0}
+    
+    if node:
+        # Check if cache is still valid (24 hours)
+        cache_time = datetime.fromisoformat(node['cached_at'])
+        if datetime.now(timezone.utc) - cache_time < timedelta(hours=24):
+            logger.info(f"Returning pre-cached artifact structure for job {job_id}, path: '{path}'")
+            return {"files": node['entries'], "size": node['size'], "file_count": node['file_count'],
+                    "stats": node.get('stats'), "cached": True}
     
     # Try GitLab's artifact browsing API first (if available)
     try:
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            # GitLab API endpoint for browsing artifacts
-            # This endpoint lists files without downloading the entire archive
-            response = await client.get(
-                f"{gitlab_service.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts",
-                headers=gitlab_service.headers,
-                params={"path": path} if path else {},
-                follow_redirects=False  # Don't follow redirects for listing
-            )
-            
-            # If we get a redirect, it means we need to download the archive (fallback)
-            if response.status_code in [301, 302, 303, 307, 308]:
-                logger.info(f"GitLab artifact browsing API not available, falling back to archive download")
-                raise httpx.HTTPStatusError("Redirect received", request=response.request, response=response)
-            
-            response.raise_for_status()
-            
-            # Parse the response - GitLab may return JSON with file list
-            try:
-                files_data = response.json()
-                if isinstance(files_data, list):
-                    # Convert GitLab format to our format
-                    files = []
-                    for item in files_data:
-                        file_info = {
-                            "name": item.get('name', item.get('path', '').split('/')[-1]),
-                            "type": "directory" if item.get('type') == 'tree' else "file",
-                            "path": item.get('path', '')
-                        }
-                        if file_info["type"] == "file":
-                            file_info["size"] = item.get('size', 0)
-                        files.append(file_info)
-                    
-                    # Cache the result
-                    await db.artifact_cache.update_one(
-                        {"cache_key": cache_key},
-                        {"$set": {
-                            "cache_key": cache_key,
-                            "job_id": job_id,
-                            "path": path,
-                            "files": files,
-                            "cached_at": datetime.now(timezone.utc).isoformat()
-                        }},
-                        upsert=True
-                    )
-                    
-                    logger.info(f"Successfully browsed artifacts using GitLab API for job {job_id}")
-                    return {"files": files, "cached": False}
-            except:
-                # Response is not JSON, fall back to archive download
-                pass
+        # GitLab API endpoint for browsing artifacts
+        # This endpoint lists files without downloading the entire archive
+        response = await gitlab_service.client.get(
+            f"{gitlab_service.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts",
+            headers=gitlab_service.headers,
+            params={"path": path} if path else {},
+            follow_redirects=False,  # Don't follow redirects for listing
+            timeout=TIMEOUT_PROFILES["api"]
+        )
+        
+        # If we get a redirect, it means we need to download the archive (fallback)
+        if response.status_code in [301, 302, 303, 307, 308]:
+            logger.info(f"GitLab artifact browsing API not available, falling back to archive download")
+            raise httpx.HTTPStatusError("Redirect received", request=response.request, response=response)
+        
+        response.raise_for_status()
+        
+        # Parse the response - GitLab may return JSON with file list
+        try:
+            files_data = response.json()
+            if isinstance(files_data, list):
+                # Convert GitLab format to our format
+                files = []
+                for item in files_data:
+                    file_info = {
+                        "name": item.get('name', item.get('path', '').split('/')[-1]),
+                        "type": "directory" if item.get('type') == 'tree' else "file",
+                        "path": item.get('path', '')
+                    }
+                    if file_info["type"] == "file":
+                        file_info["size"] = item.get('size', 0)
+                    files.append(file_info)
+                
+                # Cache the result
+                await db.artifact_cache.update_one(
+                    {"cache_key": cache_key},
+                    {"$set": {
+                        "cache_key": cache_key,
+                        "job_id": job_id,
+                        "path": path,
+                        "files": files,
+                        "cached_at": datetime.now(timezone.utc).isoformat()
+                    }},
+                    upsert=True
+                )
+                
+                logger.info(f"Successfully browsed artifacts using GitLab API for job {job_id}")
+                return {"files": files, "cached": False}
+        except:
+            # Response is not JSON, fall back to archive download
+            pass
     
     except Exception as e:
         logger.info(f"GitLab artifact browsing API not available or failed: {e}, falling back to archive download")
@@ -1459,103 +4277,32 @@ async def browse_job_artifacts(job_id: int, path: Optional[str] = Query("")):
             }
         
         # Download and parse the artifact with increased timeout
-        async with httpx.AsyncClient(timeout=httpx.Timeout(180.0, connect=60.0, read=180.0)) as client:
-            logger.info(f"Downloading artifacts for job {job_id}, size: {content_length} bytes")
-            
-            try:
-                response = await client.get(
-                    f"{gitlab_service.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts",
-                    headers=gitlab_service.headers,
-                    follow_redirects=True
-                )
-                response.raise_for_status()
-                
-                logger.info(f"Successfully downloaded {len(response.content)} bytes for job {job_id}")
-            except httpx.ReadError as e:
-                logger.error(f"Read error downloading artifacts for job {job_id}: {e}")
-                raise HTTPException(status_code=502, detail="Error reading artifact data from GitLab. The connection may have been interrupted.")
-            except httpx.RemoteProtocolError as e:
-                logger.error(f"Protocol error downloading artifacts for job {job_id}: {e}")
-                raise HTTPException(status_code=502, detail="GitLab server closed the connection unexpectedly. Try downloading the full archive instead.")
-            
-            # Parse the zip file to list contents
-            import zipfile
-            from io import BytesIO
-            
-            try:
-                zip_data = BytesIO(response.content)
-                with zipfile.ZipFile(zip_data, 'r') as zip_file:
-                    all_files = zip_file.namelist()
-                    
-                    # Filter files based on path
-                    if path:
-                        # Normalize path - ensure it ends with / for directory matching
-                        normalized_path = path.rstrip('/') + '/'
-                        filtered_files = [f for f in all_files if f.startswith(normalized_path)]
-                    else:
-                        filtered_files = all_files
-                    
-                    # Build directory structure
-                    files = []
-                    seen = set()
-                    
-                    for file_path in filtered_files:
-                        # Remove the base path if specified
-                        if path:
-                            relative_path = file_path[len(normalized_path):]
-                        else:
-                            relative_path = file_path
-                        
-                        if not relative_path:
-                            continue
-                        
-                        # Get the first component (file or directory)
-                        parts = relative_path.split('/')
-                        first_component = parts[0]
-                        
-                        if first_component in seen or not first_component:
-                            continue
-                        seen.add(first_component)
-                        
-                        # Determine if it's a file or directory
-                        full_path = f"{path}/{first_component}" if path else first_component
-                        is_directory = len(parts) > 1 or file_path.endswith('/')
-                        
-                        file_info = {
-                            "name": first_component,
-                            "type": "directory" if is_directory else "file",
-                            "path": full_path.rstrip('/')
-                        }
-                        
-                        # Add size for files
-                        if not is_directory:
-                            try:
-                                file_info["size"] = zip_file.getinfo(file_path).file_size
-                            except:
-                                file_info["size"] = 0
-                        
-                        files.append(file_info)
-                    
-                    # Sort: directories first, then files, alphabetically
-                    files.sort(key=lambda x: (x["type"] == "file", x["name"]))
-                    
-                    # Cache the result
-                    await db.artifact_cache.update_one(
-                        {"cache_key": cache_key},
-                        {"$set": {
-                            "cache_key": cache_key,
-                            "job_id": job_id,
-                            "path": path,
-                            "files": files,
-                            "cached_at": datetime.now(timezone.utc).isoformat()
-                        }},
-                        upsert=True
-                    )
-                    
-                    return {"files": files, "cached": False}
-            
-            except zipfile.BadZipFile:
-                raise HTTPException(status_code=400, detail="Artifacts file is not a valid ZIP archive")
+        logger.info(f"Downloading artifacts for job {job_id}, size: {content_length} bytes")
+        
+        try:
+            archive_path = await artifact_blob_cache.fetch(project_id, job_id, content_length)
+        except httpx.ReadError as e:
+            logger.error(f"Read error downloading artifacts for job {job_id}: {e}")
+            raise HTTPException(status_code=502, detail="Error reading artifact data from GitLab. The connection may have been interrupted.")
+        except httpx.RemoteProtocolError as e:
+            logger.error(f"Protocol error downloading artifacts for job {job_id}: {e}")
+            raise HTTPException(status_code=502, detail="GitLab server closed the connection unexpectedly. Try downloading the full archive instead.")
+        
+        # Parse the zip file to list contents
+        import zipfile
+        
+        try:
+            with open_cached_zip(archive_path) as zip_file:
+                entries = list_zip_entries(zip_file)
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Artifacts file is not a valid ZIP archive")
+        
+        # Index the whole tree so every other directory is served from the cache
+        nodes = await index_artifact_tree(job_id, entries)
+        
+        node = nodes.get(path.strip('/'), {"entries": [], "size": 0, "file_count": 0})
+        return {"files": node['entries'], "size": node['size'], "file_count": node['file_count'],
+                "stats": node.get('stats'), "cached": False}
     
     except httpx.HTTPStatusError as e:
         if e.response.status_code == 404:
@@ -1570,8 +4317,124 @@ async def browse_job_artifacts(job_id: int, path: Optional[str] = Query("")):
         logger.error(f"Error browsing artifacts for job {job_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error browsing artifacts: {str(e)}")
 
+def parse_byte_range(range_header: str, size: int) -> Optional[tuple]:
+    """Parse a single 'bytes=start-end' Range header into inclusive offsets, None if unsatisfiable"""
+    match = re.fullmatch(r'bytes=(\d*)-(\d*)', range_header.strip())
+    if not match or not any(match.groups()):
+        return None
+    first, last = match.groups()
+    if not first:
+        # Suffix range: the last N bytes
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start > end or start >= size:
+        return None
+    return start, end
+
+async def stream_artifact_archive(project_id: int, job_id: int, range_header: Optional[str]) -> StreamingResponse:
+    """
+    Stream a job's full archive to the client without buffering it in memory.
+    Served from the local blob cache if present, otherwise proxied chunk by chunk from GitLab.
+    Range requests are honoured either way so interrupted downloads can resume.
+    """
+    if DOWNLOAD_SEMAPHORE.locked():
+        raise HTTPException(
+            status_code=503,
+            detail="Too many artifact downloads in progress, please retry shortly",
+            headers={"Retry-After": "10"}
+        )
+    await DOWNLOAD_SEMAPHORE.acquire()
+    
+    resources = []  # Open file handle / upstream response to close when the download ends
+    released = False
+
+    async def finish():
+        # Runs from the body iterator and again as a background task, so a client that
+        # disconnects before the body starts still gives its slot back
+        nonlocal released
+        for resource in resources:
+            if isinstance(resource, httpx.Response):
+                await resource.aclose()
+            else:
+                resource.close()
+        if not released:
+            released = True
+            DOWNLOAD_SEMAPHORE.release()
+    
+    headers = {"Content-Disposition": f"attachment; filename=artifacts-job-{job_id}.zip", "Accept-Ranges": "bytes"}
+    try:
+        cached_path = artifact_blob_cache.get(job_id)
+        if cached_path:
+            size = cached_path.stat().st_size
+            start, end, status_code = 0, size - 1, 200
+            if range_header:
+                byte_range = parse_byte_range(range_header, size)
+                if not byte_range:
+                    raise HTTPException(status_code=416, detail="Requested range not satisfiable",
+                                        headers={"Content-Range": f"bytes */{size}"})
+                start, end = byte_range
+                status_code = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+            headers["Content-Length"] = str(end - start + 1)
+            
+            # The handle is opened now so a concurrent eviction can't pull the file away mid-response
+            archive = open(cached_path, 'rb')
+            resources.append(archive)
+            archive.seek(start)
+
+            async def iter_cached():
+                try:
+                    remaining = end - start + 1
+                    while remaining > 0:
+                        chunk = archive.read(min(1024 * 1024, remaining))
+                        if not chunk:
+                            break
+                        remaining -= len(chunk)
+                        yield chunk
+                finally:
+                    await finish()
+            
+            return StreamingResponse(iter_cached(), status_code=status_code, media_type="application/zip",
+                                     headers=headers, background=BackgroundTask(finish))
+        
+        upstream_headers = dict(gitlab_service.headers)
+        if range_header:
+            upstream_headers["Range"] = range_header
+        request = gitlab_service.client.build_request(
+            "GET",
+            f"{gitlab_service.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts",
+            headers=upstream_headers,
+            timeout=TIMEOUT_PROFILES["artifact_download"]
+        )
+        response = await gitlab_service.client.send(request, stream=True, follow_redirects=True)
+        resources.append(response)
+        if response.status_code >= 400:
+            if response.status_code == 416:
+                raise HTTPException(status_code=416, detail="Requested range not satisfiable")
+            response.raise_for_status()
+        
+        # Raw bytes are passed through untouched, so the upstream length/encoding headers stay valid
+        for name in ("Content-Length", "Content-Range", "Content-Encoding", "ETag", "Last-Modified"):
+            if name in response.headers:
+                headers[name] = response.headers[name]
+
+        async def iter_upstream():
+            try:
+                async for chunk in response.aiter_raw():
+                    yield chunk
+            finally:
+                await finish()
+        
+        return StreamingResponse(iter_upstream(), status_code=response.status_code, media_type="application/zip",
+                                 headers=headers, background=BackgroundTask(finish))
+    except BaseException:
+        await finish()
+        raise
+
 @api_router.get("/jobs/{job_id}/artifacts/download")
-async def download_job_artifact(job_id: int, path: Optional[str] = Query(None)):
+async def download_job_artifact(request: Request, job_id: int, path: Optional[str] = Query(None)):
     """Download a specific file from job artifacts or entire archive"""
     # Find the pipeline containing this job
     pipeline = await db.pipelines.find_one({"jobs.id": job_id}, {"_id": 0})
@@ -1579,59 +4442,71 @@ async def download_job_artifact(job_id: int, path: Optional[str] = Query(None)):
         raise HTTPException(status_code=404, detail="Job not found")
     
     project_id = pipeline.get('project_id')
+    job_data = next((j for j in pipeline.get('jobs', []) if j['id'] == job_id), {})
+    artifact_size = artifact_size_of(job_data)
     
     try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            # Download the artifacts archive
-            response = await client.get(
-                f"{gitlab_service.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts",
-                headers=gitlab_service.headers,
-                follow_redirects=True
-            )
-            response.raise_for_status()
+        if not path:
+            # Return entire archive as zip
+            return await stream_artifact_archive(project_id, job_id, request.headers.get('range'))
+        
+        # A single file that isn't cached locally is read straight out of the remote archive
+        if not artifact_blob_cache.contains(job_id, artifact_size):
+            try:
+                member = await open_remote_zip_member(project_id, job_id, artifact_size, path)
+            except FileNotFoundError:
+                raise HTTPException(status_code=404, detail=f"File '{path}' not found in artifacts")
             
-            if not path:
-                # Return entire archive as zip
+            if member:
+                entry, chunks = member
+                import mimetypes
+                content_type, _ = mimetypes.guess_type(path)
                 return StreamingResponse(
-                    io.BytesIO(response.content),
-                    media_type="application/zip",
-                    headers={"Content-Disposition": f"attachment; filename=artifacts-job-{job_id}.zip"}
+                    chunks,
+                    media_type=content_type or "application/octet-stream",
+                    headers={
+                        "Content-Disposition": f"attachment; filename={path.split('/')[-1]}",
+                        "Content-Length": str(entry['size'])
+                    }
                 )
-            
-            # Extract specific file from archive
-            import zipfile
-            from io import BytesIO
-            
-            try:
-                zip_data = BytesIO(response.content)
-                with zipfile.ZipFile(zip_data, 'r') as zip_file:
-                    # Try to find the file
-                    if path not in zip_file.namelist():
-                        raise HTTPException(status_code=404, detail=f"File '{path}' not found in artifacts")
-                    
-                    file_content = zip_file.read(path)
-                    
-                    # Determine content type based on file extension
-                    import mimetypes
-                    content_type, _ = mimetypes.guess_type(path)
-                    if not content_type:
-                        content_type = "application/octet-stream"
-                    
-                    filename = path.split('/')[-1]
-                    
-                    return StreamingResponse(
-                        io.BytesIO(file_content),
-                        media_type=content_type,
-                        headers={"Content-Disposition": f"attachment; filename={filename}"}
-                    )
-            
-            except zipfile.BadZipFile:
-                raise HTTPException(status_code=400, detail="Artifacts file is not a valid ZIP archive")
+        
+        # Get the artifacts archive (from the local disk cache when possible)
+        archive_path = await artifact_blob_cache.fetch(project_id, job_id, artifact_size)
+        
+        # Extract specific file from archive
+        import zipfile
+        
+        try:
+            with open_cached_zip(archive_path) as zip_file:
+                # Try to find the file
+                if path not in zip_file.namelist():
+                    raise HTTPException(status_code=404, detail=f"File '{path}' not found in artifacts")
+                
+                file_content = zip_file.read(path)
+                
+                # Determine content type based on file extension
+                import mimetypes
+                content_type, _ = mimetypes.guess_type(path)
+                if not content_type:
+                    content_type = "application/octet-stream"
+                
+                filename = path.split('/')[-1]
+                
+                return StreamingResponse(
+                    io.BytesIO(file_content),
+                    media_type=content_type,
+                    headers={"Content-Disposition": f"attachment; filename={filename}"}
+                )
+        
+        except zipfile.BadZipFile:
+            raise HTTPException(status_code=400, detail="Artifacts file is not a valid ZIP archive")
     
     except httpx.HTTPStatusError as e:
         if e.response.status_code == 404:
             raise HTTPException(status_code=404, detail="Artifacts not found for this job")
         raise HTTPException(status_code=e.response.status_code, detail=f"Error fetching artifacts: {e}")
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error downloading artifact for job {job_id}: {e}")
         raise HTTPException(status_code=500, detail=f"Error downloading artifact: {str(e)}")
@@ -1642,40 +4517,76 @@ async def trigger_sync():
     await sync_gitlab_data()
     return {"message": "Sync completed"}
 
+@api_router.get("/sync/state")
+async def get_sync_state():
+    """Get the per-project incremental sync watermarks"""
+    states = await db.sync_state.find({}, {"_id": 0}).to_list(1000)
+    return {"full_sync_interval_seconds": FULL_SYNC_INTERVAL, "projects": states}
+
+@api_router.delete("/sync/state")
+async def reset_sync_state(project_id: Optional[int] = Query(None)):
+    """Reset sync watermarks - the next cycle does a full-window reconcile"""
+    if project_id:
+        result = await db.sync_state.delete_many({"project_id": project_id})
+        return {"message": f"Reset sync state for project {project_id}", "deleted_count": result.deleted_count}
+    else:
+        result = await db.sync_state.delete_many({})
+        return {"message": "Reset all sync state", "deleted_count": result.deleted_count}
+
+async def forget_job_product(product: str, job_id: Optional[int] = None):
+    """Drop a product from job manifests so the next sync rebuilds it"""
+    query = {"job_id": job_id} if job_id else {}
+    await db.job_manifests.update_many(query, {"$unset": {f"products.{product}": ""}})
+
 @api_router.delete("/cache/artifacts")
 async def clear_artifact_cache(job_id: Optional[int] = Query(None)):
     """Clear artifact cache - optionally for a specific job"""
+    await forget_job_product('artifacts', job_id)
+    artifact_blob_cache.remove(job_id)
     if job_id:
-        result = await db.artifact_cache.delete_many({"job_id": job_id})
+        await db.artifact_trees.delete_many({"job_id": job_id})
+        await db.artifact_tree.delete_many({"job_id": job_id})
+        result= await db.artifact_cache.delete_many({"job_id": job_id})
         return {"message": f"Cleared cache for job {job_id}", "deleted_count": result.deleted_count}
     else:
-        result = await db.artifact_cache.delete_many({})
+        await db.artifact_trees.delete_many({})
+        await db.artifact_tree.delete_many({})
+        result= await db.artifact_cache.delete_many({})
         return {"message": "Cleared all artifact cache", "deleted_count": result.deleted_count}
 
 @api_router.delete("/cache/artifacts/expired")
 async def clear_expired_artifact_cache():
     """Clear expired artifact cache entries (older than 24 hours)"""
     expiry_time = (datetime.now(timezone.utc) - timedelta(hours=24)).isoformat()
+    await db.artifact_trees.delete_many({"cached_at": {"$lt": expiry_time}})
+    await db.artifact_tree.delete_many({"cached_at": {"$lt": expiry_time}})
     result = await db.artifact_cache.delete_many({"cached_at": {"$lt": expiry_time}})
     return {"message": "Cleared expired artifact cache", "deleted_count": result.deleted_count}
 
 @api_router.delete("/cache/logs")
 async def clear_log_cache(job_id: Optional[int] = Query(None)):
     """Clear log cache - optionally for a specific job"""
+    await forget_job_product('logs', job_id)
     if job_id:
+        await db.log_chunks.delete_many({"job_id": job_id})
         result = await db.processed_logs.delete_many({"job_id": job_id})
         return {"message": f"Cleared log cache for job {job_id}", "deleted_count": result.deleted_count}
     else:
+        await db.log_chunks.delete_many({})
         result = await db.processed_logs.delete_many({})
         return {"message": "Cleared all log cache", "deleted_count": result.deleted_count}
 
 @api_router.delete("/cache/tests")
 async def clear_test_cache(job_id: Optional[int] = Query(None)):
     """Clear test results cache - optionally for a specific job"""
+    await forget_job_product('tests', job_id)
     if job_id:
+        await db.pipeline_test_summaries.delete_many({"job_ids": job_id})
         result = await db.test_results.delete_many({"job_id": job_id})
         return {"message": f"Cleared test cache for job {job_id}", "deleted_count": result.deleted_count}
     else:
+        await db.pipeline_test_summaries.delete_many({})
+        await db.test_messages.delete_many({})  # shared between jobs, only dropped with everything else
         result = await db.test_results.delete_many({})
         return {"message": "Cleared all test cache", "deleted_count": result.deleted_count}
 
@@ -1685,14 +4596,32 @@ async def get_cache_stats():
     artifact_count = await db.artifact_cache.count_documents({})
     log_count = await db.processed_logs.count_documents({})
     test_count = await db.test_results.count_documents({})
+    manifest_count = await db.job_manifests.count_documents({})
+    tree_node_count = await db.artifact_tree.count_documents({})
+    summary_count = await db.pipeline_test_summaries.count_documents({})
+    test_case_count = await db.test_cases.estimated_document_count()
+    test_message_count = await db.test_messages.estimated_document_count()
+    log_chunk_count = await db.log_chunks.estimated_document_count()
     
     return {
         "artifacts": artifact_count,
         "logs": log_count,
         "tests": test_count,
-        "total": artifact_count + log_count + test_count
+        "total": artifact_count + log_count + test_count,
+        "job_manifests": manifest_count,
+        "artifact_tree_nodes": tree_node_count,
+        "pipeline_test_summaries": summary_count,
+        "test_cases": test_case_count,
+        "test_messages": test_message_count,
+        "log_chunks": log_chunk_count,
+        "artifact_blobs": artifact_blob_cache.get_stats()
     }
 
+@api_router.get("/http/pool-stats")
+async def get_http_pool_stats():
+    """Get connection pool statistics for the shared GitLab HTTP client"""
+    return gitlab_service.get_pool_stats()
+
 @api_router.get("/settings/enabled-projects")
 async def get_enabled_projects():
     """Get list of enabled project IDs"""
@@ -1702,13 +4631,44 @@ async def get_enabled_projects():
 @api_router.post("/settings/enabled-projects")
 async def update_enabled_projects(project_ids: List[int]):
     """Update list of enabled project IDs"""
+    global enabled_projects_cache
     await db.settings.update_one(
         {"key": "enabled_projects"},
         {"$set": {"value": project_ids}},
         upsert=True
     )
+    enabled_projects_cache = project_ids
     return {"message": "Enabled projects updated", "enabled_projects": project_ids}
 
+@api_router.get("/settings/log-rules")
+async def get_log_rules_setting(project_id: Optional[int] = Query(None)):
+    """Get the log analysis rules in effect for a project (or the global rules)"""
+    rules, source = await get_log_rules(project_id)
+    return {"project_id": project_id, "source": source, "rules": rules}
+
+@api_router.post("/settings/log-rules")
+async def update_log_rules(rules: List[LogRule], project_id: Optional[int] = Query(None)):
+    """Set the log analysis rules for a project, or the global rules without project_id"""
+    value = [rule.model_dump() for rule in rules]
+    try:
+        compile_log_rules(value)
+    except re.error as e:
+        raise HTTPException(status_code=400, detail=f"Invalid log rule pattern: {e}")
+    
+    await db.settings.update_one(
+        {"key": "log_rules", "project_id": project_id},
+        {"$set": {"value": value}},
+        upsert=True
+    )
+    # Already processed logs keep their analysis until the log cache is cleared
+    return {"message": "Log rules updated", "project_id": project_id, "rules": value}
+
+@api_router.delete("/settings/log-rules")
+async def reset_log_rules(project_id: Optional[int] = Query(None)):
+    """Remove a project's own log rules (falls back to the global rules, then the defaults)"""
+    result = await db.settings.delete_many({"key": "log_rules", "project_id": project_id})
+    return {"message": "Log rules reset", "project_id": project_id, "deleted_count": result.deleted_count}
+
 @api_router.get("/projects/{project_id}/ci-config")
 async def get_ci_config(project_id: int, ref: Optional[str] = Query(None)):
     """Get CI/CD configuration stage order from .gitlab-ci.yml"""
@@ -1721,8 +4681,40 @@ async def get_ci_config(project_id: int, ref: Optional[str] = Query(None)):
         return {"stages": ["build", "test", "deploy", "release", "cleanup"], "source": "default"}
 
 @api_router.get("/jobs/{job_id}/tests")
-async def get_job_tests(job_id: int):
-    """Get test results for a specific job from JUnit artifacts (with caching)"""
+async def get_job_tests(
+    job_id: int,
+    page: Optional[int] = Query(None, ge=1),
+    page_size: int = Query(100, ge=1, le=1000),
+    status: Optional[str] = Query(None),
+    classname: Optional[str] = Query(None, description="Classname prefix"),
+    team: Optional[str] = Query(None),
+    name: Optional[str] = Query(None, description="Case-insensitive substring of the test name"),
+    sort: str = Query("status")
+):
+    """
+    Get test results for a specific job from JUnit artifacts (with caching).
+    Without page/filter parameters the full report is returned; with any of them,
+    one page of matching tests plus the report's overall counts.
+    """
+    if page is None and not any([status, classname, team, name]):
+        return await load_job_test_results(job_id)
+    
+    counts_only = {"_id": 0, "test_results.tests": 0, "test_results.packed_tests": 0}
+    cached = await db.test_results.find_one({"job_id": job_id}, counts_only)
+    if not cached:
+        await load_job_test_results(job_id)
+        cached = await db.test_results.find_one({"job_id": job_id}, counts_only)
+    counts = (cached or {}).get('test_results', {"total": 0, "passed": 0, "failed": 0, "skipped": 0})
+    
+    if cached:
+        pipeline = await db.pipelines.find_one({"jobs.id": job_id}, {"_id": 0})
+        if pipeline:
+            await backfill_test_cases(pipeline, [job_id])
+    
+    return await page_test_cases([job_id], counts, page or 1, page_size, status, classname, team, name, sort)
+
+async def load_job_test_results(job_id: int) -> dict:
+    """Full test report of a job - from the cache, or fetched from its artifacts and cached"""
     # Check cache first
     cached_results = await db.test_results.find_one({"job_id": job_id})
     if cached_results:
@@ -1730,7 +4722,7 @@ async def get_job_tests(job_id: int):
         cache_time = datetime.fromisoformat(cached_results['cached_at'])
         if datetime.now(timezone.utc) - cache_time < timedelta(hours=24):
             logger.info(f"Returning cached test results for job {job_id}")
-            return cached_results['test_results']
+            return await expand_test_report(cached_results['test_results'])
     
     # Find the pipeline containing this job
     pipeline = await db.pipelines.find_one({"jobs.id": job_id}, {"_id": 0})
@@ -1740,21 +4732,17 @@ async def get_job_tests(job_id: int):
     # Get the project_id
     project_id = pipeline.get('project_id')
     
-    # Fetch JUnit test report
-    test_results = await gitlab_service.fetch_job_junit_report(project_id, job_id)
+    # Fetch JUnit test report (team detection runs on the same download)
+    try:
+        ingestion = await ingest_job_artifacts(project_id, job_id, pipeline.get('project_name', ''))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Could not read the artifacts of job {job_id}: {e}")
+    test_results = ingestion['test_results'] if ingestion else None
     
-    if test_results:
+    if test_results and test_results['total'] > 0:
         # Cache the results
-        await db.test_results.update_one(
-            {"job_id": job_id},
-            {"$set": {
-                "job_id": job_id,
-                "pipeline_id": pipeline['id'],
-                "test_results": test_results,
-                "cached_at": datetime.now(timezone.utc).isoformat()
-            }},
-            upsert=True
-        )
+        job = next(j for j in pipeline.get('jobs', []) if j['id'] == job_id)
+        await save_job_test_results(pipeline, job, test_results, ingestion['team'])
         return test_results
     else:
         return {
@@ -1766,157 +4754,230 @@ async def get_job_tests(job_id: int):
         }
 
 @api_router.get("/pipelines/{pipeline_id}/tests")
-async def get_pipeline_tests(pipeline_id: int):
-    """Get aggregated test results for entire pipeline, grouped by team when applicable"""
+async def get_pipeline_tests(
+    pipeline_id: int,
+    page: Optional[int] = Query(None, ge=1),
+    page_size: int = Query(100, ge=1, le=1000),
+    status: Optional[str] = Query(None),
+    classname: Optional[str] = Query(None, description="Classname prefix"),
+    team: Optional[str] = Query(None),
+    name: Optional[str] = Query(None, description="Case-insensitive substring of the test name"),
+    sort: str = Query("status")
+):
+    """
+    Get aggregated test results for entire pipeline, grouped by team when applicable.
+    Without page/filter parameters the full aggregate is returned; with any of them,
+    one page of matching tests plus the overall and per-team counts.
+    """
+    paginated = page is not None or any([status, classname, team, name])
+    
+    # Finished pipelines have their aggregate precomputed during sync
+    projection = {"_id": 0, "tests": 0, "packed_tests": 0} if paginated else {"_id": 0}
+    summary = await db.pipeline_test_summaries.find_one({"pipeline_id": pipeline_id}, projection)
+    if summary and not summary.get('missing_job_ids') and not paginated:
+        return expand_pipeline_test_summary(await expand_test_report(summary))
+    
     # Find the pipeline
     pipeline = await db.pipelines.find_one({"id": pipeline_id}, {"_id": 0})
     if not pipeline:
         raise HTTPException(status_code=404, detail="Pipeline not found")
     
-    project_id = pipeline.get('project_id')
-    project_name = pipeline.get('project_name', '').lower()
+    if not summary or summary.get('missing_job_ids'):
+        # Build from cached job results, fetching only the jobs that are missing
+        summary = await compute_pipeline_test_summary(pipeline, fetch_missing=True)
+        if not paginated:
+            return expand_pipeline_test_summary(summary)
     
-    # Determine which stages to look for tests based on project
-    test_stages = ['ci']
-    if 'kylo-systests' in project_name:
-        test_stages.extend(['system_tests', 'static_analysis'])
+    job_ids = summary.get('job_ids') or [job['id'] for job in pipeline_test_jobs(pipeline)]
+    await backfill_test_cases(pipeline, job_ids)
     
-    # Collect all jobs from test stages
-    test_jobs = [job for job in pipeline.get('jobs', []) if job.get('stage') in test_stages]
+    counts = {key: summary[key] for key in ("total", "passed", "failed", "skipped", "teams")}
+    return await page_test_cases(job_ids, counts, page or 1, page_size, status, classname, team, name, sort)
+
+@api_router.get("/tests/history")
+async def get_test_history(
+    project_id: int = Query(...),
+    name: str = Query(...),
+    classname: str = Query(""),
+    days: int = Query(30, ge=1, le=365),
+    limit: int = Query(500, ge=1, le=5000)
+):
+    """Pass/fail timeline of one test case, newest first, with its precomputed rollup"""
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    query = {"project_id": project_id, "classname": classname, "name": name, "created_at": {"$gte": since}}
+    runs = await db.test_cases.find(query, {"_id": 0}).sort("created_at", -1).to_list(limit)
     
-    if not test_jobs:
-        return {
-            "total": 0,
-            "passed": 0,
-            "failed": 0,
-            "skipped": 0,
-            "teams": {},
-            "tests": []
-        }
+    rollup = await db.test_flakiness.find_one(
+        {"project_id": project_id, "classname": classname, "name": name},
+        {"_id": 0}
+    )
+    if rollup:
+        rollup["flakiness_score"] = flakiness_score(rollup)
     
-    # Aggregate results
-    aggregated = {
-        "total": 0,
-        "passed": 0,
-        "failed": 0,
-        "skipped": 0,
-        "teams": {},  # team_name -> test results
-        "tests": []
+    return {
+        "project_id": project_id,
+        "classname": classname,
+        "name": name,
+        "days": days,
+        "summary": rollup,
+        "runs": runs
     }
+
+@api_router.get("/tests/flakiness")
+async def get_test_flakiness(
+    project_id: int = Query(...),
+    name: str = Query(...),
+    classname: str = Query(""),
+    limit: int = Query(50, ge=1, le=500)
+):
+    """Flakiness rollup of one test case plus the shas it both passed and failed on"""
+    rollup = await db.test_flakiness.find_one(
+        {"project_id": project_id, "classname": classname, "name": name},
+        {"_id": 0}
+    )
+    if not rollup:
+        raise HTTPException(status_code=404, detail="No history for this test")
+    rollup["flakiness_score"] = flakiness_score(rollup)
     
-    # Process each job
-    for job in test_jobs:
-        job_id = job['id']
-        
-        # Fetch test results for this job
-        try:
-            test_results = await gitlab_service.fetch_job_junit_report(project_id, job_id)
-            
-            if not test_results or test_results['total'] == 0:
-                continue
-            
-            # Try to detect team from job artifacts structure
-            team_name = await detect_team_from_artifacts(project_id, job_id, project_name)
-            
-            # Add job info to each test
-            for test in test_results.get('tests', []):
-                test['job_id'] = job_id
-                test['job_name'] = job['name']
-                test['team'] = team_name
-            
-            # Aggregate by team
-            if team_name not in aggregated['teams']:
-                aggregated['teams'][team_name] = {
-                    "total": 0,
-                    "passed": 0,
-                    "failed": 0,
-                    "skipped": 0,
-                    "tests": []
-                }
-            
-            aggregated['teams'][team_name]['total'] += test_results['total']
-            aggregated['teams'][team_name]['passed'] += test_results['passed']
-            aggregated['teams'][team_name]['failed'] += test_results['failed']
-            aggregated['teams'][team_name]['skipped'] += test_results['skipped']
-            aggregated['teams'][team_name]['tests'].extend(test_results.get('tests', []))
-            
-            # Overall aggregation
-            aggregated['total'] += test_results['total']
-            aggregated['passed'] += test_results['passed']
-            aggregated['failed'] += test_results['failed']
-            aggregated['skipped'] += test_results['skipped']
-            aggregated['tests'].extend(test_results.get('tests', []))
-            
-        except Exception as e:
-            logger.error(f"Error fetching tests for job {job_id}: {e}")
-            continue
+    flaky_shas = await db.test_sha_outcomes.find(
+        {"project_id": project_id, "classname": classname, "name": name, "passed": {"$gt": 0}, "failed": {"$gt": 0}},
+        {"_id": 0, "project_id": 0, "classname": 0, "name": 0}
+    ).sort("last_seen", -1).to_list(limit)
     
-    return aggregated
+    return {**rollup, "flaky_shas": flaky_shas}
 
-async def detect_team_from_artifacts(project_id: int, job_id: int, project_name: str):
-    """Detect team name from artifact structure"""
-    try:
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.get(
-                f"{gitlab_service.base_url}/api/v4/projects/{project_id}/jobs/{job_id}/artifacts",
-                headers=gitlab_service.headers,
-                follow_redirects=True
-            )
-            response.raise_for_status()
-            
-            import zipfile
-            from io import BytesIO
-            
-            zip_data = BytesIO(response.content)
-            with zipfile.ZipFile(zip_data, 'r') as zip_file:
-                file_list = zip_file.namelist()
-                
-                # Look for junit files
-                junit_files = [f for f in file_list if f.endswith('.xml') and 
-                              any(pattern in f.lower() for pattern in ['junit', 'test', 'report'])]
-                
-                if not junit_files:
-                    return 'default'
-                
-                # Check for team indicators
-                for junit_file in junit_files:
-                    parts = junit_file.split('/')
-                    
-                    # For zork: check if there's a team folder between build and junit
-                    # Pattern: build/<team_name>/junit_report.xml
-                    if 'zork' in project_name.lower():
-                        if 'build' in parts:
-                            build_idx = parts.index('build')
-                            # Check if there's a folder after build that's not 'junit'
-                            if build_idx + 1 < len(parts) and parts[build_idx + 1] not in ['junit', 'junit_report.xml']:
-                                potential_team = parts[build_idx + 1]
-                                # Single word team names
-                                if potential_team and not potential_team.endswith('.xml'):
-                                    return potential_team
-                    
-                    # For kylo-systests: check gotests/build structure
-                    # Pattern: gotests/build/<team_name>/junit_report.xml
-                    if 'kylo-systests' in project_name.lower():
-                        if 'gotests' in parts and 'build' in parts:
-                            build_idx = parts.index('build')
-                            if build_idx + 1 < len(parts) and parts[build_idx + 1] not in ['junit', 'junit_report.xml']:
-                                potential_team = parts[build_idx + 1]
-                                if potential_team and not potential_team.endswith('.xml'):
-                                    return potential_team
-                    
-                    # Check filename for team indicator
-                    filename = parts[-1]
-                    if '_' in filename:
-                        # Pattern: team_name_junit.xml
-                        name_parts = filename.replace('.xml', '').split('_')
-                        if len(name_parts) > 1 and name_parts[0] not in ['junit', 'test', 'report']:
-                            return name_parts[0]
-                
-                # Default team if no specific team detected
-                return 'default'
-                
-    except Exception as e:
-        logger.error(f"Error detecting team from artifacts for job {job_id}: {e}")
-        return 'default'
+@api_router.get("/projects/{project_id}/flaky-tests")
+async def get_top_flaky_tests(
+    project_id: int,
+    days: int = Query(30, ge=1, le=365),
+    limit: int = Query(20, ge=1, le=200)
+):
+    """Tests of a project that most often both passed and failed on the same sha"""
+    since = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
+    rollups = await db.test_flakiness.find(
+        {"project_id": project_id, "shas_flaky": {"$gt": 0}, "last_flaky_at": {"$gte": since}},
+        {"_id": 0}
+    ).sort([("shas_flaky", -1), ("last_flaky_at", -1)]).to_list(limit)
+    
+    for rollup in rollups:
+        rollup["flakiness_score"] = flakiness_score(rollup)
+    
+    return {"project_id": project_id, "days": days, "tests": rollups}
+
+@api_router.get("/projects/{project_id}/log-sections")
+async def get_log_section_timings(
+    project_id: int,
+    days: int = Query(7, ge=1, le=90),
+    job_name: Optional[str] = Query(None),
+    stage: Optional[str] = Query(None),
+    ref: Optional[str] = Query(None, description="Branch")
+):
+    """Duration statistics of log sections (per section name) across a project's jobs"""
+    query = {
+        "project_id": project_id,
+        "created_at": {"$gte": (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()}
+    }
+    if job_name:
+        query["job_name"] = job_name
+    if stage:
+        query["stage"] = stage
+    if ref:
+        query["ref"] = ref
+    timings = await db.log_section_timings.find(query, {"_id": 0, "name": 1, "duration": 1, "error_count": 1, "job_id": 1}).to_list(None)
+    
+    by_name = {}
+    for timing in timings:
+        by_name.setdefault(timing['name'], []).append(timing)
+    
+    sections = []
+    for name, runs in by_name.items():
+        durations = sorted(run['duration'] for run in runs)
+        sections.append({
+            "name": name,
+            "runs": len(runs),
+            "jobs": len({run['job_id'] for run in runs}),
+            "total_duration": sum(durations),
+            "avg_duration": round(sum(durations) / len(durations), 1),
+            "p50_duration": durations[(len(durations) - 1) // 2],
+            "p95_duration": durations[int(round(0.95 * (len(durations) - 1)))],
+            "max_duration": durations[-1],
+            "error_count": sum(run['error_count'] for run in runs)
+        })
+    sections.sort(key=lambda section: section['total_duration'], reverse=True)
+    
+    return {"project_id": project_id, "days": days, "sections": sections}
+
+@api_router.get("/projects/{project_id}/error-clusters")
+async def get_error_clusters(
+    project_id: int,
+    days: int = Query(7, ge=1, le=365),
+    limit: int = Query(20, ge=1, le=200)
+):
+    """Most widespread error fingerprints of a project in a time window, from the daily counters"""
+    since_day = (datetime.now(timezone.utc) - timedelta(days=days - 1)).date().isoformat()
+    daily = await db.error_fingerprint_days.find(
+        {"project_id": project_id, "day": {"$gte": since_day}},
+        {"_id": 0, "fingerprint": 1, "occurrences": 1, "jobs": 1}
+    ).to_list(None)
+    
+    window = {}
+    for counter in daily:
+        totals = window.setdefault(counter['fingerprint'], {"jobs": 0, "occurrences": 0})
+        totals["jobs"] += counter['jobs']
+        totals["occurrences"] += counter['occurrences']
+    top = sorted(
+        ((fingerprint, totals) for fingerprint, totals in window.items() if totals['jobs'] > 0),
+        key=lambda item: (item[1]['jobs'], item[1]['occurrences']),
+        reverse=True
+    )[:limit]
+    
+    details = await db.error_fingerprints.find(
+        {"project_id": project_id, "fingerprint": {"$in": [fingerprint for fingerprint, _ in top]}},
+        {"_id": 0}
+    ).to_list(None)
+    details_by_fingerprint = {doc['fingerprint']: doc for doc in details}
+    
+    clusters = []
+    for fingerprint, totals in top:
+        doc = details_by_fingerprint.get(fingerprint, {})
+        clusters.append({
+            "fingerprint": fingerprint,
+            "jobs": totals['jobs'],
+            "occurrences": totals['occurrences'],
+            "normalized": doc.get('normalized'),
+            "sample": doc.get('sample'),
+            "severity": doc.get('severity'),
+            "category": doc.get('category'),
+            "first_seen": doc.get('first_seen'),
+            "last_seen": doc.get('last_seen'),
+            "total_jobs": doc.get('jobs'),
+            "total_occurrences": doc.get('occurrences')
+        })
+    
+    return {"project_id": project_id, "days": days, "clusters": clusters}
+
+@api_router.get("/projects/{project_id}/error-clusters/{fingerprint}")
+async def get_error_cluster(
+    project_id: int,
+    fingerprint: str,
+    days: int = Query(30, ge=1, le=365),
+    limit: int = Query(20, ge=1, le=200)
+):
+    """One error fingerprint: totals, daily counts in the window and the most recent jobs that hit it"""
+    cluster = await db.error_fingerprints.find_one({"project_id": project_id, "fingerprint": fingerprint}, {"_id": 0})
+    if not cluster:
+        raise HTTPException(status_code=404, detail="Error fingerprint not found")
+    
+    since_day = (datetime.now(timezone.utc) - timedelta(days=days - 1)).date().isoformat()
+    daily = await db.error_fingerprint_days.find(
+        {"project_id": project_id, "fingerprint": fingerprint, "day": {"$gte": since_day}},
+        {"_id": 0, "day": 1, "occurrences": 1, "jobs": 1}
+    ).sort("day", 1).to_list(None)
+    jobs = await db.job_error_fingerprints.find(
+        {"project_id": project_id, "fingerprints.fingerprint": fingerprint},
+        {"_id": 0, "fingerprints": 0}
+    ).sort("created_at", -1).to_list(limit)
+    
+    return {**cluster, "days": days, "daily": daily, "recent_jobs": jobs}
 
 app.include_router(api_router)
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Benchmark the streaming JUnit parser against the previous ElementTree parser
+on synthetic reports of 10k, 100k and 1M test cases.
+
+Usage: python benchmark_junit.py [--sizes 10000,100000,1000000]
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+# server.py reads these at import time; the benchmark never talks to MongoDB
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark')
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR / 'backend'))
+
+import server  # noqa: E402
+
+
+def legacy_parse_junit_xml(xml_content: bytes) -> dict:
+    """The previous parser: whole document in memory, one find() per outcome"""
+    import xml.etree.ElementTree as ET
+    
+    test_results = {"total": 0, "passed": 0, "failed": 0, "skipped": 0, "tests": []}
+    root = ET.fromstring(xml_content)
+    testsuites = root.findall('.//testsuite') if root.tag != 'testsuite' else [root]
+    
+    for testsuite in testsuites:
+        for testcase in testsuite.findall('testcase'):
+            record = {
+                "name": testcase.get('name', 'Unknown'),
+                "classname": testcase.get('classname', ''),
+                "duration": float(testcase.get('time', 0))
+            }
+            failure = testcase.find('failure')
+            error = testcase.find('error')
+            skipped = testcase.find('skipped')
+            
+            if failure is not None or error is not None:
+                outcome = failure if failure is not None else error
+                record["status"] = 'failed'
+                record["failure_message"] = outcome.get('message', outcome.text or 'No message')
+                test_results['failed'] += 1
+            elif skipped is not None:
+                record["status"] = 'skipped'
+                record["skip_message"] = skipped.get('message', skipped.text or 'No message')
+                test_results['skipped'] += 1
+            else:
+                record["status"] = 'passed'
+                test_results['passed'] += 1
+            
+            test_results['tests'].append(record)
+            test_results['total'] += 1
+    
+    return test_results
+
+
+def write_report(path: Path, testcases: int, per_suite: int = 1000):
+    """Synthetic report: nested suites, ~2% failures, ~1% errors, ~5% skipped"""
+    with open(path, 'w') as f:
+        f.write('<?xml version="1.0" encoding="UTF-8"?>\n<testsuites>\n')
+        for suite_start in range(0, testcases, per_suite):
+            f.write(f'  <testsuite name="suite_{suite_start // per_suite}">\n')
+            for i in range(suite_start, min(suite_start + per_suite, testcases)):
+                f.write(f'    <testcase classname="pkg.module_{i % 97}.TestClass" name="test_case_{i}" time="0.{i % 1000:03d}">')
+                if i % 50 == 0:
+                    f.write(f'<failure message="assertion failed in {i}">Traceback line {i}\nAssertionError</failure>')
+                elif i % 100 == 1:
+                    f.write(f'<error message="error in {i}">RuntimeError</error>')
+                elif i % 20 == 2:
+                    f.write('<skipped message="not supported"/>')
+                f.write('<system-out>some captured output for this test case</system-out></testcase>\n')
+            f.write('  </testsuite>\n')
+        f.write('</testsuites>\n')
+
+
+def run_parser(name: str, path: str) -> dict:
+    """Runs in a fresh worker process so peak RSS belongs to this parser alone"""
+    baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter()
+    if name == 'legacy':
+        with open(path, 'rb') as f:
+            results = legacy_parse_junit_xml(f.read())
+    else:
+        with open(path, 'rb') as f:
+            results = server.parse_junit_stream(f)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return {
+        "seconds": elapsed,
+        "peak_mb": (peak - baseline) / 1024,  # ru_maxrss is in KB on Linux
+        "counts": (results['total'], results['passed'], results['failed'], results['skipped'])
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='comma separated test case counts')
+    args = parser.parse_args()
+    
+    print(f"{'testcases':>10} {'report':>9} {'parser':>10} {'seconds':>8} {'peak MB':>8}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in [int(s) for s in args.sizes.split(',')]:
+            path = Path(tmp) / f'junit_{size}.xml'
+            write_report(path, size)
+            report_mb = path.stat().st_size / (1024 * 1024)
+            
+            counts = set()
+            for name in ('legacy', 'streaming'):
+                with ProcessPoolExecutor(max_workers=1) as pool:
+                    result = pool.submit(run_parser, name, str(path)).result()
+                counts.add(result['counts'])
+                print(f"{size:>10} {report_mb:>7.1f}MB {name:>10} {result['seconds']:>8.2f} {result['peak_mb']:>8.1f}")
+            
+            if len(counts) != 1:
+                print(f"  !! parsers disagree: {counts}")
+            path.unlink()
+
+
+if __name__ == '__main__':
+    main()
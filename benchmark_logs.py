@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Benchmark the combined-regex log analysis engine against the previous per-line matcher
+on a synthetic job trace (100 MB by default), reporting lines per second.
+
+Usage: python benchmark_logs.py [--size-mb 100] [--block-kb 1024] [--skip-legacy]
+"""
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+# server.py reads these at import time; the benchmark never talks to MongoDB
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark')
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR / 'backend'))
+
+import server  # noqa: E402
+
+
+def legacy_process_logs(log_text: str) -> list:
+    """The previous matcher: eight re.search calls per line, then another uppercase pass"""
+    error_lines = []
+    error_patterns = [r'ERROR', r'FAILED', r'Exception', r'Traceback', r'FATAL', r'\[ERR\]', r'error:', r'failed']
+    for idx, line in enumerate(log_text.split('\n')):
+        for pattern in error_patterns:
+            if re.search(pattern, line, re.IGNORECASE):
+                error_lines.append({
+                    "line_number": idx + 1,
+                    "content": line,
+                    "type": "error" if "ERROR" in line.upper() or "FAILED" in line.upper() else "warning"
+                })
+                break
+    return error_lines
+
+
+def synthetic_trace(size_mb: int) -> str:
+    """Build-log-like text: mostly compiler/test output, about one line in 500 matching a rule"""
+    rng = random.Random(7)
+    normal = [
+        "[{t}] Compiling module pkg/service/handler_{n}.go",
+        "[{t}] ok  \tgithub.com/example/project/pkg/module{n}\t{d}s",
+        "[{t}] Downloading dependency example.org/lib/v{n} (1.{n}.0)",
+        "[{t}] === RUN   TestHandler_{n}/case_{n}",
+        "[{t}] --- PASS: TestHandler_{n} ({d}s)",
+        "[{t}] Step {n}/120 : RUN make build TARGET=linux-amd64",
+    ]
+    matching = [
+        "[{t}] ERROR: connection refused while contacting registry (attempt {n})",
+        "[{t}] --- FAILED: TestHandler_{n} ({d}s)",
+        "[{t}] panic: runtime Exception in goroutine {n}",
+        "[{t}] Traceback (most recent call last):",
+        "[{t}] [ERR] cache miss for key build-{n}",
+    ]
+    lines, size, target = [], 0, size_mb * 1024 * 1024
+    while size < target:
+        template = rng.choice(matching) if rng.random() < 0.002 else rng.choice(normal)
+        line = template.format(t=f"{rng.randrange(86400):05d}", n=rng.randrange(1000), d=f"{rng.random() * 5:.3f}")
+        lines.append(line)
+        size += len(line) + 1
+    return '\n'.join(lines) + '\n'
+
+
+def report(label: str, seconds: float, lines: int, matches: int):
+    print(f"{label:<28} {seconds:8.2f}s  {lines / seconds:>12,.0f} lines/s  ({matches} matches)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, default=100)
+    parser.add_argument('--block-kb', type=int, default=1024, help="Block size for the incremental scan")
+    parser.add_argument('--skip-legacy', action='store_true', help="Don't time the previous matcher")
+    args = parser.parse_args()
+    
+    trace = synthetic_trace(args.size_mb)
+    line_count = trace.count('\n') + 1
+    print(f"Synthetic trace: {len(trace) / 1024 / 1024:.0f} MB, {line_count:,} lines\n")
+    
+    started = time.perf_counter()
+    entries, _ = server.scan_log_block(trace, server.new_log_scan_state(), server.DEFAULT_LOG_RULES, final=True)
+    report("combined engine", time.perf_counter() - started, line_count, len(entries))
+    
+    block_size = args.block_kb * 1024
+    started = time.perf_counter()
+    state, blockwise = server.new_log_scan_state(), []
+    for offset in range(0, len(trace), block_size):
+        found, state = server.scan_log_block(trace[offset:offset + block_size], state, server.DEFAULT_LOG_RULES)
+        blockwise.extend(found)
+    found, state = server.scan_log_block("", state, server.DEFAULT_LOG_RULES, final=True)
+    blockwise.extend(found)
+    report(f"combined, {args.block_kb} KB blocks", time.perf_counter() - started, line_count, len(blockwise))
+    assert blockwise == entries, "block-wise scan differs from the one-shot scan"
+    
+    if not args.skip_legacy:
+        started = time.perf_counter()
+        legacy = legacy_process_logs(trace)
+        report("previous per-line matcher", time.perf_counter() - started, line_count, len(legacy))
+        assert [(e['line_number'], e['type']) for e in legacy] == [(e['line_number'], e['type']) for e in entries], \
+            "default rules classify lines differently from the previous matcher"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+Compare the stored size of parsed JUnit reports in the previous format (one dict per test
+inside the test_results document) and the compact format (string tables, status codes,
+packed durations, messages deduplicated into test_messages).
+
+Pass JUnit XML files and/or job artifact archives (.zip); every JUnit report found in an
+archive is merged the same way the sync does. Without arguments a synthetic report is used.
+
+Usage: python compare_test_storage.py [report.xml | artifacts.zip ...] [--synthetic 100000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import zipfile
+from pathlib import Path
+
+# server.py reads these at import time; the comparison never talks to MongoDB
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'benchmark')
+
+ROOT_DIR = Path(__file__).parent
+sys.path.insert(0, str(ROOT_DIR / 'backend'))
+
+import bson  # noqa: E402
+import server  # noqa: E402
+
+BSON_DOCUMENT_LIMIT = 16 * 1024 * 1024
+
+
+def load_report(path: Path) -> dict:
+    """Parse a JUnit XML file, or merge every JUnit report inside an artifact archive"""
+    if zipfile.is_zipfile(path):
+        with zipfile.ZipFile(path) as zip_file:
+            return server.extract_junit_results(zip_file, zip_file.namelist(), 0)
+    with open(path, 'rb') as f:
+        return server.parse_junit_stream(f)
+
+
+def synthetic_report(cases: int) -> dict:
+    """Report shaped like our system-test suites: few classnames, recurring failure messages"""
+    rng = random.Random(42)
+    classnames = [f"com.example.systests.module{m}.Suite{s}" for m in range(40) for s in range(25)]
+    failures = [f"AssertionError: expected status 200 but got {code}\n  at Client.request(client.go:{line})"
+                for code in (404, 500, 502, 503) for line in range(100, 120)]
+    tests = []
+    for i in range(cases):
+        status = rng.choices(("passed", "failed", "skipped"), weights=(90, 6, 4))[0]
+        test = {"name": f"test_case_{i}_{rng.randrange(10**6)}", "classname": rng.choice(classnames),
+                "status": status, "duration": round(rng.expovariate(1 / 2.5), 3)}
+        if status == "failed":
+            test["failure_message"] = rng.choice(failures)
+        elif status == "skipped":
+            test["skip_message"] = "Skipped: requires hardware"
+        tests.append(test)
+    report = {key: sum(1 for t in tests if t['status'] == key) for key in ("passed", "failed", "skipped")}
+    report.update(total=len(tests), tests=tests)
+    return report
+
+
+def compare(label: str, report: dict):
+    legacy = len(bson.encode({"job_id": 0, "test_results": report}))
+    
+    started = time.perf_counter()
+    packed, messages = server.pack_tests(report['tests'])
+    pack_time = time.perf_counter() - started
+    
+    compact_report = {key: value for key, value in report.items() if key != 'tests'}
+    compact_report["packed_tests"] = packed
+    compact = len(bson.encode({"job_id": 0, "test_results": compact_report}))
+    message_bytes = sum(len(bson.encode({"hash": h, "message": m})) for h, m in messages.items())
+    
+    started = time.perf_counter()
+    assert server.unpack_tests(packed, messages) == report['tests']
+    unpack_time = time.perf_counter() - started
+
+    def mb(size):
+        flag = "  (over the 16 MB limit)" if size > BSON_DOCUMENT_LIMIT else ""
+        return f"{size / 1024 / 1024:8.2f} MB{flag}"
+    
+    print(f"{label}: {report['total']} tests, {len(messages)} distinct messages")
+    print(f"  previous format      {mb(legacy)}")
+    print(f"  compact document     {mb(compact)}")
+    print(f"  + test_messages      {mb(message_bytes)}")
+    print(f"  ratio                {legacy / max(compact + message_bytes, 1):8.1f}x smaller")
+    print(f"  pack / unpack        {pack_time:8.3f}s / {unpack_time:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('reports', nargs='*', type=Path, help="JUnit XML files or artifact archives")
+    parser.add_argument('--synthetic', type=int, default=100000, help="Test cases in the synthetic report")
+    args = parser.parse_args()
+    
+    if args.reports:
+        for path in args.reports:
+            compare(str(path), load_report(path))
+    else:
+        compare(f"synthetic ({args.synthetic} cases)", synthetic_report(args.synthetic))
+
+
+if __name__ == "__main__":
+    main()
@@ -554,7 +554,7 @@ const PipelineDetail = () => {
               {logs[selectedJob.id]?.error_lines?.length > 0 && (
                 <div className="mt-4 p-4 bg-destructive/10 border border-destructive/30 rounded-md">
                   <h4 className="text-sm font-heading font-medium text-error mb-2">
-                    {logs[selectedJob.id].error_lines.length} Error(s) Found
+                    {logs[selectedJob.id].error_count ?? logs[selectedJob.id].error_lines.length} Error(s) Found
                   </h4>
                   <div className="space-y-2 text-xs">
                     {logs[selectedJob.id].error_lines.slice(0, 5).map((error, idx) => (